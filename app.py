@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, make_response, Response, stream_with_context
 import os
 import threading
 import shutil
@@ -15,9 +15,6 @@ import platform
 import io
 import traceback
 import uuid
-from pdf2image import convert_from_path
-from natsort import natsorted, ns
-from pypinyin import lazy_pinyin
 import locale
 from geopy.geocoders import Nominatim
 import re
@@ -28,12 +25,46 @@ import zipfile
 import glob
 from exif_mapping import exif_field_map
 from optimize_exif_parsing import extended_value_mappings
+from toolchain import ToolchainRegistry
+from codec_backends import (
+    build_backends, resolve_backend_name, plan_batches, mogrify_output_matches,
+    CodecResult, FAILED, COMPRESSIBLE_FORMATS, FALLBACK_BACKEND,
+    DEFAULT_BATCH_MAX_FILES, DEFAULT_BATCH_MAX_BYTES,
+    compress_with_fallback, convert_with_fallback, compress_search_with_fallback
+)
+from process_engine import (
+    ProcessEngine, compress_file, compress_file_search, convert_file, convert_pdf, merge_images_to_pdf
+)
+from pdf_raster import page_count as get_pdf_page_count, split_page_ranges
+from quality_search import MODE_FIXED, MODE_TARGET_SIZE, MODE_PERCEPTUAL, SEARCH_MODES, DEFAULT_MIN_PSNR
+from scheduler import SystemResources, AdaptiveScheduler
+from compress_ledger import CompressLedger
+from file_walker import walk as walk_tree, walk_records, FileRecord, is_within as is_within_base
+from metadata_index import MetadataIndex
+from fs_watcher import InotifyWatcher
+from sort_keys import SortKeyService
+from listing_cache import ListingCache, SORT_FIELDS, MAX_PAGE_SIZE, parse_extensions, decode_cursor
+from name_index import NameIndex, required_trigrams
+from task_results import ResultChunks
+from http_cache import (
+    file_etag, not_modified, send_cached_file,
+    PREVIEW_CACHE_CONTROL, DOWNLOAD_CACHE_CONTROL, UPLOAD_RESULT_CACHE_CONTROL
+)
+from werkzeug.exceptions import HTTPException
+from thumbnail_cache import (
+    ThumbnailCache, VARIANTS as THUMBNAIL_VARIANTS, DEFAULT_VARIANT as DEFAULT_THUMBNAIL_VARIANT,
+    CACHE_VERSION as THUMBNAIL_CACHE_VERSION, PageOutOfRange, page_count
+)
+from thumbnail_prefetch import ThumbnailPrefetcher
 import pikepdf
 
 # 创建log文件夹（如果不存在）
 log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log')
 os.makedirs(log_dir, exist_ok=True)
 
+# 缓存文件夹（工具链信息等）
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
 # 创建RotatingFileHandler，设置最大文件大小为10M，最大保留5份日志
 file_path = os.path.join(log_dir, 'app.log')
 file_handler = RotatingFileHandler(
@@ -121,11 +152,49 @@ try:
         exec(f.read(), config)
         BASE_DIR = config.get('BASE_DIR', '/data')  # 加载BASE_DIR配置，默认值为'/data'
         DEBUG = config.get('DEBUG', False)  # 加载DEBUG配置，默认值为False
+        CODEC_BACKEND_CONFIG = config.get('CODEC_BACKENDS', {})  # 按格式指定编解码后端，默认值为空（使用内置映射）
+        IMAGEMAGICK_BATCH = config.get('IMAGEMAGICK_BATCH', True)  # 是否合并ImageMagick调用为批处理，默认值为True
+        IMAGEMAGICK_BATCH_MAX_FILES = config.get('IMAGEMAGICK_BATCH_MAX_FILES', DEFAULT_BATCH_MAX_FILES)  # 每批最多文件数
+        IMAGEMAGICK_BATCH_MAX_BYTES = config.get('IMAGEMAGICK_BATCH_MAX_BYTES', DEFAULT_BATCH_MAX_BYTES)  # 每批最大总字节数
+        EXECUTION_ENGINE = config.get('EXECUTION_ENGINE', 'process')  # 进程内编码的执行引擎：process（进程池）或thread（线程），默认值为process
+        PROCESS_POOL_WORKERS = config.get('PROCESS_POOL_WORKERS', 0)  # 进程池工作进程数，0表示CPU核心数减1
+        COMPRESS_LEDGER = config.get('COMPRESS_LEDGER', True)  # 是否跳过已压缩且未变化的文件，默认值为True
+        PDF_PAGES_PER_TASK = config.get('PDF_PAGES_PER_TASK', 8)  # PDF按页码区间并行渲染时每个区间的页数，默认值为8
+        WALK_WORKERS = config.get('WALK_WORKERS', 8)  # 遍历目录树时同时扫描的目录数，默认值为8
+        METADATA_INDEX = config.get('METADATA_INDEX', True)  # 是否使用BASE_DIR元数据索引，默认值为True
+        METADATA_INDEX_REFRESH_INTERVAL = config.get('METADATA_INDEX_REFRESH_INTERVAL', 600)  # 后台增量刷新索引的间隔（秒），0表示只在启动时刷新
+        METADATA_INDEX_WATCH = config.get('METADATA_INDEX_WATCH', True)  # 是否使用inotify实时更新索引，默认值为True
+        LISTING_CACHE_SIZE = config.get('LISTING_CACHE_SIZE', 256)  # 缓存的目录列表数量，默认值为256
+        SORT_KEY_CACHE_SIZE = config.get('SORT_KEY_CACHE_SIZE', 200000)  # 内存中缓存的文件名排序键数量，默认值为200000
+        NAME_INDEX = config.get('NAME_INDEX', True)  # 是否使用文件名三元组索引加速搜索，默认值为True
+        NAME_INDEX_MAX_AGE = config.get('NAME_INDEX_MAX_AGE', 600)  # 没有元数据索引时遍历构建的文件名索引的有效期（秒），默认值为600
+        THUMBNAIL_CACHE_SIZE_MB = config.get('THUMBNAIL_CACHE_SIZE_MB', 512)  # 预览缩略图磁盘缓存的大小上限（MB），默认值为512
+        THUMBNAIL_PREFETCH_WORKERS = config.get('THUMBNAIL_PREFETCH_WORKERS', 2)  # 打开文件夹后预取悬停预览缩略图的线程数，0表示不预取
+        THUMBNAIL_PREFETCH_QUEUE = config.get('THUMBNAIL_PREFETCH_QUEUE', 500)  # 缩略图预取队列的长度上限，默认值为500
     logger.info(f"配置加载成功，BASE_DIR: {BASE_DIR}, DEBUG: {DEBUG}")
 except Exception as e:
     logger.error(f"配置加载失败: {e}")
     BASE_DIR = '/data'  # 默认值
     DEBUG = False  # 默认不启用调试模式
+    CODEC_BACKEND_CONFIG = {}  # 使用内置的编解码后端映射
+    IMAGEMAGICK_BATCH = True  # 默认合并ImageMagick调用为批处理
+    IMAGEMAGICK_BATCH_MAX_FILES = DEFAULT_BATCH_MAX_FILES
+    IMAGEMAGICK_BATCH_MAX_BYTES = DEFAULT_BATCH_MAX_BYTES
+    EXECUTION_ENGINE = 'process'  # 默认使用进程池执行进程内编码
+    PROCESS_POOL_WORKERS = 0  # 默认使用CPU核心数减1
+    COMPRESS_LEDGER = True  # 默认跳过已压缩且未变化的文件
+    PDF_PAGES_PER_TASK = 8  # 默认每个区间8页
+    WALK_WORKERS = 8  # 默认同时扫描8个目录
+    METADATA_INDEX = True  # 默认使用元数据索引
+    METADATA_INDEX_REFRESH_INTERVAL = 600  # 默认每10分钟增量刷新一次索引
+    METADATA_INDEX_WATCH = True  # 默认使用inotify实时更新索引
+    LISTING_CACHE_SIZE = 256  # 默认缓存256个目录列表
+    SORT_KEY_CACHE_SIZE = 200000  # 默认缓存200000个文件名排序键
+    NAME_INDEX = True  # 默认使用文件名三元组索引
+    NAME_INDEX_MAX_AGE = 600  # 默认遍历构建的文件名索引10分钟后重新构建
+    THUMBNAIL_CACHE_SIZE_MB = 512  # 默认缩略图缓存最多占用512MB
+    THUMBNAIL_PREFETCH_WORKERS = 2  # 默认使用2个线程预取缩略图
+    THUMBNAIL_PREFETCH_QUEUE = 500  # 默认预取队列最多500个文件
 
 # 支持的图片格式
 SUPPORTED_FORMATS = {
@@ -141,18 +210,6 @@ SUPPORTED_FORMATS = {
     'pdf': 'PDF'  # 添加PDF格式支持
 }
 
-# 检查ImageMagick是否可用
-def check_imagemagick():
-    try:
-        cmd = ['magick', '--version'] if platform.system() == 'Windows' else ['convert', '--version']
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-        logger.info(f"ImageMagick版本: {result.stdout.split()[2]}")
-        return True
-    except Exception as e:
-        logger.warning(f"ImageMagick不可用: {e}")
-        logger.warning("程序将继续运行，但图片处理功能将不可用")
-        return False
-
 # 根据GPS坐标查询地址的API端点
 @app.route('/get_address_from_coords', methods=['POST'])
 def get_address_from_coords():
@@ -181,46 +238,68 @@ def get_address_from_coords():
             logger.error(f"查询地址失败: {e}", exc_info=True)
             return jsonify({'error': f'查询地址失败: {str(e)}'}), 500
 
-# 检查jpegoptim是否可用
-def check_jpegoptim():
-    try:
-        result = subprocess.run(['jpegoptim', '--version'], capture_output=True, text=True, timeout=5)
-        version = result.stdout.strip().split()[1]
-        logger.info(f"jpegoptim版本: {version}")
-        return True
-    except Exception as e:
-        logger.info(f"jpegoptim不可用: {e}")
-        return False
-
-# 检查pngquant是否可用
-def check_pngquant():
-    try:
-        result = subprocess.run(['pngquant', '--version'], capture_output=True, text=True, timeout=5)
-        version = result.stdout.strip().split()[0]
-        logger.info(f"pngquant版本: {version}")
-        return True
-    except Exception as e:
-        logger.info(f"pngquant不可用: {e}")
-        return False
-
-# 检查cwebp是否可用
-def check_cwebp():
-    try:
-        result = subprocess.run(['cwebp', '-version'], capture_output=True, text=True, timeout=5)
-        version = result.stdout.strip().split()[0]
-        logger.info(f"cwebp版本: {version}")
-        return True
-    except Exception as e:
-        logger.info(f"cwebp不可用: {e}")
-        return False
+# 加载工具链能力注册表（启动时解析一次，按可执行文件mtime缓存到磁盘）
+TOOLCHAIN = ToolchainRegistry(os.path.join(cache_dir, 'toolchain.json'))
+TOOLCHAIN.load()
 
 # 检查ImageMagick是否可用
-IMAGEMAGICK_AVAILABLE = check_imagemagick()
+IMAGEMAGICK_AVAILABLE = TOOLCHAIN.imagemagick_available
+if IMAGEMAGICK_AVAILABLE:
+    logger.info(f"ImageMagick版本: {TOOLCHAIN.data['imagemagick']['version']}, 委托库: {TOOLCHAIN.data['delegates']}")
+else:
+    logger.warning("ImageMagick不可用，程序将继续运行，但图片处理功能将不可用")
 
 # 检查专门压缩工具是否可用
-JPEGOPTIM_AVAILABLE = check_jpegoptim()
-PNGQUANT_AVAILABLE = check_pngquant()
-CWEBP_AVAILABLE = check_cwebp()
+for tool_name in ('jpegoptim', 'pngquant', 'cwebp'):
+    if TOOLCHAIN.available(tool_name):
+        logger.info(f"{tool_name}版本: {TOOLCHAIN.version(tool_name)}")
+    else:
+        logger.info(f"{tool_name}不可用")
+
+# 初始化编解码后端（pillow进程内编码，subprocess调用外部工具）
+CODEC_BACKENDS = build_backends(TOOLCHAIN)
+logger.info(f"编解码后端: {list(CODEC_BACKENDS.keys())}, 配置: {CODEC_BACKEND_CONFIG}")
+
+# 读取容器内可用的CPU和内存（考虑cgroup配额），初始化全局并发调度器
+RESOURCES = SystemResources()
+SCHEDULER = AdaptiveScheduler(RESOURCES)
+logger.info(f"可用资源: {RESOURCES.to_dict()}, 并发上限: {SCHEDULER.max_limits}")
+
+# 初始化进程池执行引擎（第一次使用时才创建工作进程）
+PROCESS_ENGINE = ProcessEngine(
+    PROCESS_POOL_WORKERS or max(1, RESOURCES.cpu_count - 1),
+    os.path.join(cache_dir, 'toolchain.json'),
+    CODEC_BACKENDS
+)
+logger.info(f"执行引擎: {EXECUTION_ENGINE}, 进程池工作进程数: {PROCESS_ENGINE.max_workers}")
+
+# 初始化压缩记录账本（记录已压缩文件的状态、质量和工具，以及压缩失败的文件）
+LEDGER = CompressLedger(os.path.join(cache_dir, 'compress_ledger.db'))
+logger.info(f"压缩记录: {LEDGER.stats()}")
+
+# 初始化BASE_DIR元数据索引（目录和文件的路径、大小、mtime、扩展名），由后台任务增量刷新
+INDEX = MetadataIndex(os.path.join(cache_dir, 'metadata_index.db'), BASE_DIR, WALK_WORKERS) if METADATA_INDEX else None
+if INDEX:
+    logger.info(f"元数据索引: {INDEX.stats()}")
+
+# inotify监视线程，在后台刷新任务完成第一次刷新后启动
+WATCHER = None
+
+# 文件名排序键（拼音+自然排序），元数据索引可用时持久化到索引数据库
+SORT_KEYS = SortKeyService(SORT_KEY_CACHE_SIZE, INDEX)
+
+# 排序后目录列表的缓存，以目录路径和目录mtime为键
+LISTING_CACHE = ListingCache(LISTING_CACHE_SIZE)
+
+# 文件名三元组索引，第一次搜索时构建；元数据索引可用时从索引构建并随索引实时更新
+FILENAME_INDEX = NameIndex(BASE_DIR, INDEX, WALK_WORKERS, NAME_INDEX_MAX_AGE) if NAME_INDEX else None
+
+# 预览缩略图的磁盘缓存，按路径、mtime、大小和尺寸缓存，超出字节预算时淘汰最近最少使用的缩略图
+THUMBNAIL_CACHE = ThumbnailCache(os.path.join(cache_dir, 'thumbnails'), THUMBNAIL_CACHE_SIZE_MB * 1024 * 1024)
+logger.info(f"缩略图缓存: {THUMBNAIL_CACHE.stats()}")
+
+# 打开文件夹后在后台预取悬停预览尺寸的缩略图，批处理任务运行时让出CPU
+PREFETCHER = ThumbnailPrefetcher(THUMBNAIL_CACHE, 'hover', SCHEDULER, THUMBNAIL_PREFETCH_WORKERS, THUMBNAIL_PREFETCH_QUEUE)
 
 logger.info(f"支持的图片格式: {list(SUPPORTED_FORMATS.keys())}")
 
@@ -246,6 +325,18 @@ progress_lock = threading.Lock()
 tasks = {}
 tasks_lock = threading.Lock()
 
+# 流式推送任务结果时每行的最大结果数
+STREAM_BATCH_SIZE = 200
+# 单个流式请求的最长时间（秒），到时后客户端带上偏移量重新连接
+STREAM_MAX_SECONDS = 60
+# 统计格式时每处理多少个文件发布一次部分结果
+PARTIAL_RESULT_INTERVAL = 1000
+
+def completed_status(task):
+    """任务正常结束时的状态：请求过取消的任务为cancelled，否则为completed"""
+    cancel = task.get('cancel')
+    return 'cancelled' if cancel is not None and cancel.is_set() else 'completed'
+
 def update_task_progress(task_id, **kwargs):
     """
     更新任务进度
@@ -263,7 +354,7 @@ def cleanup_completed_tasks(max_age_minutes=60):
     with tasks_lock:
         keys_to_remove = []
         for task_id, task in tasks.items():
-            if task['status'] in ['completed', 'failed']:
+            if task['status'] in ['completed', 'failed', 'cancelled']:
                 try:
                     end_time = datetime.fromisoformat(task['end_time'])
                     if (now - end_time.timestamp()) > max_age_minutes * 60:
@@ -297,157 +388,58 @@ def is_image_file(filename):
     ext = os.path.splitext(filename)[1].lower()[1:]  # [1:] 移除点号
     return ext in SUPPORTED_FORMATS
 
-# 使用专门工具压缩图片（仅Linux平台）
-def compress_image_with_special_tools(img_path, quality):
+# 按格式选择编解码后端
+def select_codec_backend(ext, backend_override=None):
     """
-    使用专门的压缩工具压缩图片（仅Linux平台）
-    - JPG: jpegoptim
-    - PNG: pngquant
-    - WEBP: cwebp
+    按格式选择编解码后端
     
     Args:
-        img_path (str): 图片文件路径
-        quality (int): 压缩质量，1-100，数值越高质量越好，文件越大
+        ext (str): 文件扩展名
+        backend_override (str|dict, optional): 任务参数codec_backend，字符串表示所有格式使用同一后端，字典表示按格式指定
         
     Returns:
-        bool: 压缩成功返回True，失败返回False
-    """
-    try:
-        # 获取文件扩展名
-        ext = os.path.splitext(img_path)[1].lower()[1:]
-        
-        # 根据文件格式选择不同的压缩工具
-        if ext in ['jpg', 'jpeg']:
-            # JPG文件使用jpegoptim压缩
-            cmd = [
-                'jpegoptim',
-                '--max', str(quality),
-                '--all-progressive',  # 生成渐进式JPEG
-                '--quiet',  # 静默模式
-                img_path
-            ]
-        elif ext == 'png':
-            # PNG文件使用pngquant压缩
-            # pngquant的质量范围是0-100，与其他工具一致
-            cmd = [
-                'pngquant',
-                '--skip-if-larger',
-                '--quality', str(quality),
-                '--output', img_path,
-                '--force',  # 覆盖原文件
-                img_path
-            ]
-        elif ext == 'webp':
-            # WEBP文件使用cwebp压缩
-            cmd = [
-                'cwebp',
-                '-q', str(quality),
-                '-metadata', 'all',  # 保留所有元数据
-                '-o', img_path,
-                img_path
-            ]
-        else:
-            # 其他格式不支持，返回False
-            logger.info(f"不支持的格式，无法使用专门工具压缩: {ext}")
-            return False
-        
-        # 执行命令
-        logger.info(f"使用{cmd[0]}压缩图片: {img_path}, 质量: {quality}")
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        if result.returncode != 0:
-            logger.error(f"使用{cmd[0]}压缩图片失败: {img_path}, 错误: {result.stderr}")
-            return False
+        CodecBackend: 编解码后端，未知的后端名称回退到subprocess后端
         
-        logger.info(f"压缩完成: {img_path}")
-        return True
-    except Exception as e:
-        logger.error(f"使用专门工具压缩图片失败: {img_path}, 错误: {e}")
-        return False
+    说明：
+        - 优先级：任务参数 > config.py中的CODEC_BACKENDS > 默认映射（JPG/PNG/WebP使用pillow）
+    """
+    name = resolve_backend_name(ext, backend_override, CODEC_BACKEND_CONFIG)
+    backend = CODEC_BACKENDS.get(name)
+    if backend is None:
+        logger.warning(f"未知的编解码后端: {name}，使用{FALLBACK_BACKEND}")
+        backend = CODEC_BACKENDS[FALLBACK_BACKEND]
+    return backend
 
-# 使用ImageMagick压缩图片
-def compress_image_with_imagemagick(img_path, quality):
+# 判断是否使用进程池执行
+def use_process_engine(engine_override=None):
     """
-    使用ImageMagick压缩图片
+    判断进程内的CPU密集型工作（Pillow编码、PDF逐页保存、图片合并PDF）是否交给进程池执行
     
     Args:
-        img_path (str): 图片文件路径
-        quality (int): 压缩质量，1-100，数值越高质量越好，文件越大
+        engine_override (str, optional): 任务参数execution_engine，process或thread
         
     Returns:
-        bool: 压缩成功返回True，失败返回False
-        
-    说明：
-        - 根据操作系统选择合适的ImageMagick命令
-        - 在Windows上使用magick命令
-        - 在Linux上先尝试magick命令（ImageMagick 7+），失败则回退到convert命令（ImageMagick 6）
-        - 保留EXIF元数据
-        - 使用-interlace Plane生成渐进式JPEG，提高网页加载体验
-        - 使用-sampling-factor 4:2:0进行色度抽样，平衡质量和大小
-        - 使用-colorspace sRGB确保输出图片使用sRGB色彩空间，提高兼容性
+        bool: 使用进程池返回True，在当前线程中执行返回False
     """
-    try:
-        # 使用更可靠的命令构建方式，确保中文路径被正确处理
-        # 在Linux上，ImageMagick 7+ 也使用 magick 命令，而不是 convert
-        if platform.system() == 'Windows':
-            cmd = [
-                'magick', img_path,
-                '-quality', str(quality),
-                '-interlace', 'Plane',  # 渐进式JPEG
-                '-sampling-factor', '4:2:0',  # 色度抽样
-                '-colorspace', 'sRGB',  # 确保sRGB色彩空间
-                img_path
-            ]
-        else:
-            # 检查系统上可用的ImageMagick命令
-            try:
-                # 先尝试magick命令（ImageMagick 7+）
-                subprocess.run(['magick', '--version'], capture_output=True, text=True, timeout=5)
-                cmd = [
-                    'magick', img_path,
-                    '-quality', str(quality),
-                    '-interlace', 'Plane',  # 渐进式JPEG
-                    '-sampling-factor', '4:2:0',  # 色度抽样
-                    '-colorspace', 'sRGB',  # 确保sRGB色彩空间
-                    img_path
-                ]
-            except:
-                # 回退到convert命令（ImageMagick 6）
-                cmd = [
-                    'convert', img_path,
-                    '-quality', str(quality),
-                    '-interlace', 'Plane',  # 渐进式JPEG
-                    '-sampling-factor', '4:2:0',  # 色度抽样
-                    '-colorspace', 'sRGB',  # 确保sRGB色彩空间
-                    img_path
-                ]
-        
-        # 执行命令
-        logger.info(f"使用ImageMagick压缩图片: {img_path}, 质量: {quality}")
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        if result.returncode != 0:
-            logger.error(f"使用ImageMagick压缩图片失败: {img_path}, 错误: {result.stderr}")
-            return False
-        
-        logger.info(f"压缩完成: {img_path}")
-        return True
-    except Exception as e:
-        logger.error(f"压缩图片失败: {img_path}, 错误: {e}")
-        return False
+    return (engine_override or EXECUTION_ENGINE) == 'process'
 
 # 压缩图片的统一入口函数
-def compress_image(img_path, quality):
+def compress_image(img_path, quality, backend_override=None, engine_override=None):
     """
     压缩图片的统一入口函数
-    - Linux平台：使用专门的压缩工具（jpegoptim/pngquant/cwebp）
-    - Windows平台：使用ImageMagick
+    - 按格式选择编解码后端：pillow（进程内）或subprocess（jpegoptim/pngquant/cwebp/ImageMagick）
+    - pillow后端不支持或失败时回退到subprocess后端
+    - pillow后端在进程池中执行，避免多线程编码被GIL串行化
     - 保留EXIF元数据
     
     Args:
         img_path (str): 图片文件路径
         quality (int): 压缩质量，1-100，数值越高质量越好，文件越大
+        backend_override (str|dict, optional): 任务指定的编解码后端
+        engine_override (str, optional): 任务指定的执行引擎，process或thread
         
     Returns:
-        bool: 压缩成功返回True，失败返回False
+        CodecResult: 是否成功（布尔值）及压缩后的文件大小和mtime
     """
     logger.info(f"开始压缩图片，路径: {img_path}, 质量: {quality}")
     
@@ -456,43 +448,225 @@ def compress_image(img_path, quality):
     logger.debug(f"图片格式: {ext}")
     
     # 检查是否为支持的格式
-    if ext not in ['jpg', 'jpeg', 'png', 'webp']:
+    if ext not in COMPRESSIBLE_FORMATS:
         logger.info(f"不支持的格式，无法压缩: {ext}")
+        return FAILED
+    
+    backend = select_codec_backend(ext, backend_override)
+    if backend.name != FALLBACK_BACKEND and use_process_engine(engine_override):
+        success, final_size, final_mtime_ns = PROCESS_ENGINE.call(
+            compress_file, img_path, quality, backend.name
+        )
+        return CodecResult(success, final_size, final_mtime_ns) if success else FAILED
+    
+    return compress_with_fallback(CODEC_BACKENDS, backend.name, img_path, quality)
+
+# 按目标大小或画质下限搜索质量压缩图片
+def compress_image_search(img_path, quality, mode, target_bytes=None, min_psnr=None, engine_override=None):
+    """
+    按图片搜索压缩质量并压缩
+    
+    Args:
+        img_path (str): 图片文件路径
+        quality (int): 搜索的最高质量，不支持质量搜索的文件按此固定质量压缩
+        mode (str): target_size（不超过目标大小的最高质量）或perceptual（PSNR不低于下限的最低质量）
+        target_bytes (int, optional): 目标字节数
+        min_psnr (float, optional): PSNR下限（dB）
+        engine_override (str, optional): 任务指定的执行引擎，process或thread
+        
+    Returns:
+        tuple: (CodecResult, chosen_quality, attempts, used_mode)，回退到subprocess后端按固定质量压缩时used_mode为fixed
+        
+    说明：
+        - 中间结果只在内存中编码，只有最终结果写入磁盘
+        - 质量搜索使用pillow后端，不受codec_backend参数影响
+    """
+    ext = os.path.splitext(img_path)[1].lower()[1:]
+    if ext not in COMPRESSIBLE_FORMATS:
+        logger.info(f"不支持的格式，无法压缩: {ext}")
+        return FAILED, quality, 0, mode
+    
+    if use_process_engine(engine_override):
+        success, final_size, final_mtime_ns, chosen, attempts, used_mode = PROCESS_ENGINE.call(
+            compress_file_search, img_path, quality, mode, target_bytes, min_psnr
+        )
+        return (CodecResult(success, final_size, final_mtime_ns) if success else FAILED), chosen, attempts, used_mode
+    
+    return compress_search_with_fallback(
+        CODEC_BACKENDS, img_path, quality, mode, target_bytes, min_psnr
+    )
+
+# 获取压缩图片时使用的工具名
+def compress_tool_name(img_path, backend_override=None):
+    """
+    返回压缩该图片时使用的工具名（pillow、jpegoptim、pngquant、cwebp或imagemagick），用于写入压缩记录
+    """
+    ext = os.path.splitext(img_path)[1].lower()[1:]
+    return select_codec_backend(ext, backend_override).compress_tool(ext)
+
+# 按格式转换单个普通图片（非PDF）
+def convert_with_backend(img_path, new_path, target_format, quality, backend_override=None, engine_override=None):
+    """
+    使用编解码后端转换单个普通图片
+    
+    Args:
+        img_path (str): 源图片路径
+        new_path (str): 输出路径
+        target_format (str): 目标格式
+        quality (int): 转换质量，1-100
+        backend_override (str|dict, optional): 任务指定的编解码后端
+        engine_override (str, optional): 任务指定的执行引擎，process或thread
+        
+    Returns:
+        CodecResult: 是否成功（布尔值）及输出文件的大小和mtime
+        
+    说明：
+        - 按目标格式选择后端，pillow后端不支持源格式或失败时回退到ImageMagick
+        - pillow后端在进程池中执行
+    """
+    backend = select_codec_backend(target_format, backend_override)
+    if backend.name != FALLBACK_BACKEND and use_process_engine(engine_override):
+        success, final_size, final_mtime_ns = PROCESS_ENGINE.call(
+            convert_file, img_path, new_path, target_format, quality, backend.name
+        )
+        return CodecResult(success, final_size, final_mtime_ns) if success else FAILED
+    
+    return convert_with_fallback(CODEC_BACKENDS, backend.name, img_path, new_path, target_format, quality)
+
+# 判断压缩该图片时是否会调用ImageMagick
+def uses_imagemagick_compress(img_path, backend_override=None):
+    """
+    判断压缩该图片时是否会直接调用ImageMagick（可合并为批处理）
+    
+    说明：
+        - 选择subprocess后端，且Windows平台或对应的专用压缩工具不可用时，才会使用ImageMagick
+    """
+    ext = os.path.splitext(img_path)[1].lower()[1:]
+    if ext not in COMPRESSIBLE_FORMATS:
+        return False
+    if select_codec_backend(ext, backend_override).name != FALLBACK_BACKEND:
         return False
+    return CODEC_BACKENDS[FALLBACK_BACKEND].uses_imagemagick_for_compress(ext)
+
+# 判断转换该图片时是否可以合并到ImageMagick批处理
+def uses_imagemagick_convert(img_path, target_format, backend_override=None):
+    """
+    判断转换该图片时是否可以合并到mogrify -format批处理
     
-    # Linux平台优先使用专门的压缩工具
-    if platform.system() != 'Windows':
-        try:
-            # 检查是否安装了相应的压缩工具
-            tool_available = False
-            if ext in ['jpg', 'jpeg']:
-                tool_available = JPEGOPTIM_AVAILABLE
-            elif ext == 'png':
-                tool_available = PNGQUANT_AVAILABLE
-            elif ext == 'webp':
-                tool_available = CWEBP_AVAILABLE
-            
-            # 如果工具可用，使用专门的压缩工具
-            if tool_available:
-                logger.debug(f"使用专门工具压缩图片，格式: {ext}")
-                result = compress_image_with_special_tools(img_path, quality)
-                logger.info(f"专门工具压缩结果: {'成功' if result else '失败'}")
-                return result
-            else:
-                # 工具不可用，记录日志并回退到ImageMagick
-                tool_name = 'jpegoptim' if ext in ['jpg', 'jpeg'] else 'pngquant' if ext == 'png' else 'cwebp'
-                logger.warning(f"{tool_name}不可用，回退到ImageMagick")
-        except Exception as e:
-            logger.warning(f"专门的压缩工具不可用，回退到ImageMagick: {e}")
+    说明：
+        - PDF文件逐页处理，不参与批处理
+        - 目标格式使用pillow后端时不调用ImageMagick
+        - 输出文件已存在（会被跳过）或mogrify生成的文件名与期望不一致时逐个处理
+    """
+    ext = os.path.splitext(img_path)[1].lower()[1:]
+    if ext == 'pdf':
+        return False
+    if select_codec_backend(target_format, backend_override).name != FALLBACK_BACKEND:
+        return False
+    new_path = converted_image_path(img_path, target_format)
+    if os.path.exists(new_path):
+        return False
+    return mogrify_output_matches(img_path, new_path)
+
+# 计算图片转换后的输出路径
+def converted_image_path(img_path, target_format):
+    """
+    返回图片转换后的输出路径：保留第一个点之前的文件名，扩展名改为目标格式（jpeg统一为jpg）
+    """
+    dirname = os.path.dirname(img_path)
+    basename = os.path.basename(img_path).split('.')[0]
+    normalized_target = 'jpg' if target_format.lower() == 'jpeg' else target_format.lower()
+    return os.path.join(dirname, f"{basename}.{normalized_target}")
+
+# 拆分ImageMagick批处理文件和逐个处理的文件
+def split_imagemagick_batch(records, is_batchable):
+    """
+    把需要调用ImageMagick的文件按大小划分为批次，其余文件逐个处理
     
-    # Windows平台或专门工具不可用时，使用ImageMagick
-    logger.debug("使用ImageMagick压缩图片")
-    result = compress_image_with_imagemagick(img_path, quality)
-    logger.info(f"ImageMagick压缩结果: {'成功' if result else '失败'}")
-    return result
+    Args:
+        records (list): 文件记录（FileRecord）列表，使用扫描时的大小划分批次
+        is_batchable (callable): 判断文件路径是否可以合并到ImageMagick批处理
+        
+    Returns:
+        tuple: (batches, singles)
+            batches (list): [[FileRecord, ...], ...]，每批由一次mogrify调用处理
+            singles (list): 逐个处理的文件记录列表
+    """
+    batchable = []
+    singles = []
+    for record in records:
+        if is_batchable(record.path):
+            batchable.append((record, record.size))
+        else:
+            singles.append(record)
+    
+    batches = plan_batches(batchable, IMAGEMAGICK_BATCH_MAX_FILES, IMAGEMAGICK_BATCH_MAX_BYTES)
+    # 只有一个文件的批次直接逐个处理
+    singles.extend(batch[0] for batch in batches if len(batch) == 1)
+    batches = [batch for batch in batches if len(batch) > 1]
+    return batches, singles
+
+# 按页码区间并行渲染PDF
+def convert_pdf_pages(pdf_path, output_pattern, quality, skip_existing, on_page=None, on_page_count=None,
+                      engine_override=None, should_stop=None):
+    """
+    把PDF拆分为多个页码区间并行渲染，每个区间占用全局调度器的一个重格式名额，与图片任务共享并发预算
+    
+    Args:
+        pdf_path (str): PDF文件路径
+        output_pattern (str): 输出路径模板，包含 {page} 占位符
+        quality (int): 保存质量
+        skip_existing (bool): 输出文件已存在时是否跳过
+        on_page (callable, optional): 每处理一页调用 on_page(事件, (页码, 总页数, 输出大小))
+        on_page_count (callable, optional): 读取到总页数后调用 on_page_count(总页数)
+        engine_override (str, optional): 任务指定的执行引擎，process或thread
+        should_stop (callable, optional): 返回True时不再开始新的页码区间
+        
+    Returns:
+        tuple: (总页数, 输出总大小, 跳过的输出路径列表, 失败的页码区间列表, 因停止而未开始的页码区间列表)
+    """
+    page_count = get_pdf_page_count(pdf_path)
+    if on_page_count:
+        on_page_count(page_count)
+    ranges = split_page_ranges(page_count, PDF_PAGES_PER_TASK)
+    logger.info(f"PDF共 {page_count} 页，拆分为 {len(ranges)} 个页码区间并行渲染: {pdf_path}")
+    
+    def render_range(page_range):
+        first_page, last_page = page_range
+        if should_stop and should_stop():
+            logger.info(f"停止处理，跳过页码区间 {first_page}-{last_page}: {pdf_path}")
+            return None
+        with SCHEDULER.slot(kind='heavy'):
+            return PROCESS_ENGINE.call(
+                convert_pdf, pdf_path, output_pattern, quality, skip_existing, first_page, last_page, page_count,
+                on_event=on_page, inline=not use_process_engine(engine_override)
+            )
+    
+    total_size = 0
+    skipped = []
+    failed_ranges = []
+    stopped_ranges = []
+    # 线程只负责等待，实际并发由调度器的重格式名额限制
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(ranges), SCHEDULER.max_limits['heavy']) or 1) as executor:
+        futures = {executor.submit(render_range, page_range): page_range for page_range in ranges}
+        for future in concurrent.futures.as_completed(futures):
+            page_range = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"渲染PDF页码区间失败: {pdf_path} {page_range[0]}-{page_range[1]}, 错误: {e}")
+                failed_ranges.append(page_range)
+                continue
+            if result is None:
+                stopped_ranges.append(page_range)
+                continue
+            total_size += result[1]
+            skipped.extend(result[2])
+    return page_count, total_size, skipped, sorted(failed_ranges), sorted(stopped_ranges)
 
 # 使用ImageMagick转换图片格式
-def convert_image_with_imagemagick(img_path, target_format, quality):
+def convert_image_with_imagemagick(img_path, target_format, quality, backend_override=None, engine_override=None,
+                                   on_page=None, on_page_count=None, should_stop=None):
     """
     使用ImageMagick转换图片格式
     
@@ -500,18 +674,24 @@ def convert_image_with_imagemagick(img_path, target_format, quality):
         img_path (str): 图片文件路径
         target_format (str): 目标格式，如'jpg'、'png'、'webp'等
         quality (int): 转换质量，1-100，数值越高质量越好，文件越大
+        backend_override (str|dict, optional): 任务指定的编解码后端
+        engine_override (str, optional): 任务指定的执行引擎，process或thread
+        on_page (callable, optional): PDF每处理一页的进度回调
+        on_page_count (callable, optional): 读取到PDF总页数后的回调
+        should_stop (callable, optional): 返回True时PDF不再开始新的页码区间
         
     Returns:
-        tuple: (success, output_path)
-            success (bool): 转换成功返回True，失败返回False
+        tuple: (result, output_path)
+            result (CodecResult): 布尔值表示是否成功，size为输出文件大小（PDF为所有页面的总大小）
             output_path (str): 转换后的文件路径，如果是PDF文件转换则返回原路径
         
     说明：
         - 支持普通图片格式转换和PDF文件转图片
-        - 对于PDF文件，使用pdf2image库处理，支持多页转换
+        - 对于PDF文件，使用pdf2image库逐页渲染并保存（内存占用与页数无关），大文件按页码区间并行渲染
         - 普通图片转换时，生成新的文件名，保留原文件名但更改扩展名
         - 检查转换后的文件是否已存在，如果存在则跳过
         - 对于目标格式为jpeg的情况，自动转换为jpg，保持一致性
+        - 普通图片按目标格式选择编解码后端（pillow或ImageMagick）
         - 保留EXIF元数据
     """
     logger.info(f"开始转换图片，路径: {img_path}, 目标格式: {target_format}, 质量: {quality}")
@@ -529,91 +709,59 @@ def convert_image_with_imagemagick(img_path, target_format, quality):
             logger.info(f"PDF文件转图片: {img_path}")
             
             try:
-                # 使用pdf2image转换PDF为图片列表
+                # 使用pdf2image转换PDF为图片，生成带序号的输出文件名，已存在的文件跳过
                 logger.info(f"开始使用pdf2image转换PDF: {img_path}")
-                images = convert_from_path(img_path, dpi=300, fmt=target_format.lower(), thread_count=1)
-                logger.info(f"PDF转换完成，共 {len(images)} 页")
+                output_pattern = os.path.join(dirname, f"{basename}-{{page:03d}}.{target_format}")
+                page_count, total_size, skipped, failed_ranges, stopped_ranges = convert_pdf_pages(
+                    img_path, output_pattern, quality, True,
+                    on_page=on_page, on_page_count=on_page_count,
+                    engine_override=engine_override, should_stop=should_stop
+                )
+                logger.info(f"PDF转换完成，共 {page_count} 页")
                 
-                # 处理转换后的图片
-                for i, img in enumerate(images):
-                    # 生成带序号的输出文件名
-                    output_filename = os.path.join(dirname, f"{basename}-{i+1:03d}.{target_format}")
-                    # 检查文件是否已存在
-                    if os.path.exists(output_filename):
-                        logger.info(f"文件已存在，跳过: {output_filename}")
-                        with progress_lock:
-                            progress_data['skipped_files'].append(output_filename)
-                        continue
-                    # 保存图片
-                    img.save(output_filename, quality=quality)
-                    logger.info(f"保存图片: {output_filename}")
+                for output_filename in skipped:
+                    logger.info(f"文件已存在，跳过: {output_filename}")
+                    with progress_lock:
+                        progress_data['skipped_files'].append(output_filename)
+                
+                if failed_ranges:
+                    logger.error(f"PDF部分页面转换失败: {img_path}, 失败的页码区间: {failed_ranges}")
+                    return FAILED, ""
+                if stopped_ranges:
+                    # 任务停止时还有页码区间没有开始，PDF没有转换完整，不能算作成功
+                    logger.warning(f"PDF转换未完成（任务已停止）: {img_path}, 未转换的页码区间: {stopped_ranges}")
+                    return FAILED, ""
                 
                 logger.info(f"PDF转图片完成: {img_path}")
-                return True, img_path  # 返回原路径，因为PDF转换会生成多个文件
+                return CodecResult(True, total_size), img_path  # 返回原路径，因为PDF转换会生成多个文件
             except Exception as e:
                 logger.error(f"PDF转图片失败: {img_path}, 错误: {e}")
                 logger.error(f"异常详情: {traceback.format_exc()}")
-                return False, ""
+                return FAILED, ""
         else:
             # 普通图片转换
             # 处理目标格式，将jpeg转换为jpg，保持一致性
-            normalized_target = 'jpg' if target_format.lower() == 'jpeg' else target_format.lower()
-            new_path = os.path.join(dirname, f"{basename}.{normalized_target}")
+            new_path = converted_image_path(img_path, target_format)
             logger.debug(f"原始文件路径: {img_path}")
             logger.debug(f"转换后文件路径: {new_path}")
             
-            # 检查转换后的文件是否已存在，如果存在则跳过
-            if os.path.exists(new_path):
+            # 检查转换后的文件是否已存在，如果存在则跳过（一次stat同时取得已存在文件的大小）
+            existing = CodecResult.from_file(new_path)
+            if existing:
                 logger.info(f"转换后的文件已存在，跳过: {new_path}")
                 with progress_lock:
                     progress_data['skipped_files'].append(new_path)
-                return True, new_path
-            
-            # 使用更可靠的命令构建方式，确保中文路径被正确处理
-            # 在Linux上，ImageMagick 7+ 也使用 magick 命令，而不是 convert
-            if platform.system() == 'Windows':
-                cmd = [
-                    'magick', img_path,
-                    '-quality', str(quality),
-                    # 移除-strip，保留元数据
-                    '-interlace', 'Plane',  # 渐进式JPEG
-                    '-colorspace', 'sRGB',  # 确保sRGB色彩空间
-                    new_path
-                ]
-            else:
-                # 检查系统上可用的ImageMagick命令
-                try:
-                    # 先尝试magick命令（ImageMagick 7+）
-                    subprocess.run(['magick', '--version'], capture_output=True, text=True, timeout=5)
-                    cmd = [
-                        'magick', img_path,
-                        '-quality', str(quality),
-                        '-interlace', 'Plane',  # 渐进式JPEG
-                        '-colorspace', 'sRGB',  # 确保sRGB色彩空间
-                        new_path
-                    ]
-                except:
-                    # 回退到convert命令（ImageMagick 6）
-                    cmd = [
-                        'convert', img_path,
-                        '-quality', str(quality),
-                        '-interlace', 'Plane',  # 渐进式JPEG
-                        '-colorspace', 'sRGB',  # 确保sRGB色彩空间
-                        new_path
-                    ]
-            
-            # 执行命令
-            logger.debug(f"执行转换命令: {cmd}")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            if result.returncode != 0:
-                logger.error(f"转换图片失败: {img_path}, 错误: {result.stderr}")
-                return False, ""
-            
-            logger.info(f"转换完成: {img_path} -> {new_path}")
-            return True, new_path
+                return existing, new_path
+            
+            # 使用编解码后端转换图片
+            result = convert_with_backend(img_path, new_path, target_format, quality, backend_override, engine_override)
+            if not result:
+                return FAILED, ""
+            
+            return result, new_path
     except Exception as e:
         logger.error(f"转换图片失败: {img_path}, 错误: {e}")
-        return False, ""
+        return FAILED, ""
 
 # 获取文件大小
 def get_file_size(filepath):
@@ -638,43 +786,169 @@ def get_all_images(directory, exclude_formats=None):
         exclude_formats (list, optional): 要排除的图片格式列表，默认为None
         
     Returns:
-        list: 图片文件路径列表
+        list: 图片文件记录（FileRecord，带扫描时的大小、mtime和小写扩展名）列表，
+              按路径排序（与文件列表相同的拼音+自然排序），任务按此顺序处理
         
     说明：
-        - 使用os.scandir遍历目录及其子目录
+        - 元数据索引可用时先增量刷新该目录树，再从索引读取；否则使用file_walker并行遍历目录及其子目录
         - 只返回支持的图片格式文件
         - 支持通过exclude_formats参数排除指定格式
         - 排除格式时使用小写扩展名比较，确保大小写不敏感
     """
-    images = []
+    if index_covers(directory):
+        # 只重新扫描mtime变化的目录，然后从索引中读取
+        INDEX.refresh(directory)
+        candidates = (
+            FileRecord(path, name, size, mtime_ns, ext)
+            for path, name, ext, size, mtime_ns in INDEX.files_under(directory)
+        )
+    else:
+        candidates = walk_records(directory, base_dir=BASE_DIR, max_workers=WALK_WORKERS)
     
-    # 使用迭代方式扫描目录，避免递归导致的栈溢出
-    stack = [directory]
-    while stack:
-        current_dir = stack.pop()
-        try:
-            with os.scandir(current_dir) as entries:
-                for entry in entries:
-                    # 跳过隐藏文件和目录
-                    if entry.name.startswith('.'):
-                        continue
-                    if entry.is_dir(follow_symlinks=False):
-                        # 将子目录添加到栈中
-                        stack.append(entry.path)
-                    elif entry.is_file(follow_symlinks=False):
-                        if is_image_file(entry.name):
-                            filepath = entry.path
-                            if exclude_formats:
-                                # 使用os.path.splitext获取扩展名
-                                ext = os.path.splitext(entry.name)[1].lower()[1:]  # [1:] 移除点号
-                                if ext not in exclude_formats:
-                                    images.append(filepath)
-                            else:
-                                images.append(filepath)
-        except Exception as e:
-            logger.error(f"扫描目录 {current_dir} 失败: {e}")
+    images = [
+        record for record in candidates
+        if record.ext in SUPPORTED_FORMATS and not (exclude_formats and record.ext in exclude_formats)
+    ]
+    return SORT_KEYS.sort_paths(images, key=lambda record: record.path)
+
+# 判断元数据索引是否可以回答该路径的查询
+def index_covers(path):
+    """
+    判断元数据索引是否可用且覆盖该路径（已完成过一次完整刷新，且路径位于BASE_DIR内）
+    """
+    return INDEX is not None and INDEX.covers(path)
+
+# 使用索引回答查询前确保其不落后于磁盘
+def refresh_index_if_unwatched(path):
+    """
+    inotify监视不可用或达到监视数量上限时，先增量刷新该目录树（只重新扫描并汇总mtime变化的目录）
+    监视正常时索引由事件实时更新，不需要刷新
+    """
+    if WATCHER is None or not WATCHER.healthy:
+        INDEX.refresh(path)
+
+# 修改文件后同步元数据索引
+def refresh_index(paths, force=False):
+    """
+    本程序修改文件后同步元数据索引
+    
+    Args:
+        paths (list): 被修改的文件或目录路径
+        force (bool): 是否强制重新扫描文件所在的目录
+        
+    说明：
+        - 删除、重命名、新建文件会改变目录mtime，增量刷新即可发现
+        - 原地压缩不会改变目录mtime，需要force重新扫描文件所在的目录
+    """
+    if force:
+        # 原地修改的文件不改变目录mtime，缓存的目录列表需要失效
+        LISTING_CACHE.invalidate({os.path.dirname(path) for path in paths})
+    if INDEX is None or not INDEX.ready:
+        return
+    try:
+        if force:
+            INDEX.refresh_dirs({os.path.dirname(path) for path in paths if is_within_base(path, BASE_DIR)})
+            return
+        for path in paths:
+            if not is_within_base(path, BASE_DIR):
+                continue
+            if os.path.isdir(path):
+                INDEX.refresh(path)
+            else:
+                # 文件或已被删除的目录：重新扫描所在目录
+                INDEX.refresh_dirs([os.path.dirname(path)])
+    except Exception as e:
+        logger.error(f"同步元数据索引失败: {e}")
+
+# 获取目录的直接子目录和图片文件
+def list_directory(path):
+    """
+    获取目录的直接子目录和图片文件，跳过隐藏文件和目录
     
-    return images
+    Args:
+        path (str): 目录路径
+        
+    Returns:
+        tuple: (目录项列表, 图片文件项列表)，未排序
+        
+    说明：
+        - 元数据索引可用时从索引读取，目录mtime变化时先重新扫描该目录
+        - 否则使用os.scandir读取
+    """
+    dirs = []
+    imgs = []
+    if index_covers(path):
+        index_dirs, index_files = INDEX.list_dir(path)
+        for dir_path, name, mtime_ns in index_dirs:
+            dirs.append({'name': name, 'path': dir_path, 'type': 'dir', 'size': 0, 'mtime': mtime_ns / 1e9})
+        for file_path, name, size, mtime_ns in index_files:
+            if is_image_file(name):
+                imgs.append({'name': name, 'path': file_path, 'type': 'file', 'size': size, 'mtime': mtime_ns / 1e9})
+        return dirs, imgs
+    
+    with os.scandir(path) as entries:
+        for entry in entries:
+            # 跳过隐藏文件和目录
+            if entry.name.startswith('.'):
+                continue
+            # 每个条目只lstat一次（scandir缓存结果）
+            if entry.is_dir(follow_symlinks=False):
+                # 目录项
+                dirs.append({
+                    'name': entry.name,
+                    'path': entry.path,
+                    'type': 'dir',
+                    'size': 0,
+                    'mtime': entry.stat(follow_symlinks=False).st_mtime
+                })
+            elif entry.is_file(follow_symlinks=False) and is_image_file(entry.name):
+                # 图片文件项
+                st = entry.stat(follow_symlinks=False)
+                imgs.append({
+                    'name': entry.name,
+                    'path': entry.path,
+                    'type': 'file',
+                    'size': st.st_size,
+                    'mtime': st.st_mtime
+                })
+    return dirs, imgs
+
+# 文件列表排序
+def sort_entries(items):
+    """
+    使用拼音+自然排序实现中文排序，支持Windows资源管理器排序规则
+    英文文件名在前，中文文件名在后；排序键由SORT_KEYS计算并缓存
+    """
+    return SORT_KEYS.sort(items, key=lambda item: item['name'])
+
+# 获取排序后的目录列表（带缓存）
+def get_listing(path):
+    """
+    获取目录的排序后列表，文件夹在前，文件在后
+    目录mtime与缓存时相同时直接返回缓存的列表，不再scandir和排序
+    
+    Returns:
+        Listing: 包含version（用作ETag）和files
+    """
+    # 先读取mtime再生成列表：生成过程中目录发生变化时，下次请求的mtime不同会重新生成
+    mtime_ns = os.stat(path).st_mtime_ns
+    listing = LISTING_CACHE.get(path, mtime_ns)
+    if listing is None:
+        dirs, imgs = list_directory(path)
+        listing = LISTING_CACHE.put(path, mtime_ns, sort_entries(dirs) + sort_entries(imgs))
+    return listing
+
+# 预取列表中图片的缩略图
+def prefetch_thumbnails(path, items, replace=False):
+    """
+    把列表中的图片加入缩略图预取队列（文件夹跳过）
+
+    Args:
+        path (str): 列表所在的文件夹
+        items (list): 列表条目，按显示顺序
+        replace (bool): 是否重新开始（打开文件夹时），加载后续页时为False
+    """
+    PREFETCHER.enqueue(path, [item['path'] for item in items if item['type'] == 'file'], replace)
 
 @app.route('/')
 def index():
@@ -688,116 +962,137 @@ def get_files():
     请求参数: 
         path - 要获取文件的路径，默认为BASE_DIR
         auto_enter - 是否自动进入子文件夹，默认为true
-    返回: JSON格式的文件列表和当前路径
+        since - 客户端已有的完整列表版本号（可选，不分页时有效），目录有变化时只返回变化的条目
+        page_size - 每页条目数（可选），不传时返回完整列表
+        cursor - 上一页返回的next_cursor（可选），用于获取下一页
+        sort - 排序方式（可选）：name（默认，自然排序+拼音）、size、mtime、format
+        order - 排序顺序（可选）：asc（默认）、desc
+        ext - 只返回这些后缀的文件（可选，逗号分隔），文件夹不过滤
+    请求头: If-None-Match - 客户端已有的列表版本号，目录没有变化时返回304
+    返回: JSON格式的文件列表、当前路径和列表版本号；分页时还包括total（过滤后的条目总数）、next_cursor
+          和listing_version（完整列表的版本号，客户端已加载全部条目后可以用作since）
     如果路径下只有一个文件夹且auto_enter为true，自动进入该文件夹，直到满足终止条件
     """
     path = request.form.get('path', BASE_DIR)
     auto_enter = request.form.get('auto_enter', 'true').lower() == 'true'
-    logger.info(f"获取文件列表，路径: {path}, auto_enter: {auto_enter}")
+    since = request.form.get('since', '')
+    cursor = request.form.get('cursor', '')
+    sort = request.form.get('sort', 'name')
+    reverse = request.form.get('order', 'asc').lower() == 'desc'
+    exts = parse_extensions(request.form.get('ext', ''))
+    try:
+        page_size = int(request.form.get('page_size', 0))
+        cursor_data = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if sort not in SORT_FIELDS:
+        return jsonify({'error': f'不支持的排序方式: {sort}'}), 400
+    # 使用游标时必须分页，游标本身不记录页大小
+    paged = page_size > 0 or cursor_data is not None
+    page_size = min(page_size or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+    logger.info(f"获取文件列表，路径: {path}, auto_enter: {auto_enter}" +
+                (f", 排序: {sort} {'desc' if reverse else 'asc'}, 页大小: {page_size}, 游标: {bool(cursor)}" if paged else ""))
     
     # 确保路径在BASE_DIR下，防止目录遍历攻击
     if not os.path.normpath(path).startswith(os.path.normpath(BASE_DIR)):
         logger.warning(f"路径 {path} 不在BASE_DIR下，使用默认路径: {BASE_DIR}")
         path = BASE_DIR
     
-    # 自动进入子文件夹逻辑
-    if auto_enter:
-        max_depth = 10  # 防止无限递归
-        current_depth = 0
+    try:
+        # 获取所有文件和文件夹（排序后），跳过隐藏文件和目录
+        listing = get_listing(path)
         
-        while current_depth < max_depth:
-            try:
-                # 获取当前目录下的所有项目
-                dir_count = 0
-                file_count = 0
-                single_dir_path = None
-                
-                # 使用os.scandir统计目录和文件数量，跳过隐藏文件夹
-                with os.scandir(path) as entries:
-                    for entry in entries:
-                        # 跳过隐藏文件夹
-                        if entry.name.startswith('.'):
-                            continue
-                        if entry.is_dir(follow_symlinks=False):
-                            dir_count += 1
-                            single_dir_path = entry.path
-                        elif entry.is_file(follow_symlinks=False) and is_image_file(entry.name):
-                            file_count += 1
-                
-                # 如果只有一个目录且没有文件，自动进入该目录
-                if dir_count == 1 and file_count == 0:
-                    logger.info(f"自动进入子文件夹: {single_dir_path}")
-                    path = single_dir_path
-                    current_depth += 1
-                else:
-                    # 满足终止条件，退出循环
+        # 自动进入子文件夹逻辑：如果只有一个目录且没有文件，自动进入该目录
+        # 获取后续页时路径已经是自动进入后的路径，不再重复
+        if auto_enter and cursor_data is None:
+            max_depth = 10  # 防止无限递归
+            current_depth = 0
+            
+            while current_depth < max_depth and len(listing.files) == 1 and listing.files[0]['type'] == 'dir':
+                single_dir_path = listing.files[0]['path']
+                try:
+                    sub_listing = get_listing(single_dir_path)
+                except Exception as e:
+                    logger.error(f"自动进入子文件夹失败: {e}")
                     break
-            except Exception as e:
-                logger.error(f"自动进入子文件夹失败: {e}")
-                break
-    
-    try:
-        dirs = []
-        imgs = []
-        # 遍历目录，获取所有文件和文件夹，跳过隐藏文件和目录
-        with os.scandir(path) as entries:
-            for entry in entries:
-                # 跳过隐藏文件和目录
-                if entry.name.startswith('.'):
-                    continue
-                if entry.is_dir(follow_symlinks=False):
-                    # 目录项
-                    dirs.append({
-                        'name': entry.name,
-                        'path': entry.path,
-                        'type': 'dir',
-                        'size': 0,
-                        'mtime': entry.stat().st_mtime
-                    })
-                elif entry.is_file(follow_symlinks=False) and is_image_file(entry.name):
-                    # 图片文件项
-                    imgs.append({
-                        'name': entry.name,
-                        'path': entry.path,
-                        'type': 'file',
-                        'size': get_file_size(entry.path),
-                        'mtime': entry.stat().st_mtime
-                    })
-        # 按类型排序，文件夹在前，文件在后，使用natsorted+lazy_pinyin实现中文排序，支持Windows资源管理器排序规则
-        # 英文文件名在前，中文文件名在后
-        def get_sort_key(item):
-            name = item['name']
-            # 检查文件名首字符是否为中文
-            is_chinese = len(name) > 0 and '\u4e00' <= name[0] <= '\u9fff'
-            # 生成排序键：(是否为中文, 拼音或原名称, 原名称)
-            return (
-                is_chinese,  # 英文在前，中文在后
-                ''.join(lazy_pinyin(name)),  # 中文按拼音排序
-                name.lower()  # 保持自然排序的准确性
-            )
+                logger.info(f"自动进入子文件夹: {single_dir_path}")
+                path = single_dir_path
+                listing = sub_listing
+                current_depth += 1
         
-        sorted_dirs = natsorted(
-            dirs,
-            key=get_sort_key,
-            alg=ns.PATH | ns.IGNORECASE,
-            reverse=False
-        )
-        sorted_imgs = natsorted(
-            imgs,
-            key=get_sort_key,
-            alg=ns.PATH | ns.IGNORECASE,
-            reverse=False
-        )
-        logger.info(f"成功获取 {len(sorted_dirs)} 个文件夹和 {len(sorted_imgs)} 个图片文件，当前路径: {path}")
+        if paged:
+            # 分页：版本号包含排序、过滤和页大小，只有第一页支持304
+            version = listing.view_version(sort, reverse, exts, page_size)
+            items = listing.view(sort, reverse, exts)
+            offset = listing.resume(items, cursor_data) if cursor_data else 0
+            page, next_cursor = listing.page(items, offset, page_size)
+            # 打开文件夹时重新开始预取，加载后续页时追加到队列
+            prefetch_thumbnails(path, page, replace=cursor_data is None)
+            if cursor_data is None and request.if_none_match.contains(version):
+                logger.info(f"文件列表未变化，返回304，当前路径: {path}")
+                response = make_response('', 304)
+                response.set_etag(version)
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+            logger.info(f"返回文件列表第 {offset + 1}-{offset + len(page)} 项，共 {len(items)} 项，当前路径: {path}")
+            response = jsonify({
+                'files': page,
+                'offset': offset,
+                'total': len(items),
+                'next_cursor': next_cursor,
+                'current_path': path,
+                'version': version,
+                'listing_version': listing.version
+            })
+            response.set_etag(version)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
         
-        return jsonify({
-            'files': sorted_dirs + sorted_imgs,
-            'current_path': path
-        })
+        prefetch_thumbnails(path, listing.files, replace=True)
+        
+        # 客户端的列表仍是最新版本
+        if request.if_none_match.contains(listing.version):
+            logger.info(f"文件列表未变化，返回304，当前路径: {path}")
+            response = make_response('', 304)
+            response.set_etag(listing.version)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        
+        # 客户端带上了旧版本号：只返回变化的条目；旧版本已不在历史中时返回完整列表
+        delta = LISTING_CACHE.delta(listing, since) if since else None
+        if delta is not None:
+            logger.info(f"返回增量文件列表，变化 {len(delta['changed'])} 个，删除 {len(delta['removed'])} 个，当前路径: {path}")
+            body = dict(delta, delta=True, since=since)
+        else:
+            dir_count = sum(1 for item in listing.files if item['type'] == 'dir')
+            logger.info(f"成功获取 {dir_count} 个文件夹和 {len(listing.files) - dir_count} 个图片文件，当前路径: {path}")
+            body = {'files': listing.files}
+        
+        response = jsonify(dict(body, current_path=path, version=listing.version))
+        response.set_etag(listing.version)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         logger.error(f"获取文件列表失败: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/prefetch_thumbnails', methods=['POST'])
+def prefetch_visible_thumbnails():
+    """
+    把当前可见的文件移到缩略图预取队列的队首
+    请求方法: POST
+    请求参数(JSON):
+        path - 当前文件夹
+        paths - 可见的文件路径列表，按显示顺序
+    返回: JSON格式的预取队列状态
+    """
+    path = request.json.get('path', '')
+    paths = request.json.get('paths', [])
+    if not path or not is_within_base(path, BASE_DIR) or not isinstance(paths, list):
+        return jsonify({'error': '无效的参数'}), 400
+    PREFETCHER.prioritize(path, [p for p in paths if isinstance(p, str)])
+    return jsonify({'success': True, 'queued': PREFETCHER.stats()['queued']})
+
 @app.route('/preview_image', methods=['POST'])
 def preview_image():
     """
@@ -835,24 +1130,18 @@ def preview_image():
             return jsonify({'error': str(e)}), 500
     
     # 处理AVIF格式文件（使用ImageMagick获取信息）
-    if ext == 'avif':
+    if ext == 'avif' and IMAGEMAGICK_AVAILABLE:
         try:
             size = get_file_size(path)
             logger.info(f"成功获取AVIF文件大小: AVIF, {size} bytes")
             
             # 使用ImageMagick获取AVIF图片宽高
             try:
-                # 构建命令
-                if platform.system() == 'Windows':
-                    cmd = ['magick', 'identify', '-format', '%w %h', path]
-                else:
-                    # 先尝试magick命令（ImageMagick 7+）
-                    try:
-                        subprocess.run(['magick', '--version'], capture_output=True, text=True, timeout=5)
-                        cmd = ['magick', 'identify', '-format', '%w %h', path]
-                    except:
-                        # ImageMagick 6使用identify命令
-                        cmd = ['identify', '-format', '%w %h', path]
+                # 构建命令，identify命令前缀由工具链注册表解析
+                identify = TOOLCHAIN.imagemagick_command('identify')
+                if identify is None:
+                    raise RuntimeError('ImageMagick identify命令不可用')
+                cmd = identify + ['-format', '%w %h', path]
                 
                 # 执行命令
                 result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
@@ -895,6 +1184,8 @@ def preview_image():
         with Image.open(path) as img:
             width, height = img.size
             format = img.format
+            # 多页TIFF的页数（不包括缩小层级），前端据此显示页码选择
+            pages = page_count(img) if format == 'TIFF' else 1
             
             # 获取EXIF信息
             exif = {}
@@ -1145,6 +1436,7 @@ def preview_image():
             'height': height,
             'format': format,
             'size': size,
+            'pages': pages,
             'exif': exif
         })
     except Exception as e:
@@ -1187,101 +1479,80 @@ def preview_file(filepath):
     # 检查文件扩展名
     ext = os.path.splitext(full_path)[1].lower()[1:]
     
+    # 预览尺寸：悬停、网格、弹窗，默认与原来一样限制在1920x1080以内
+    variant = request.args.get('variant', DEFAULT_THUMBNAIL_VARIANT)
+    if variant not in THUMBNAIL_VARIANTS:
+        return f'不支持的预览尺寸: {variant}', 400
+    
+    # ETag由原图和预览尺寸计算，客户端缓存仍然有效时直接返回304，不生成缩略图
+    st = os.stat(full_path)
+    etag = file_etag(full_path, st, f"{variant}.{THUMBNAIL_CACHE_VERSION}")
+    response = not_modified(etag, st, PREVIEW_CACHE_CONTROL)
+    if response is not None:
+        logger.debug(f"预览未变化，返回304: {full_path}")
+        return response
+    
     # 只处理普通图片文件，PDF文件由前端直接下载
     logger.info(f"返回图片文件: {full_path}")
-    logger.debug(f"文件存在: {os.path.exists(full_path)}")
-    logger.debug(f"文件大小: {os.path.getsize(full_path)} bytes")
+    logger.debug(f"文件大小: {st.st_size} bytes")
     logger.debug(f"文件类型: {mimetypes.guess_type(full_path)[0]}")
     
     # 处理AVIF格式文件（只使用ImageMagick获取宽高，不转换）
-    if ext == 'avif':
+    if ext == 'avif' and IMAGEMAGICK_AVAILABLE:
         try:
             # 使用ImageMagick获取AVIF图片宽高信息
             logger.info(f"开始使用ImageMagick获取AVIF宽高: {full_path}")
             
-            # 构建命令
-            if platform.system() == 'Windows':
-                magick_cmd = 'magick'
-            else:
-                # 先尝试magick命令（ImageMagick 7+）
-                try:
-                    subprocess.run(['magick', '--version'], capture_output=True, text=True, timeout=5)
-                    magick_cmd = 'magick'
-                except:
-                    # ImageMagick 6使用convert命令
-                    magick_cmd = 'convert'
-            
-            # 获取图片宽高
-            identify_cmd = [magick_cmd, 'identify', '-format', '%w %h', full_path]
-            result = subprocess.run(identify_cmd, capture_output=True, text=True, timeout=10)
-            
+            # 获取图片宽高，identify命令前缀由工具链注册表解析
+            identify = TOOLCHAIN.imagemagick_command('identify')
             width = 0
             height = 0
-            if result.returncode == 0:
-                output = result.stdout.strip()
-                if output:
-                    parts = output.split()
-                    if len(parts) == 2:
-                        width = int(parts[0])
-                        height = int(parts[1])
+            if identify is None:
+                logger.warning("ImageMagick identify命令不可用，跳过获取AVIF宽高")
+            else:
+                identify_cmd = identify + ['-format', '%w %h', full_path]
+                result = subprocess.run(identify_cmd, capture_output=True, text=True, timeout=10)
+                if result.returncode == 0:
+                    output = result.stdout.strip()
+                    if output:
+                        parts = output.split()
+                        if len(parts) == 2:
+                            width = int(parts[0])
+                            height = int(parts[1])
             
             logger.info(f"成功获取AVIF图片宽高: {width}x{height}")
             
             # 直接返回原始AVIF文件，不进行转换
-            response = send_file(full_path)
+            response = send_cached_file(full_path, etag, st, PREVIEW_CACHE_CONTROL)
             logger.debug(f"send_file返回成功，响应头: {dict(response.headers)}")
             return response
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"处理AVIF文件失败: {type(e).__name__}: {str(e)}")
             return f'Image preview failed: {str(e)}', 500
     
+    # 按请求的尺寸返回缓存的缩略图
     try:
-        # 打开图片，检查分辨率
-        with Image.open(full_path) as img:
-            width, height = img.size
-            logger.info(f"图片原始分辨率: {width}x{height}")
-            
-            # 如果图片分辨率超过1920x1080，调整大小
-            if width > 1920 or height > 1080:
-                logger.info("图片分辨率超过1920x1080，需要调整大小")
-                
-                # 计算调整后的尺寸，保持原始比例
-                ratio = min(1920/width, 1080/height)
-                new_width = int(width * ratio)
-                new_height = int(height * ratio)
-                logger.info(f"调整后分辨率: {new_width}x{new_height}")
-                
-                # 调整图片大小
-                resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-                
-                # 将调整后的图片保存到内存缓冲区
-                buffer = io.BytesIO()
-                
-                # 根据原图格式选择保存格式
-                if ext in ['png', 'gif']:
-                    # PNG和GIF保持原格式
-                    resized_img.save(buffer, format=ext)
-                else:
-                    # 其他格式保存为JPEG
-                    resized_img.save(buffer, format='JPEG', quality=90)
-                
-                buffer.seek(0)
-                
-                # 返回调整后的图片
-                response = send_file(buffer, mimetype=mimetypes.guess_type(full_path)[0])
-                logger.debug(f"send_file返回成功，响应头: {dict(response.headers)}")
-                return response
-            else:
-                # 图片分辨率符合要求，直接返回原图
-                response = send_file(full_path)
-                logger.debug(f"send_file返回成功，响应头: {dict(response.headers)}")
-                return response
+        thumbnail = THUMBNAIL_CACHE.get(full_path, variant)
+        if thumbnail is None:
+            # 图片分辨率符合要求，直接返回原图
+            response = send_cached_file(full_path, etag, st, PREVIEW_CACHE_CONTROL)
+        else:
+            thumbnail_path, mimetype = thumbnail
+            response = send_cached_file(thumbnail_path, etag, st, PREVIEW_CACHE_CONTROL, mimetype=mimetype)
+        logger.debug(f"send_file返回成功，响应头: {dict(response.headers)}")
+        return response
+    except HTTPException:
+        # Range超出范围等（416）
+        raise
     except Exception as e:
         logger.error(f"处理图片失败: {type(e).__name__}: {str(e)}")
         logger.error(f"异常详情: {traceback.format_exc()}")
-        # 尝试直接返回原图，即使处理失败
+        # 尝试直接返回原图，即使处理失败；原图与缩略图内容不同，不使用预览的ETag
         try:
             response = send_file(full_path)
+            response.headers['Cache-Control'] = 'no-store'
             logger.debug(f"send_file返回成功，响应头: {dict(response.headers)}")
             return response
         except:
@@ -1292,13 +1563,15 @@ def preview_file(filepath):
 @app.route('/convert_tiff_preview')
 def convert_tiff_preview():
     """
-    将TIFF格式图片转换为PNG格式以便预览
+    将TIFF格式图片缩放并转换为浏览器可以显示的格式以便预览
     请求方法: GET
     请求参数: path - TIFF图片文件路径
-    返回: PNG格式图片内容
+            variant - 预览尺寸（hover/grid/modal），默认modal
+            page - 页码（多页TIFF，从0开始），默认0
+    返回: 缩放到预览尺寸以内的JPEG（带透明通道时为WebP）图片内容
     """
     full_path = request.args.get('path')
-    logger.info(f"转换TIFF图片为PNG，路径: {full_path}")
+    logger.info(f"转换TIFF图片预览，路径: {full_path}")
     
     # 验证文件
     if not full_path:
@@ -1307,7 +1580,7 @@ def convert_tiff_preview():
     if not os.path.isfile(full_path):
         logger.warning(f"文件不存在: {full_path}")
         return 'File not found', 404
-    if not full_path.startswith(BASE_DIR):
+    if not is_within_base(full_path, BASE_DIR):
         logger.warning(f"路径 {full_path} 不在BASE_DIR下")
         return 'File not found', 404
     if not is_image_file(full_path):
@@ -1320,30 +1593,38 @@ def convert_tiff_preview():
         logger.warning(f"只有TIFF文件支持预览转换: {full_path}")
         return '仅支持TIFF文件预览转换', 400
     
+    variant = request.args.get('variant', DEFAULT_THUMBNAIL_VARIANT)
+    if variant not in THUMBNAIL_VARIANTS:
+        return f'不支持的预览尺寸: {variant}', 400
+    page = request.args.get('page', 0, type=int)
+    if page < 0:
+        return f'无效的页码: {page}', 400
+    
+    # ETag由原图、预览尺寸和页码计算，客户端缓存仍然有效时直接返回304
+    st = os.stat(full_path)
+    etag = file_etag(full_path, st, f"tiff.{variant}.{page}.{THUMBNAIL_CACHE_VERSION}")
+    response = not_modified(etag, st, PREVIEW_CACHE_CONTROL)
+    if response is not None:
+        logger.debug(f"TIFF预览未变化，返回304: {full_path}")
+        return response
+    
     try:
-        # 打开TIFF图片并转换为PNG
-        logger.info(f"开始转换TIFF图片: {full_path}")
-        
-        with Image.open(full_path) as img:
-            # 如果是多页TIFF，只取第一页
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-                logger.info(f"将图片模式从 {img.mode} 转换为 RGB")
-            
-            # 将图片保存到内存中
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
-            
-            logger.info(f"TIFF图片转换成功: {full_path}")
-            # 返回PNG图片
-            response = send_file(buffer, mimetype='image/png')
-            logger.debug(f"send_file返回成功，响应头: {dict(response.headers)}")
-            return response
+        # 按预览尺寸缩放（有缩小层级时直接读取缩小层级），结果保存在缩略图缓存中
+        thumbnail_path, mimetype = THUMBNAIL_CACHE.get(full_path, variant, page, transcode=True)
+        logger.info(f"TIFF图片转换成功: {full_path}, 第 {page + 1} 页, {variant}")
+        response = send_cached_file(thumbnail_path, etag, st, PREVIEW_CACHE_CONTROL, mimetype=mimetype)
+        logger.debug(f"send_file返回成功，响应头: {dict(response.headers)}")
+        return response
+    except PageOutOfRange as e:
+        logger.warning(f"TIFF页码超出范围: {full_path}, {e}")
+        return str(e), 400
+    except HTTPException:
+        # Range超出范围等（416）
+        raise
     except Exception as e:
         logger.error(f"转换TIFF图片失败: {type(e).__name__}: {str(e)}")
         logger.error(f"异常详情: {traceback.format_exc()}")
-        return '转换TIFF到PNG失败', 500
+        return '转换TIFF预览失败', 500
 
 @app.route('/count_formats', methods=['POST'])
 def count_formats():
@@ -1361,6 +1642,7 @@ def count_formats():
         return jsonify({'error': '未选中任何文件或文件夹'}), 400
     
     task_id = str(uuid.uuid4())
+    cancel_event = threading.Event()
     
     with tasks_lock:
         tasks[task_id] = {
@@ -1374,6 +1656,7 @@ def count_formats():
             'error': None,
             'start_time': datetime.now().isoformat(),
             'end_time': None,
+            'cancel': cancel_event,
             'params': {
                 'selected_paths': selected_paths
             }
@@ -1384,17 +1667,18 @@ def count_formats():
         format_size = {}
         total_files = 0
         total_size = 0
-        def process_file(filepath, filename):
+        def process_file(filepath, filename, file_size=None):
             nonlocal format_count, format_size, total_files, total_size
             try:
-                if not os.path.normpath(filepath).startswith(os.path.normpath(BASE_DIR)):
+                if not is_within_base(filepath, BASE_DIR):
                     return
                     
                 ext = os.path.splitext(filename)[1][1:]
                 if not ext:
                     ext = '无扩展名'
                 
-                file_size = get_file_size(filepath)
+                if file_size is None:
+                    file_size = get_file_size(filepath)
                 format_count[ext] = format_count.get(ext, 0) + 1
                 format_size[ext] = format_size.get(ext, 0) + file_size
                 total_files += 1
@@ -1404,37 +1688,52 @@ def count_formats():
                     if task_id in tasks:
                         tasks[task_id]['progress'] = total_files
                         tasks[task_id]['current'] = filepath
+                        if total_files % PARTIAL_RESULT_INTERVAL == 0:
+                            tasks[task_id]['partial'] = count_result()
             except Exception as e:
                 logger.error(f"处理文件 {filepath} 失败: {e}", exc_info=True)
         
+        def count_result():
+            """当前的统计结果（任务运行中作为部分结果发布）"""
+            return {
+                'format_count': dict(format_count),
+                'format_size': dict(format_size),
+                'total_files': total_files,
+                'total_size': total_size
+            }
+        
         def scan_directory(dir_path):
-            stack = [dir_path]
-            while stack:
-                current_dir = stack.pop()
+            nonlocal total_files, total_size
+            if index_covers(dir_path):
+                # 直接使用索引中保存的子树汇总，只有变化过的目录需要重新汇总
+                refresh_index_if_unwatched(dir_path)
+                for ext, count, size in INDEX.format_stats(dir_path):
+                    ext = ext or '无扩展名'
+                    format_count[ext] = format_count.get(ext, 0) + count
+                    format_size[ext] = format_size.get(ext, 0) + size
+                    total_files += count
+                    total_size += size
+                with tasks_lock:
+                    if task_id in tasks:
+                        tasks[task_id]['progress'] = total_files
+                        tasks[task_id]['current'] = dir_path
+                        tasks[task_id]['partial'] = count_result()
+                return
+            for entry in walk_tree(dir_path, base_dir=BASE_DIR, max_workers=WALK_WORKERS,
+                                   should_stop=cancel_event.is_set):
+                if cancel_event.is_set():
+                    break
                 try:
-                    with os.scandir(current_dir) as entries:
-                        for entry in entries:
-                            try:
-                                if entry.name.startswith('.'):
-                                    continue
-                                    
-                                entry_path = entry.path
-                                
-                                if not os.path.normpath(entry_path).startswith(os.path.normpath(BASE_DIR)):
-                                    continue
-                                    
-                                if entry.is_dir(follow_symlinks=False):
-                                    stack.append(entry_path)
-                                elif entry.is_file(follow_symlinks=False):
-                                    process_file(entry_path, entry.name)
-                            except Exception as e:
-                                logger.error(f"处理条目 {entry.path} 失败: {e}", exc_info=True)
+                    # 使用scandir缓存的stat结果，避免再次stat
+                    process_file(entry.path, entry.name, entry.stat(follow_symlinks=False).st_size)
                 except Exception as e:
-                    logger.error(f"扫描目录 {current_dir} 失败: {e}", exc_info=True)
+                    logger.error(f"处理条目 {entry.path} 失败: {e}", exc_info=True)
         
         try:
             for path in selected_paths:
-                if not os.path.normpath(path).startswith(os.path.normpath(BASE_DIR)):
+                if cancel_event.is_set():
+                    break
+                if not is_within_base(path, BASE_DIR):
                     continue
                     
                 if os.path.isdir(path):
@@ -1447,13 +1746,9 @@ def count_formats():
             
             with tasks_lock:
                 if task_id in tasks:
-                    tasks[task_id]['status'] = 'completed'
-                    tasks[task_id]['result'] = {
-                        'format_count': format_count,
-                        'format_size': format_size,
-                        'total_files': total_files,
-                        'total_size': total_size
-                    }
+                    tasks[task_id]['status'] = completed_status(tasks[task_id])
+                    tasks[task_id]['result'] = count_result()
+                    tasks[task_id]['partial'] = None
                     tasks[task_id]['end_time'] = datetime.now().isoformat()
         except Exception as e:
             logger.error(f"统计文件格式失败: {e}")
@@ -1485,6 +1780,7 @@ def fix_extensions():
         return jsonify({'error': '未选中任何文件或文件夹'}), 400
     
     task_id = str(uuid.uuid4())
+    cancel_event = threading.Event()
     
     with tasks_lock:
         tasks[task_id] = {
@@ -1498,6 +1794,7 @@ def fix_extensions():
             'error': None,
             'start_time': datetime.now().isoformat(),
             'end_time': None,
+            'cancel': cancel_event,
             'params': {
                 'selected_paths': selected_paths
             }
@@ -1507,54 +1804,54 @@ def fix_extensions():
         processed = 0
         skipped_files = []
         failed_files = []
+        # 被重命名的原路径，完成后删除其压缩记录
+        renamed_files = []
         def process_directory(directory_path):
             nonlocal processed, skipped_files, failed_files
-            stack = [directory_path]
-            while stack:
-                current_dir = stack.pop()
+            for entry in walk_tree(directory_path, base_dir=BASE_DIR, max_workers=WALK_WORKERS,
+                                   should_stop=cancel_event.is_set):
+                if cancel_event.is_set():
+                    break
                 try:
-                    with os.scandir(current_dir) as entries:
-                        for entry in entries:
-                            if entry.name.startswith('.'):
-                                continue
-                            if entry.is_dir(follow_symlinks=False):
-                                stack.append(entry.path)
-                            elif entry.is_file(follow_symlinks=False):
-                                try:
-                                    name_without_ext, ext = os.path.splitext(entry.name)
-                                    ext_lower = ext.lower()
-                                    needs_fix = any(c.isupper() for c in ext[1:]) or ext_lower == '.jpeg'
-                                    
-                                    if needs_fix:
-                                        old_path = entry.path
-                                        new_ext = '.jpg' if ext_lower == '.jpeg' else ext_lower
-                                        new_name = f"{name_without_ext}{new_ext}"
-                                        new_path = os.path.join(os.path.dirname(old_path), new_name)
-                                        
-                                        if os.path.exists(new_path):
-                                            skipped_files.append(old_path)
-                                            with tasks_lock:
-                                                if task_id in tasks:
-                                                    tasks[task_id]['progress'] = processed + len(skipped_files)
-                                                    tasks[task_id]['current'] = old_path
-                                            continue
-                                        
-                                        os.rename(old_path, new_path)
-                                        logger.info(f"重命名文件: {old_path} -> {new_path}")
-                                        processed += 1
-                                        with tasks_lock:
-                                            if task_id in tasks:
-                                                tasks[task_id]['progress'] = processed
-                                                tasks[task_id]['current'] = new_path
-                                except Exception as e:
-                                    failed_file = entry.path
-                                    failed_files.append({'path': failed_file, 'error': str(e)})
-                                    logger.error(f"处理文件失败: {failed_file}, 错误: {e}")
+                    name_without_ext, ext = os.path.splitext(entry.name)
+                    ext_lower = ext.lower()
+                    needs_fix = any(c.isupper() for c in ext[1:]) or ext_lower == '.jpeg'
+                    
+                    if needs_fix:
+                        old_path = entry.path
+                        new_ext = '.jpg' if ext_lower == '.jpeg' else ext_lower
+                        new_name = f"{name_without_ext}{new_ext}"
+                        new_path = os.path.join(os.path.dirname(old_path), new_name)
+                        
+                        if os.path.exists(new_path):
+                            skipped_files.append(old_path)
+                            with tasks_lock:
+                                if task_id in tasks:
+                                    tasks[task_id]['progress'] = processed + len(skipped_files)
+                                    tasks[task_id]['current'] = old_path
+                            continue
+                        
+                        os.rename(old_path, new_path)
+                        renamed_files.append(old_path)
+                        logger.info(f"重命名文件: {old_path} -> {new_path}")
+                        processed += 1
+                        with tasks_lock:
+                            if task_id in tasks:
+                                tasks[task_id]['progress'] = processed
+                                tasks[task_id]['current'] = new_path
                 except Exception as e:
-                    logger.error(f"扫描目录 {current_dir} 失败: {e}")
+                    failed_file = entry.path
+                    failed_files.append({'path': failed_file, 'error': str(e)})
+                    logger.error(f"处理文件失败: {failed_file}, 错误: {e}")
         
         try:
             for path in selected_paths:
+                if cancel_event.is_set():
+                    break
+                if not is_within_base(path, BASE_DIR):
+                    logger.warning(f"路径 {path} 不在BASE_DIR {BASE_DIR} 范围内，跳过处理")
+                    continue
+                
                 if os.path.isdir(path):
                     process_directory(path)
                 elif os.path.isfile(path):
@@ -1577,6 +1874,7 @@ def fix_extensions():
                                     skipped_files.append(path)
                                 else:
                                     os.rename(path, new_path)
+                                    renamed_files.append(path)
                                     logger.info(f"重命名文件: {path} -> {new_path}")
                                     processed += 1
                                     with tasks_lock:
@@ -1588,9 +1886,11 @@ def fix_extensions():
                         logger.error(f"处理文件失败: {path}, 错误: {e}")
             
             logger.info(f"修复完成，共处理 {processed} 个文件，跳过 {len(skipped_files)} 个文件，失败 {len(failed_files)} 个文件")
+            LEDGER.forget(renamed_files)
+            refresh_index(selected_paths)
             with tasks_lock:
                 if task_id in tasks:
-                    tasks[task_id]['status'] = 'completed'
+                    tasks[task_id]['status'] = completed_status(tasks[task_id])
                     tasks[task_id]['result'] = {
                         'processed': processed,
                         'skipped_files': skipped_files,
@@ -1616,14 +1916,19 @@ def search_files():
     """
     搜索文件
     请求方法: POST
-    请求参数: selected_paths - 要搜索的文件或文件夹路径列表，pattern - 搜索模式，is_regex - 是否使用正则表达式，case_sensitive - 是否区分大小写
-    返回: JSON格式的结果，包括任务ID和任务类型，前端根据taskId轮询任务状态
+    请求参数: selected_paths - 要搜索的文件或文件夹路径列表，pattern - 搜索模式，is_regex - 是否使用正则表达式，case_sensitive - 是否区分大小写，
+             limit - 最多返回的匹配文件数，默认不限制
+    返回: JSON格式的结果，包括任务ID和任务类型，前端通过/stream_task流式获取匹配结果，或根据taskId轮询任务状态
     """
     selected_paths = request.json.get('selected_paths', [])
     pattern = request.json.get('pattern', '')
     is_regex = request.json.get('is_regex', False)
     case_sensitive = request.json.get('case_sensitive', False)
-    logger.info(f"开始搜索文件，选中路径: {selected_paths}，模式: {pattern}，正则: {is_regex}，区分大小写: {case_sensitive}")
+    try:
+        limit = int(request.json.get('limit') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': '无效的结果数量上限'}), 400
+    logger.info(f"开始搜索文件，选中路径: {selected_paths}，模式: {pattern}，正则: {is_regex}，区分大小写: {case_sensitive}，上限: {limit or '不限制'}")
     
     if not selected_paths:
         logger.warning("未选中任何文件或文件夹")
@@ -1634,6 +1939,9 @@ def search_files():
         return jsonify({'error': '未指定搜索模式'}), 400
     
     task_id = str(uuid.uuid4())
+    cancel_event = threading.Event()
+    # 匹配结果分块保存，任务运行中即可读取
+    results = ResultChunks(limit)
     
     with tasks_lock:
         tasks[task_id] = {
@@ -1647,14 +1955,36 @@ def search_files():
             'error': None,
             'start_time': datetime.now().isoformat(),
             'end_time': None,
+            'cancel': cancel_event,
+            'results': results,
             'params': {
                 'selected_paths': selected_paths,
                 'pattern': pattern,
                 'is_regex': is_regex,
-                'case_sensitive': case_sensitive
+                'case_sensitive': case_sensitive,
+                'limit': limit
             }
         }
     
+    def should_stop():
+        """取消任务，或达到结果数量上限后又找到匹配文件（结果已截断）时停止搜索"""
+        return cancel_event.is_set() or results.truncated
+    
+    def add_match(file, file_path, size, ext, current):
+        """保存一个匹配结果并更新进度，需要停止搜索时返回False"""
+        if not results.append({
+            "name": file,
+            "path": file_path,
+            "size": size,
+            "ext": ext or 'unknown'
+        }):
+            return False
+        with tasks_lock:
+            if task_id in tasks:
+                tasks[task_id]['progress'] = results.total
+                tasks[task_id]['current'] = current
+        return not cancel_event.is_set()
+    
     def run_search_task():
         try:
             if is_regex:
@@ -1665,43 +1995,54 @@ def search_files():
                 flags = 0 if case_sensitive else re.IGNORECASE
                 regex = re.compile(escaped_pattern, flags)
             
-            matched_files = []
+            # 模式中必然出现的三元组，为None时（没有可用的字面量）只能逐个匹配文件名
+            grams = required_trigrams(pattern, is_regex) if FILENAME_INDEX is not None else None
+            if FILENAME_INDEX is not None and grams is None:
+                FILENAME_INDEX.record_fallback()
             
             def scan_directory_for_files(dir_path):
-                nonlocal matched_files
-                stack = [dir_path]
-                while stack:
-                    current_dir = stack.pop()
-                    try:
-                        with os.scandir(current_dir) as entries:
-                            for entry in entries:
-                                if entry.name.startswith('.'):
-                                    continue
-                                if entry.is_dir(follow_symlinks=False):
-                                    stack.append(entry.path)
-                                elif entry.is_file(follow_symlinks=False):
-                                    file = entry.name
-                                    file_path = entry.path
-                                    if regex.search(file):
-                                        try:
-                                            size = entry.stat().st_size
-                                            ext = os.path.splitext(file)[1].lstrip('.') or 'unknown'
-                                            matched_files.append({
-                                                "name": file,
-                                                "path": file_path,
-                                                "size": size,
-                                                "ext": ext
-                                            })
-                                            with tasks_lock:
-                                                if task_id in tasks:
-                                                    tasks[task_id]['progress'] = len(matched_files)
-                                                    tasks[task_id]['current'] = file_path
-                                        except Exception as e:
-                                            logger.error(f"获取文件信息失败: {file_path}, 错误: {str(e)}")
-                    except Exception as e:
-                        logger.error(f"扫描目录 {current_dir} 失败: {e}")
+                if index_covers(dir_path):
+                    # 文件名索引由元数据索引的变更通知更新，刷新元数据索引后两者都包含新创建的文件
+                    refresh_index_if_unwatched(dir_path)
+                if grams is not None and FILENAME_INDEX.covers(dir_path):
+                    # 在文件名索引中取得候选文件，只对候选执行正则匹配
+                    for file_path, file, size in FILENAME_INDEX.candidates(grams, dir_path):
+                        if regex.search(file):
+                            if not add_match(file, file_path, size, os.path.splitext(file)[1].lstrip('.'), dir_path):
+                                return
+                        elif cancel_event.is_set():
+                            return
+                    return
+                if index_covers(dir_path):
+                    # 在索引中按文件名匹配
+                    for file_path, file, ext, size, _ in INDEX.files_under(dir_path):
+                        if regex.search(file):
+                            if not add_match(file, file_path, size, ext, dir_path):
+                                return
+                        elif cancel_event.is_set():
+                            return
+                    return
+                for entry in walk_tree(dir_path, base_dir=BASE_DIR, max_workers=WALK_WORKERS, should_stop=should_stop):
+                    file = entry.name
+                    file_path = entry.path
+                    if regex.search(file):
+                        try:
+                            size = entry.stat(follow_symlinks=False).st_size
+                        except Exception as e:
+                            logger.error(f"获取文件信息失败: {file_path}, 错误: {str(e)}")
+                            continue
+                        if not add_match(file, file_path, size, os.path.splitext(file)[1].lstrip('.'), file_path):
+                            return
+                    elif cancel_event.is_set():
+                        return
             
             for path in selected_paths:
+                if should_stop():
+                    break
+                if not is_within_base(path, BASE_DIR):
+                    logger.warning(f"路径 {path} 不在BASE_DIR {BASE_DIR} 范围内，跳过搜索")
+                    continue
+                
                 if os.path.isdir(path):
                     scan_directory_for_files(path)
                 elif os.path.isfile(path):
@@ -1709,21 +2050,19 @@ def search_files():
                     if regex.search(file):
                         try:
                             size = os.path.getsize(path)
-                            ext = os.path.splitext(file)[1].lstrip('.') or 'unknown'
-                            matched_files.append({
-                                "name": file,
-                                "path": path,
-                                "size": size,
-                                "ext": ext
-                            })
                         except Exception as e:
                             logger.error(f"获取文件信息失败: {path}, 错误: {str(e)}")
+                            continue
+                        add_match(file, path, size, os.path.splitext(file)[1].lstrip('.'), path)
             
-            logger.info(f"搜索完成，找到 {len(matched_files)} 个匹配文件")
+            # 按路径排序（与文件列表相同的拼音+自然排序），正在流式读取的客户端改为按排序后的结果重新读取
+            results.reorder(lambda items: SORT_KEYS.sort_paths(items, key=lambda item: item['path']))
+            summary = results.summary()
+            logger.info(f"搜索完成，找到 {summary['total']} 个匹配文件{'（已达到上限）' if summary['truncated'] else ''}")
             with tasks_lock:
                 if task_id in tasks:
-                    tasks[task_id]['status'] = 'completed'
-                    tasks[task_id]['result'] = {"success": True, "files": matched_files, "total": len(matched_files)}
+                    tasks[task_id]['status'] = completed_status(tasks[task_id])
+                    tasks[task_id]['result'] = dict(summary, success=True)
                     tasks[task_id]['end_time'] = datetime.now().isoformat()
         except Exception as e:
             logger.error(f"搜索文件失败: {e}")
@@ -1732,6 +2071,8 @@ def search_files():
                     tasks[task_id]['status'] = 'failed'
                     tasks[task_id]['error'] = str(e)
                     tasks[task_id]['end_time'] = datetime.now().isoformat()
+        finally:
+            results.close()
     
     thread = threading.Thread(target=run_search_task)
     thread.daemon = True
@@ -1770,6 +2111,8 @@ def delete_file():
     try:
         os.remove(file_path)
         logger.info(f"已成功删除文件: {file_path}")
+        LEDGER.forget([file_path])
+        refresh_index([file_path])
         return jsonify({"success": True})
     except Exception as e:
         logger.error(f"删除文件失败: {file_path}, 错误: {str(e)}")
@@ -1796,6 +2139,7 @@ def delete_files_by_format():
         return jsonify({'error': '未指定要删除的文件格式'}), 400
     
     task_id = str(uuid.uuid4())
+    cancel_event = threading.Event()
     
     with tasks_lock:
         tasks[task_id] = {
@@ -1809,6 +2153,7 @@ def delete_files_by_format():
             'error': None,
             'start_time': datetime.now().isoformat(),
             'end_time': None,
+            'cancel': cancel_event,
             'params': {
                 'selected_paths': selected_paths,
                 'format': format
@@ -1820,7 +2165,9 @@ def delete_files_by_format():
         deleted_files = []
         try:
             for path in selected_paths:
-                if not os.path.normpath(path).startswith(os.path.normpath(BASE_DIR)):
+                if cancel_event.is_set():
+                    break
+                if not is_within_base(path, BASE_DIR):
                     logger.warning(f"路径 {path} 不在BASE_DIR {BASE_DIR} 范围内，跳过处理")
                     continue
                     
@@ -1829,38 +2176,28 @@ def delete_files_by_format():
                     
                     def scan_directory_for_deletion(dir_path):
                         nonlocal deleted_count, deleted_files
-                        stack = [dir_path]
-                        while stack:
-                            current_dir = stack.pop()
-                            try:
-                                with os.scandir(current_dir) as entries:
-                                    for entry in entries:
-                                        if entry.is_dir(follow_symlinks=False):
-                                            stack.append(entry.path)
-                                        elif entry.is_file(follow_symlinks=False):
-                                            filepath = entry.path
-                                            if not os.path.normpath(filepath).startswith(os.path.normpath(BASE_DIR)):
-                                                logger.warning(f"文件路径 {filepath} 不在BASE_DIR {BASE_DIR} 范围内，跳过删除")
-                                                continue
-                                            
-                                            if entry.name.startswith('.'):
-                                                continue
-                                            
-                                            file_ext = os.path.splitext(entry.name)[1][1:]
-                                            if not file_ext:
-                                                file_ext = '无扩展名'
-                                            
-                                            if file_ext == format:
-                                                os.remove(filepath)
-                                                deleted_count += 1
-                                                deleted_files.append(filepath)
-                                                logger.info(f"删除文件: {filepath}")
-                                                with tasks_lock:
-                                                    if task_id in tasks:
-                                                        tasks[task_id]['progress'] = deleted_count
-                                                        tasks[task_id]['current'] = filepath
-                            except Exception as e:
-                                logger.error(f"扫描目录 {current_dir} 失败: {e}")
+                        for entry in walk_tree(dir_path, base_dir=BASE_DIR, max_workers=WALK_WORKERS,
+                                               should_stop=cancel_event.is_set):
+                            if cancel_event.is_set():
+                                break
+                            filepath = entry.path
+                            file_ext = os.path.splitext(entry.name)[1][1:]
+                            if not file_ext:
+                                file_ext = '无扩展名'
+                            
+                            if file_ext == format:
+                                try:
+                                    os.remove(filepath)
+                                except Exception as e:
+                                    logger.error(f"删除文件失败: {filepath}, 错误: {e}")
+                                    continue
+                                deleted_count += 1
+                                deleted_files.append(filepath)
+                                logger.info(f"删除文件: {filepath}")
+                                with tasks_lock:
+                                    if task_id in tasks:
+                                        tasks[task_id]['progress'] = deleted_count
+                                        tasks[task_id]['current'] = filepath
                     
                     scan_directory_for_deletion(path)
                 elif os.path.isfile(path):
@@ -1881,9 +2218,11 @@ def delete_files_by_format():
                                 tasks[task_id]['current'] = path
             
             logger.info(f"删除完成，共删除 {deleted_count} 个文件")
+            LEDGER.forget(deleted_files)
+            refresh_index(selected_paths)
             with tasks_lock:
                 if task_id in tasks:
-                    tasks[task_id]['status'] = 'completed'
+                    tasks[task_id]['status'] = completed_status(tasks[task_id])
                     tasks[task_id]['result'] = {
                         'deleted_count': deleted_count,
                         'deleted_files': deleted_files
@@ -1912,7 +2251,15 @@ def compress_images():
         selected_paths - 要压缩的文件或文件夹路径列表
         quality - 压缩质量，1-100，默认80
         min_size - 最小文件大小，小于此大小的文件将被跳过，默认0字节
-        max_workers - 最大线程数，默认4
+        max_workers - 最大线程数，默认根据容器可用CPU自动计算，实际并发由调度器按吞吐量和负载调整
+        codec_backend - 编解码后端，字符串（pillow/subprocess）或按格式指定的字典，默认使用配置
+        batch_mode - 是否把ImageMagick调用合并为批处理（mogrify），默认使用配置
+        execution_engine - 进程内编码的执行引擎，process（进程池）或thread（线程），默认使用配置
+        skip_optimized - 是否跳过已经以相同或更低质量压缩过且未变化的文件，以及已知压缩失败的文件，默认使用配置
+        quality_mode - 质量模式：fixed（固定质量，默认）、target_size（每张图片不超过target_size_kb的最高质量）、
+                       perceptual（PSNR不低于min_psnr的最低质量），后两种模式下quality为搜索的最高质量
+        target_size_kb - target_size模式的目标大小，单位KB
+        min_psnr - perceptual模式的PSNR下限，单位dB，默认40
     返回: JSON格式的压缩结果，包括状态
     """
     global progress_data
@@ -1920,16 +2267,53 @@ def compress_images():
     selected_paths = request.json.get('selected_paths', [])
     quality = request.json.get('quality', 80)
     min_size = request.json.get('min_size', 0)
-    max_workers = request.json.get('max_workers', 4)
+    max_workers = SCHEDULER.workers_for(request.json.get('max_workers'))
+    codec_backend = request.json.get('codec_backend')
+    batch_mode = request.json.get('batch_mode', IMAGEMAGICK_BATCH)
+    execution_engine = request.json.get('execution_engine')
+    skip_optimized = request.json.get('skip_optimized', COMPRESS_LEDGER)
+    quality_mode = request.json.get('quality_mode', MODE_FIXED)
+    target_size_kb = request.json.get('target_size_kb')
+    min_psnr = request.json.get('min_psnr', DEFAULT_MIN_PSNR)
     
-    logger.info(f"开始压缩图片，选中路径: {selected_paths}, 质量: {quality}, 最小大小: {min_size}, 最大线程数: {max_workers}")
+    logger.info(f"开始压缩图片，选中路径: {selected_paths}, 质量: {quality}, 最小大小: {min_size}, 最大线程数: {max_workers}, 编解码后端: {codec_backend}, 质量模式: {quality_mode}")
     
     if not selected_paths:
         logger.warning("未选中任何文件或文件夹")
         return jsonify({'error': '未选中任何文件或文件夹'}), 400
     
-    # 检查ImageMagick是否可用
-    if not IMAGEMAGICK_AVAILABLE:
+    # 检查质量模式参数
+    if quality_mode not in SEARCH_MODES:
+        logger.warning(f"不支持的质量模式: {quality_mode}")
+        return jsonify({'error': f'不支持的质量模式: {quality_mode}'}), 400
+    target_bytes = None
+    if quality_mode == MODE_TARGET_SIZE:
+        try:
+            target_bytes = int(float(target_size_kb) * 1024)
+        except (TypeError, ValueError):
+            target_bytes = 0
+        if target_bytes <= 0:
+            logger.warning(f"目标大小无效: {target_size_kb}")
+            return jsonify({'error': '目标大小无效'}), 400
+    
+    # 压缩记录中与质量模式一起保存的目标：目标字节数或PSNR下限
+    if quality_mode == MODE_TARGET_SIZE:
+        ledger_target = target_bytes
+    elif quality_mode == MODE_PERCEPTUAL:
+        try:
+            ledger_target = min_psnr = float(min_psnr)
+        except (TypeError, ValueError):
+            logger.warning(f"PSNR下限无效: {min_psnr}")
+            return jsonify({'error': 'PSNR下限无效'}), 400
+    else:
+        ledger_target = None
+    
+    # 检查ImageMagick是否可用（所有可压缩格式都使用pillow后端时不需要ImageMagick）
+    needs_imagemagick = any(
+        select_codec_backend(ext, codec_backend).name == FALLBACK_BACKEND
+        for ext in COMPRESSIBLE_FORMATS
+    )
+    if needs_imagemagick and not IMAGEMAGICK_AVAILABLE:
         logger.error("ImageMagick不可用，无法压缩图片")
         return jsonify({'error': 'ImageMagick不可用'}), 500
     
@@ -1946,11 +2330,14 @@ def compress_images():
             'current_file': '',
             'failed_files': [],
             'skipped_files': [],
+            'ledger_skipped': 0,  # 根据压缩记录跳过的文件数
+            'quality_mode': quality_mode,
+            'quality_results': [],  # 质量搜索结果：每个文件选中的质量和编码次数
             'task_type': 'compress',
             'target_format': ''
         }
     
-    # 获取所有图片文件
+    # 获取所有图片文件（文件记录带扫描时的大小和mtime，之后过滤、压缩和统计都不再stat原文件）
     all_images = []
     total_selected = 0
     for path in selected_paths:
@@ -1961,7 +2348,7 @@ def compress_images():
             total_selected += len(dir_images)
         elif os.path.isfile(path) and is_image_file(path):
             logger.info(f"添加图片: {path}")
-            all_images.append(path)
+            all_images.append(FileRecord.from_path(path))
             total_selected += 1
     
     logger.info(f"共找到 {len(all_images)} 个图片文件")
@@ -1970,7 +2357,7 @@ def compress_images():
     ignored_count = 0
     if min_size > 0:
         original_count = len(all_images)
-        filtered_images = [img for img in all_images if get_file_size(img) > min_size]
+        filtered_images = [record for record in all_images if record.size > min_size]
         ignored_count = original_count - len(filtered_images)
         logger.info(f"过滤后剩余 {len(filtered_images)} 个图片文件，忽略了 {ignored_count} 个小于最小大小的文件")
         all_images = filtered_images
@@ -1993,11 +2380,12 @@ def compress_images():
         return jsonify({'status': 'started'})
     
     # 处理图片
-    def process_image(img_path):
+    def process_image(record):
         """
         处理单个图片压缩
         """
         global progress_data
+        img_path = record.path
         try:
             # 检查是否需要停止处理
             with stop_lock:
@@ -2007,47 +2395,143 @@ def compress_images():
                         progress_data['processed'] += 1
                     return
             
-            # 检查文件扩展名，如果是PDF则跳过压缩
-            ext = os.path.splitext(img_path)[1].lower()[1:]
-            if ext == 'pdf':
-                logger.info(f"跳过PDF文件压缩: {img_path}")
-                with progress_lock:
-                    progress_data['processed'] += 1
+            # 检查文件扩展名，如果是PDF则跳过压缩
+            if record.ext == 'pdf':
+                logger.info(f"跳过PDF文件压缩: {img_path}")
+                with progress_lock:
+                    progress_data['processed'] += 1
+                return
+            
+            # 已压缩且未变化的文件、已知压缩失败的文件直接跳过
+            if skip_by_ledger(record):
+                return
+            
+            logger.info(f"压缩图片: {img_path}")
+            
+            # 更新当前正在处理的图片路径
+            with progress_lock:
+                progress_data['current_file'] = img_path
+            
+            # 使用统一压缩函数（会自动选择合适的压缩工具）
+            # 按格式类别（重/轻）获取并发名额
+            if quality_mode == MODE_FIXED:
+                with SCHEDULER.slot(img_path):
+                    result = compress_image(img_path, quality, codec_backend, execution_engine)
+                record_compress_result(record, result, compress_tool_name(img_path, codec_backend))
+            else:
+                # 按图片搜索质量
+                with SCHEDULER.slot(img_path):
+                    result, chosen_quality, attempts, used_mode = compress_image_search(
+                        img_path, quality, quality_mode, target_bytes, min_psnr, execution_engine
+                    )
+                with progress_lock:
+                    progress_data['quality_results'].append({
+                        'file': img_path,
+                        'quality': chosen_quality,
+                        'attempts': attempts
+                    })
+                if used_mode == MODE_FIXED:
+                    # 回退到subprocess后端按固定质量压缩，没有进行质量搜索，按固定质量记录
+                    record_compress_result(
+                        record, result, compress_tool_name(img_path, FALLBACK_BACKEND), chosen_quality, MODE_FIXED
+                    )
+                else:
+                    record_compress_result(record, result, 'pillow', chosen_quality)
+        except Exception as e:
+            logger.error(f"处理图片失败: {img_path}, 错误: {e}")
+            with progress_lock:
+                progress_data['processed'] += 1
+    
+    def skip_by_ledger(record):
+        """
+        根据压缩记录判断是否跳过该图片，跳过时更新进度数据
+        """
+        if not skip_optimized:
+            return False
+        reason = LEDGER.check(record.path, quality, record.state, quality_mode, ledger_target)
+        if reason is None:
+            return False
+        logger.info(f"根据压缩记录跳过图片（{reason}）: {record.path}")
+        with progress_lock:
+            progress_data['processed'] += 1
+            progress_data['ledger_skipped'] += 1
+            progress_data['skipped_files'].append(record.path)
+        return True
+    
+    def record_compress_result(record, result, tool, used_quality=None, used_mode=None):
+        """
+        记录单个图片的压缩结果到进度数据和压缩记录
+        used_mode为实际使用的质量模式，未指定时为任务的质量模式；固定质量模式不记录搜索目标
+        原大小使用扫描时的大小；压缩记录只写入编解码后端返回的实际状态，未知时由压缩记录重新stat，
+        不使用扫描时的状态，避免扫描后被原地覆盖的文件以过期状态记录
+        """
+        img_path = record.path
+        original_size = record.size
+        if result:
+            state = (result.size, result.mtime_ns) if result.mtime_ns is not None else None
+            mode = used_mode or quality_mode
+            target = ledger_target if mode != MODE_FIXED else None
+            LEDGER.record_success(img_path, used_quality or quality, tool, state, mode, target)
+            final_size = state[0] if state else get_file_size(img_path)
+            logger.info(f"压缩完成: {img_path}, 原大小: {original_size} bytes, 新大小: {final_size} bytes")
+            with progress_lock:
+                progress_data['processed'] += 1
+                progress_data['original_size'] += original_size
+                progress_data['final_size'] += final_size
+        else:
+            final_size = original_size
+            logger.error(f"压缩失败: {img_path}")
+            LEDGER.record_failure(img_path, f"{tool}压缩失败")
+            with progress_lock:
+                progress_data['processed'] += 1
+                progress_data['original_size'] += original_size
+                progress_data['final_size'] += final_size
+                progress_data['failed_files'].append(img_path)
+    
+    def process_image_batch(records):
+        """
+        使用一次ImageMagick调用压缩一批图片，并把结果归属到每个文件
+        """
+        try:
+            # 检查是否需要停止处理
+            with stop_lock:
+                if stop_processing_flag:
+                    logger.info(f"停止处理，跳过 {len(records)} 个图片")
+                    with progress_lock:
+                        progress_data['processed'] += len(records)
+                    return
+            
+            # 已压缩且未变化的文件、已知压缩失败的文件直接跳过
+            records = [record for record in records if not skip_by_ledger(record)]
+            if not records:
                 return
             
-            logger.info(f"压缩图片: {img_path}")
-            
             # 更新当前正在处理的图片路径
             with progress_lock:
-                progress_data['current_file'] = img_path
-            
-            original_size = get_file_size(img_path)
+                progress_data['current_file'] = records[0].path
             
-            # 使用统一压缩函数（会自动选择合适的压缩工具）
-            if compress_image(img_path, quality):
-                final_size = get_file_size(img_path)
-                logger.info(f"压缩完成: {img_path}, 原大小: {original_size} bytes, 新大小: {final_size} bytes")
-                with progress_lock:
-                    progress_data['processed'] += 1
-                    progress_data['original_size'] += original_size
-                    progress_data['final_size'] += final_size
-            else:
-                final_size = original_size
-                logger.error(f"压缩失败: {img_path}")
-                with progress_lock:
-                    progress_data['processed'] += 1
-                    progress_data['original_size'] += original_size
-                    progress_data['final_size'] += final_size
-                    progress_data['failed_files'].append(img_path)
+            with SCHEDULER.slot(kind='light'):
+                results = CODEC_BACKENDS[FALLBACK_BACKEND].compress_batch([record.path for record in records], quality)
+            for record in records:
+                record_compress_result(record, results.get(record.path, FAILED), 'imagemagick')
         except Exception as e:
-            logger.error(f"处理图片失败: {img_path}, 错误: {e}")
+            logger.error(f"批量处理图片失败: {records[0].path} 等 {len(records)} 个文件, 错误: {e}")
             with progress_lock:
-                progress_data['processed'] += 1
+                progress_data['processed'] += len(records)
+    
+    # 需要调用ImageMagick的图片合并成批处理，其余逐个处理（质量搜索模式逐个处理）
+    if batch_mode and quality_mode == MODE_FIXED:
+        image_batches, single_images = split_imagemagick_batch(
+            all_images,
+            lambda path: uses_imagemagick_compress(path, codec_backend)
+        )
+    else:
+        image_batches, single_images = [], all_images
     
     # 在新线程中处理图片，避免阻塞主线程
     def 	process_images_async():
         # 使用多线程处理
-        logger.info(f"使用 {max_workers} 个线程开始处理图片")
+        logger.info(f"使用 {max_workers} 个线程开始处理图片，批处理 {len(image_batches)} 批，逐个处理 {len(single_images)} 个")
         
         # 检查是否需要停止处理
         def should_stop():
@@ -2067,14 +2551,16 @@ def compress_images():
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
             # 提交任务并检查停止标记
             futures = []
-            for path in all_images:
+            work_items = [(process_image_batch, batch) for batch in image_batches]
+            work_items += [(process_image, record) for record in single_images]
+            for func, item in work_items:
                 # 检查是否需要停止处理
                 if should_stop():
                     logger.info("收到停止请求，不再提交新任务")
                     break
                 
-                # 提交单个任务
-                future = executor.submit(process_image, path)
+                # 提交单个任务（单个图片或一批图片）
+                future = executor.submit(func, item)
                 futures.append(future)
             
             # 等待所有已提交的任务完成
@@ -2085,6 +2571,8 @@ def compress_images():
                     logger.error(f"处理图片时发生异常: {e}")
         
         logger.info("图片处理完成或已停止")
+        # 压缩可能原地修改文件（目录mtime不变），强制重新扫描文件所在的目录
+        refresh_index([record.path for record in all_images], force=True)
         with progress_lock:
             progress_data['status'] = 'completed'
             progress_data['end_time'] = datetime.now().isoformat()
@@ -2111,7 +2599,10 @@ def convert_images():
         selected_paths - 要转换的文件或文件夹路径列表
         target_format - 目标格式，例如 jpg, png, webp 等
         quality - 转换质量，1-100，默认99
-        max_workers - 最大线程数，默认4
+        max_workers - 最大线程数，默认根据容器可用CPU自动计算，实际并发由调度器按吞吐量和负载调整
+        codec_backend - 编解码后端，字符串（pillow/subprocess）或按格式指定的字典，默认使用配置
+        batch_mode - 是否把ImageMagick调用合并为批处理（mogrify -format），默认使用配置
+        execution_engine - 进程内编码的执行引擎，process（进程池）或thread（线程），默认使用配置
     返回: JSON格式的转换结果，包括状态
     """
     global progress_data
@@ -2119,20 +2610,29 @@ def convert_images():
     selected_paths = request.json.get('selected_paths', [])
     target_format = request.json.get('target_format', 'jpg')
     quality = request.json.get('quality', 99)
-    max_workers = request.json.get('max_workers', 4)
+    max_workers = SCHEDULER.workers_for(request.json.get('max_workers'))
     skip_pdf = request.json.get('skip_pdf', False)
+    codec_backend = request.json.get('codec_backend')
+    batch_mode = request.json.get('batch_mode', IMAGEMAGICK_BATCH)
+    execution_engine = request.json.get('execution_engine')
     
-    logger.info(f"开始转换图片格式，选中路径: {selected_paths}, 目标格式: {target_format}, 质量: {quality}, 最大线程数: {max_workers}, 跳过PDF: {skip_pdf}")
+    logger.info(f"开始转换图片格式，选中路径: {selected_paths}, 目标格式: {target_format}, 质量: {quality}, 最大线程数: {max_workers}, 跳过PDF: {skip_pdf}, 编解码后端: {codec_backend}")
     
     if not selected_paths:
         logger.warning("未选中任何文件或文件夹")
         return jsonify({'error': '未选中任何文件或文件夹'}), 400
     
-    # 检查ImageMagick是否可用
-    if not IMAGEMAGICK_AVAILABLE:
+    # 检查ImageMagick是否可用（目标格式使用pillow后端时不需要ImageMagick）
+    target_backend = select_codec_backend(target_format, codec_backend)
+    if target_backend.name == FALLBACK_BACKEND and not IMAGEMAGICK_AVAILABLE:
         logger.error("ImageMagick不可用，无法转换图片")
         return jsonify({'error': 'ImageMagick不可用'}), 500
-    
+
+    # 检查ImageMagick是否编译了目标格式的编码器
+    if target_backend.name == FALLBACK_BACKEND and not TOOLCHAIN.can_write(target_format):
+        logger.error(f"ImageMagick不支持写入目标格式: {target_format}")
+        return jsonify({'error': f'ImageMagick不支持写入{target_format}格式'}), 400
+
     # 检查是否包含PDF文件且目标格式不是jpg
     has_pdf = False
     for path in selected_paths:
@@ -2190,27 +2690,18 @@ def convert_images():
                 exclude_formats.append('jpeg')
             
             logger.info(f"获取目录中的图片，排除目标格式: {normalized_target}, 路径: {path}")
-            filtered_images = get_all_images(path, exclude_formats=exclude_formats)
-            
-            # 如果需要跳过PDF文件，过滤掉PDF文件
-            if skip_pdf:
-                filtered_images = [f for f in filtered_images if not f.lower().endswith('.pdf')]
-                
-                # 更新skipped_files列表，添加被跳过的PDF文件
-                pdf_files = [f for f in all_files if f.lower().endswith('.pdf')]
-                with progress_lock:
-                    for f in pdf_files:
-                        progress_data['skipped_files'].append(f)
-                        progress_data['processed'] += 1
-            
-            all_images.extend(filtered_images)
+            # 在同一次遍历结果中排除目标格式和需要跳过的PDF文件，避免重复遍历目录树
+            skipped_files = []
+            for record in all_files:
+                if record.ext in exclude_formats or (skip_pdf and record.ext == 'pdf'):
+                    skipped_files.append(record.path)
+                else:
+                    all_images.append(record)
             
-            # 将被跳过的文件添加到skipped_files列表
-            skipped_files = [f for f in all_files if f not in filtered_images and not (skip_pdf and f.lower().endswith('.pdf'))]
+            # 将被跳过的文件（目标格式和PDF）添加到skipped_files列表
             with progress_lock:
-                for f in skipped_files:
-                    progress_data['skipped_files'].append(f)
-                    progress_data['processed'] += 1
+                progress_data['skipped_files'].extend(skipped_files)
+                progress_data['processed'] += len(skipped_files)
         elif os.path.isfile(path) and is_image_file(path):
             total_selected += 1
             ext = os.path.basename(path).lower().split('.')[-1]
@@ -2226,7 +2717,7 @@ def convert_images():
                     progress_data['processed'] += 1
             elif normalized_ext != normalized_target:
                 logger.info(f"添加图片: {path}, 当前格式: {ext}, 目标格式: {normalized_target}")
-                all_images.append(path)
+                all_images.append(FileRecord.from_path(path))
             else:
                 logger.info(f"跳过图片: {path}, 当前格式与目标格式相同: {ext} -> {normalized_target}")
                 with progress_lock:
@@ -2250,11 +2741,12 @@ def convert_images():
         return jsonify({'status': 'started'})
     
     # 处理图片
-    def process_image(img_path):
+    def process_image(record):
         """
         处理单个图片转换
         """
         global progress_data
+        img_path = record.path
         try:
             # 检查是否需要停止处理
             with stop_lock:
@@ -2271,84 +2763,158 @@ def convert_images():
             with progress_lock:
                 progress_data['current_file'] = img_path
             
-            original_size = get_file_size(img_path)
+            if record.ext == 'pdf':
+                process_pdf(record)
+                return
             
             # 使用ImageMagick转换图片格式
-            success, new_path = convert_image_with_imagemagick(img_path, target_format, quality)
-            
-            if success:
-                # 获取文件扩展名
-                ext = os.path.splitext(img_path)[1].lower()[1:]
-                
-                if ext == 'pdf':
-                    # PDF文件转换，不删除原文件，因为会生成多个图片文件
-                    logger.info(f"PDF转图片完成，保留原文件: {img_path}")
-                    # 计算转换后所有图片的总大小
-                    dirname = os.path.dirname(img_path)
-                    basename = os.path.basename(img_path).split('.')[0]
-                    # 查找所有生成的图片文件
-                    output_files = glob.glob(os.path.join(dirname, f"{basename}-*.{target_format}"))
-                    final_size = sum(get_file_size(f) for f in output_files)
-                    logger.info(f"PDF转图片生成 {len(output_files)} 个文件，总大小: {final_size} bytes")
-                    with progress_lock:
-                        progress_data['processed'] += 1
-                        progress_data['original_size'] += original_size
-                        progress_data['final_size'] += final_size
-                else:
-                    if new_path != img_path:  # 只有当新路径和原路径不同时才删除原文件
-                        # 检查转换后的文件是否是新创建的（不是跳过的）
-                        if os.path.exists(new_path):
-                            # 检查原文件是否与新文件不同
-                            if os.path.abspath(new_path) != os.path.abspath(img_path):
-                                # 删除原文件
-                                os.remove(img_path)
-                                final_size = get_file_size(new_path)
-                                logger.info(f"转换完成: {img_path} -> {new_path}, 原大小: {original_size} bytes, 新大小: {final_size} bytes")
-                                with progress_lock:
-                                    progress_data['processed'] += 1
-                                    progress_data['original_size'] += original_size
-                                    progress_data['final_size'] += final_size
-                            else:
-                                final_size = original_size
-                                logger.info(f"转换后的文件与原文件相同，跳过删除: {img_path}")
-                                with progress_lock:
-                                    progress_data['processed'] += 1
-                                    progress_data['original_size'] += original_size
-                                    progress_data['final_size'] += final_size
-                                    progress_data['skipped_files'].append(img_path)
+            with SCHEDULER.slot(img_path):
+                result, new_path = convert_image_with_imagemagick(img_path, target_format, quality, codec_backend, execution_engine)
+            record_convert_result(record, result, new_path)
+        except Exception as e:
+            logger.error(f"处理图片失败: {img_path}, 错误: {e}")
+            with progress_lock:
+                progress_data['processed'] += 1
+    
+    def process_pdf(record):
+        """
+        转换单个PDF，页码区间自行向调度器申请名额（这里不能再持有名额，否则会与区间任务互相等待）
+        进度按页计算：读取到页数后把总数中的1个PDF替换为页数，每保存一页已处理数加1
+        """
+        pages = {'total': None, 'done': 0}
+        
+        def on_page_count(count):
+            pages['total'] = count
+            with progress_lock:
+                progress_data['total'] += count - 1
+        
+        def on_page(event, value):
+            with progress_lock:
+                pages['done'] += 1
+                progress_data['processed'] += 1
+        
+        def should_stop():
+            with stop_lock:
+                return stop_processing_flag
+        
+        try:
+            result, new_path = convert_image_with_imagemagick(
+                record.path, target_format, quality, codec_backend, execution_engine,
+                on_page=on_page, on_page_count=on_page_count, should_stop=should_stop
+            )
+        except Exception as e:
+            logger.error(f"处理PDF失败: {record.path}, 错误: {e}")
+            result, new_path = FAILED, ""
+        # 未完成的页面（失败或停止）计入已处理，保证进度能够结束；未读取到页数时按1个文件计
+        remaining = 1 if pages['total'] is None else pages['total'] - pages['done']
+        record_convert_result(record, result, new_path, remaining)
+    
+    def record_convert_result(record, result, new_path, remaining=1):
+        """
+        记录单个图片的转换结果到进度数据，转换成功时删除原文件
+        原大小使用扫描时的大小，新大小由编解码后端返回（PDF为所有页面的总大小）
+        remaining为还需计入已处理数的数量，PDF按页计数时为未完成的页数
+        """
+        img_path = record.path
+        original_size = record.size
+        if result:
+            if record.ext == 'pdf':
+                # PDF文件转换，不删除原文件，因为会生成多个图片文件
+                final_size = result.size
+                logger.info(f"PDF转图片完成，保留原文件: {img_path}，输出总大小: {final_size} bytes")
+                with progress_lock:
+                    progress_data['processed'] += remaining
+                    progress_data['original_size'] += original_size
+                    progress_data['final_size'] += final_size
+            else:
+                if new_path != img_path:  # 只有当新路径和原路径不同时才删除原文件
+                    # 编解码后端返回了输出文件的大小，说明输出文件存在
+                    if result.size is not None:
+                        # 检查原文件是否与新文件不同
+                        if os.path.abspath(new_path) != os.path.abspath(img_path):
+                            # 删除原文件
+                            os.remove(img_path)
+                            # 原文件的压缩记录失效；输出文件是新文件，该路径上旧文件的记录也一并删除
+                            LEDGER.forget([img_path, new_path])
+                            final_size = result.size
+                            logger.info(f"转换完成: {img_path} -> {new_path}, 原大小: {original_size} bytes, 新大小: {final_size} bytes")
+                            with progress_lock:
+                                progress_data['processed'] += 1
+                                progress_data['original_size'] += original_size
+                                progress_data['final_size'] += final_size
                         else:
                             final_size = original_size
-                            logger.error(f"转换失败: {img_path}")
+                            logger.info(f"转换后的文件与原文件相同，跳过删除: {img_path}")
                             with progress_lock:
                                 progress_data['processed'] += 1
                                 progress_data['original_size'] += original_size
                                 progress_data['final_size'] += final_size
-                                progress_data['failed_files'].append(img_path)
+                                progress_data['skipped_files'].append(img_path)
                     else:
                         final_size = original_size
-                        logger.info(f"转换后的文件与原文件路径相同，跳过: {img_path}")
+                        logger.error(f"转换失败: {img_path}")
                         with progress_lock:
                             progress_data['processed'] += 1
                             progress_data['original_size'] += original_size
                             progress_data['final_size'] += final_size
-                            progress_data['skipped_files'].append(img_path)
-            else:
-                final_size = original_size
-                logger.error(f"转换失败: {img_path}")
-                with progress_lock:
-                    progress_data['processed'] += 1
-                    progress_data['original_size'] += original_size
-                    progress_data['final_size'] += final_size
-                    progress_data['failed_files'].append(img_path)
+                            progress_data['failed_files'].append(img_path)
+                else:
+                    final_size = original_size
+                    logger.info(f"转换后的文件与原文件路径相同，跳过: {img_path}")
+                    with progress_lock:
+                        progress_data['processed'] += 1
+                        progress_data['original_size'] += original_size
+                        progress_data['final_size'] += final_size
+                        progress_data['skipped_files'].append(img_path)
+        else:
+            final_size = original_size
+            logger.error(f"转换失败: {img_path}")
+            with progress_lock:
+                progress_data['processed'] += remaining
+                progress_data['original_size'] += original_size
+                progress_data['final_size'] += final_size
+                progress_data['failed_files'].append(img_path)
+    
+    def process_image_batch(records):
+        """
+        使用一次ImageMagick调用转换一批图片，并把结果归属到每个文件
+        """
+        try:
+            # 检查是否需要停止处理
+            with stop_lock:
+                if stop_processing_flag:
+                    logger.info(f"停止处理，跳过 {len(records)} 个图片")
+                    with progress_lock:
+                        progress_data['processed'] += len(records)
+                    return
+            
+            # 更新当前正在处理的图片路径
+            with progress_lock:
+                progress_data['current_file'] = records[0].path
+            
+            items = [(record.path, converted_image_path(record.path, target_format)) for record in records]
+            with SCHEDULER.slot(kind='light'):
+                results = CODEC_BACKENDS[FALLBACK_BACKEND].convert_batch(items, target_format, quality)
+            for record, (_, new_path) in zip(records, items):
+                record_convert_result(record, results.get(record.path, FAILED), new_path)
         except Exception as e:
-            logger.error(f"处理图片失败: {img_path}, 错误: {e}")
+            logger.error(f"批量处理图片失败: {records[0].path} 等 {len(records)} 个文件, 错误: {e}")
             with progress_lock:
-                progress_data['processed'] += 1
+                progress_data['processed'] += len(records)
+    
+    # 需要调用ImageMagick的图片合并成批处理，其余逐个处理
+    if batch_mode:
+        image_batches, single_images = split_imagemagick_batch(
+            all_images,
+            lambda path: uses_imagemagick_convert(path, target_format, codec_backend)
+        )
+    else:
+        image_batches, single_images = [], all_images
     
     # 在新线程中处理图片转换，避免阻塞主线程
     def process_images_async():
         # 使用多线程处理
-        logger.info(f"使用 {max_workers} 个线程开始处理图片转换")
+        logger.info(f"使用 {max_workers} 个线程开始处理图片转换，批处理 {len(image_batches)} 批，逐个处理 {len(single_images)} 个")
         
         # 检查是否需要停止处理
         def should_stop():
@@ -2368,14 +2934,16 @@ def convert_images():
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
             # 提交任务并检查停止标记
             futures = []
-            for path in all_images:
+            work_items = [(process_image_batch, batch) for batch in image_batches]
+            work_items += [(process_image, record) for record in single_images]
+            for func, item in work_items:
                 # 检查是否需要停止处理
                 if should_stop():
                     logger.info("收到停止请求，不再提交新任务")
                     break
                 
-                # 提交单个任务
-                future = executor.submit(process_image, path)
+                # 提交单个任务（单个图片或一批图片）
+                future = executor.submit(func, item)
                 futures.append(future)
             
             # 等待所有已提交的任务完成
@@ -2386,6 +2954,7 @@ def convert_images():
                     logger.error(f"处理图片时发生异常: {e}")
         
         logger.info("图片转换完成或已停止")
+        refresh_index(selected_paths)
         with progress_lock:
             progress_data['status'] = 'completed'
             progress_data['end_time'] = datetime.now().isoformat()
@@ -2421,6 +2990,17 @@ def stop_processing():
     logger.info("收到停止处理请求")
     return jsonify({'status': 'stopping'})
 
+@app.route('/clear_compress_ledger', methods=['POST'])
+def clear_compress_ledger():
+    """
+    清空已知压缩失败的文件记录，下次压缩时重试这些文件
+    请求方法: POST
+    返回: JSON格式的清理结果，包括清理的记录数
+    """
+    count = LEDGER.clear_known_bad()
+    logger.info(f"清空已知压缩失败的文件记录: {count} 条")
+    return jsonify({'status': 'success', 'cleared': count})
+
 @app.route('/get_supported_formats')
 def get_supported_formats():
     """
@@ -2495,8 +3075,17 @@ def download_file():
         return '不支持的文件类型', 400
     
     try:
-        logger.info(f"返回文件: {file_path}")
-        return send_file(file_path, as_attachment=True)
+        # 支持条件请求（304）和Range请求（206，断点续传）
+        st = os.stat(file_path)
+        etag = file_etag(os.path.normpath(file_path), st, 'download')
+        response = not_modified(etag, st, DOWNLOAD_CACHE_CONTROL)
+        if response is not None:
+            logger.info(f"文件未变化，返回304: {file_path}")
+            return response
+        logger.info(f"返回文件: {file_path}" + (f", Range: {request.headers['Range']}" if 'Range' in request.headers else ''))
+        return send_cached_file(file_path, etag, st, DOWNLOAD_CACHE_CONTROL, as_attachment=True)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"下载文件失败: {type(e).__name__}: {str(e)}")
         return f'Download failed: {str(e)}', 500
@@ -2517,6 +3106,7 @@ def clean_empty_folders():
         return jsonify({'error': '未选中任何文件或文件夹'}), 400
     
     task_id = str(uuid.uuid4())
+    cancel_event = threading.Event()
     
     with tasks_lock:
         tasks[task_id] = {
@@ -2530,6 +3120,7 @@ def clean_empty_folders():
             'error': None,
             'start_time': datetime.now().isoformat(),
             'end_time': None,
+            'cancel': cancel_event,
             'params': {
                 'selected_paths': selected_paths
             }
@@ -2543,54 +3134,54 @@ def clean_empty_folders():
             if not os.path.isdir(directory):
                 return False
             
-            stack = [(directory, False)]
+            # 并行收集所有子目录，按深度从深到浅检查，保证子目录先于父目录删除
+            directories = [directory]
+            directories += [
+                entry.path for entry in walk_tree(directory, base_dir=BASE_DIR, include_dirs=True, max_workers=WALK_WORKERS,
+                                                  should_stop=cancel_event.is_set)
+                if entry.is_dir(follow_symlinks=False)
+            ]
+            directories.sort(key=lambda path: path.count(os.sep), reverse=True)
             
-            while stack:
-                current_dir, visited = stack.pop()
-                
-                if visited:
-                    try:
-                        is_empty = True
-                        with os.scandir(current_dir) as entries:
-                            for entry in entries:
-                                is_empty = False
-                                break
-                        
-                        if is_empty:
-                            os.rmdir(current_dir)
-                            logger.info(f"删除空文件夹: {current_dir}")
-                            deleted_count += 1
-                            with tasks_lock:
-                                if task_id in tasks:
-                                    tasks[task_id]['progress'] = deleted_count
-                                    tasks[task_id]['current'] = current_dir
-                    except Exception as e:
-                        logger.error(f"检查或删除文件夹失败: {current_dir}, 错误: {e}")
-                else:
-                    try:
-                        subdirs = []
-                        with os.scandir(current_dir) as entries:
-                            for entry in entries:
-                                if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'):
-                                    subdirs.append(entry.path)
-                        
-                        stack.append((current_dir, True))
-                        for subdir in reversed(subdirs):
-                            stack.append((subdir, False))
-                    except Exception as e:
-                        logger.error(f"扫描目录 {current_dir} 失败: {e}")
+            for current_dir in directories:
+                if cancel_event.is_set():
+                    break
+                try:
+                    is_empty = True
+                    with os.scandir(current_dir) as entries:
+                        for entry in entries:
+                            is_empty = False
+                            break
+                    
+                    if is_empty:
+                        os.rmdir(current_dir)
+                        logger.info(f"删除空文件夹: {current_dir}")
+                        deleted_count += 1
+                        with tasks_lock:
+                            if task_id in tasks:
+                                tasks[task_id]['progress'] = deleted_count
+                                tasks[task_id]['current'] = current_dir
+                except Exception as e:
+                    logger.error(f"检查或删除文件夹失败: {current_dir}, 错误: {e}")
             
             return True
         
         try:
             for path in selected_paths:
+                if cancel_event.is_set():
+                    break
+                if not is_within_base(path, BASE_DIR):
+                    logger.warning(f"路径 {path} 不在BASE_DIR {BASE_DIR} 范围内，跳过处理")
+                    continue
+                
                 if os.path.isdir(path):
                     clean_empty_dirs_recursive(path)
             
             logger.info(f"清理空文件夹完成，共删除 {deleted_count} 个空文件夹")
+            refresh_index(selected_paths)
             with tasks_lock:
                 if task_id in tasks:
-                    tasks[task_id]['status'] = 'completed'
+                    tasks[task_id]['status'] = completed_status(tasks[task_id])
                     tasks[task_id]['result'] = {"deleted_count": deleted_count}
                     tasks[task_id]['end_time'] = datetime.now().isoformat()
         except Exception as e:
@@ -2607,18 +3198,133 @@ def clean_empty_folders():
     
     return jsonify({'task_id': task_id, 'task_type': 'clean_empty_folders'})
 
+@app.route('/rescan_index', methods=['POST'])
+def rescan_index():
+    """
+    刷新元数据索引
+    请求方法: POST
+    请求参数: selected_paths - 要刷新的文件夹路径列表，默认为BASE_DIR；full - 是否重新扫描所有目录（默认只扫描mtime变化的目录）
+    返回: JSON格式的结果，包括任务ID和任务类型，前端根据taskId轮询任务状态
+    """
+    if INDEX is None:
+        return jsonify({'error': '元数据索引未启用'}), 400
+    
+    selected_paths = request.json.get('selected_paths') or [BASE_DIR]
+    full = bool(request.json.get('full', False))
+    logger.info(f"开始刷新元数据索引，选中路径: {selected_paths}，完整扫描: {full}")
+    
+    task_id = str(uuid.uuid4())
+    cancel_event = threading.Event()
+    
+    with tasks_lock:
+        tasks[task_id] = {
+            'id': task_id,
+            'type': 'rescan_index',
+            'status': 'running',
+            'progress': 0,
+            'total': 0,
+            'current': '',
+            'result': None,
+            'error': None,
+            'start_time': datetime.now().isoformat(),
+            'end_time': None,
+            'cancel': cancel_event,
+            'params': {
+                'selected_paths': selected_paths,
+                'full': full
+            }
+        }
+    
+    def run_rescan_task():
+        dirs_checked = 0
+        dirs_rescanned = 0
+        
+        def on_progress(visited, current_dir):
+            with tasks_lock:
+                if task_id in tasks:
+                    tasks[task_id]['progress'] = dirs_checked + visited
+                    tasks[task_id]['current'] = current_dir
+        
+        try:
+            for path in selected_paths:
+                if cancel_event.is_set():
+                    break
+                if not is_within_base(path, BASE_DIR) or not os.path.isdir(path):
+                    logger.warning(f"路径 {path} 不是BASE_DIR内的文件夹，跳过刷新")
+                    continue
+                result = INDEX.refresh(path, full=full, on_progress=on_progress, should_stop=cancel_event.is_set)
+                dirs_checked += result['dirs']
+                dirs_rescanned += result['rescanned']
+            
+            with tasks_lock:
+                if task_id in tasks:
+                    tasks[task_id]['status'] = completed_status(tasks[task_id])
+                    tasks[task_id]['result'] = dict(
+                        INDEX.stats(), dirs_checked=dirs_checked, dirs_rescanned=dirs_rescanned
+                    )
+                    tasks[task_id]['end_time'] = datetime.now().isoformat()
+        except Exception as e:
+            logger.error(f"刷新元数据索引失败: {e}")
+            with tasks_lock:
+                if task_id in tasks:
+                    tasks[task_id]['status'] = 'failed'
+                    tasks[task_id]['error'] = str(e)
+                    tasks[task_id]['end_time'] = datetime.now().isoformat()
+    
+    thread = threading.Thread(target=run_rescan_task)
+    thread.daemon = True
+    thread.start()
+    
+    return jsonify({'task_id': task_id, 'task_type': 'rescan_index'})
+
+@app.route('/get_file_details', methods=['POST'])
+def get_file_details():
+    """
+    获取文件的宽高和EXIF拍摄时间，第一次请求时读取图片头并保存到元数据索引
+    请求方法: POST
+    请求参数: paths - 文件路径列表
+    返回: JSON格式的结果，{路径: {'width', 'height', 'exif_date'}}，不在索引中的文件不返回
+    """
+    paths = request.json.get('paths', [])
+    if INDEX is None:
+        return jsonify({'error': '元数据索引未启用'}), 400
+    
+    details = {}
+    for path in paths:
+        if not is_within_base(path, BASE_DIR):
+            continue
+        item = INDEX.details(path)
+        if item is not None:
+            details[path] = item
+    return jsonify({'details': details})
+
 @app.route('/get_config')
 def get_config():
     """
     获取系统配置信息
-    返回: JSON格式的配置信息，包括基础目录和CPU核心数
+    返回: JSON格式的配置信息，包括基础目录、可用CPU核心数、工具链能力、执行引擎和并发调度状态
     """
-    # 获取CPU核心数
-    cpu_count = os.cpu_count() or 4  # 默认为4
+    # 获取容器内可用的CPU核心数（考虑cgroup配额和CPU亲和性）
+    cpu_count = RESOURCES.cpu_count
     logger.info(f"获取CPU核心数: {cpu_count}")
     if cpu_count > 1:
         cpu_count -= 1  # 减去1个核心，保留1个核心用于gunicorn服务
-    return jsonify({'base_dir': BASE_DIR, 'cpu_count': cpu_count})
+    return jsonify({
+        'base_dir': BASE_DIR,
+        'cpu_count': cpu_count,
+        'toolchain': TOOLCHAIN.to_dict(),
+        'execution_engine': dict(PROCESS_ENGINE.to_dict(), default=EXECUTION_ENGINE),
+        'resources': RESOURCES.to_dict(),
+        'scheduler': SCHEDULER.to_dict(),
+        'compress_ledger': LEDGER.stats(),
+        'metadata_index': INDEX.stats() if INDEX else None,
+        'index_watcher': WATCHER.to_dict() if WATCHER else None,
+        'listing_cache': LISTING_CACHE.stats(),
+        'sort_keys': SORT_KEYS.stats(),
+        'name_index': FILENAME_INDEX.stats() if FILENAME_INDEX else None,
+        'thumbnail_cache': THUMBNAIL_CACHE.stats(),
+        'thumbnail_prefetch': PREFETCHER.stats()
+    })
 
 @app.route('/get_version')
 def get_version():
@@ -2656,12 +3362,135 @@ def get_task_status_route(task_id):
         'progress': task.get('progress', 0),
         'current': task.get('current', ''),
         'result': task.get('result'),
+        'partial': task.get('partial'),
+        'cancel_requested': completed_status(task) == 'cancelled',
         'error': task.get('error'),
         'start_time': task.get('start_time'),
         'end_time': task.get('end_time'),
         'params': task.get('params', {})
     })
 
+@app.route('/cancel_task/<task_id>', methods=['POST'])
+def cancel_task(task_id):
+    """
+    取消任务
+    请求方法: POST
+    请求参数: task_id - 任务ID
+    返回: JSON格式的结果；任务在处理完当前条目后停止，状态变为cancelled，已得到的部分结果保留
+    """
+    with tasks_lock:
+        task = tasks.get(task_id)
+        if task is None:
+            return jsonify({'error': '任务不存在'}), 404
+        status = task.get('status')
+        if status == 'running' and task.get('cancel') is not None:
+            task['cancel'].set()
+    logger.info(f"取消任务: {task_id}, 当前状态: {status}")
+    return jsonify({'success': True, 'task_id': task_id, 'status': status})
+
+@app.route('/get_task_results/<task_id>')
+def get_task_results(task_id):
+    """
+    分页读取任务的分块结果（搜索任务的匹配文件）
+    请求方法: GET
+    请求参数: task_id - 任务ID，offset - 起始位置（默认0），limit - 最多返回的条数（默认500，最大5000）
+    返回: JSON格式的结果，包括本页条目、总数、是否已截断；任务完成后结果按路径排序
+    """
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(max(1, int(request.args.get('limit', 500))), 5000)
+    except ValueError:
+        return jsonify({'error': '无效的分页参数'}), 400
+    with tasks_lock:
+        task = tasks.get(task_id)
+        status = task.get('status') if task else None
+    if task is None or task.get('results') is None:
+        return jsonify({'error': '任务不存在或没有分块结果'}), 404
+    results = task['results']
+    items = results.read(offset, limit)
+    summary = results.summary()
+    return jsonify({
+        'task_id': task_id,
+        'status': status,
+        'offset': offset,
+        'items': items,
+        'total': summary['total'],
+        'truncated': summary['truncated'],
+        'generation': results.generation
+    })
+
+@app.route('/stream_task/<task_id>')
+def stream_task(task_id):
+    """
+    以NDJSON流式推送任务进度和结果
+    请求方法: GET
+    请求参数: task_id - 任务ID，offset - 已收到的结果数，generation - 收到这些结果时的排序版本（重新连接时使用）
+    返回: application/x-ndjson，每行一个JSON对象：
+        - {"type": "items", "offset": 收到这些条目后的偏移量, "items": [...]}：新的匹配结果（搜索任务）
+        - {"type": "progress", "progress", "current", "partial"}：进度变化，partial为统计格式的部分结果
+        - {"type": "reset"}：结果已重新排序，之前收到的顺序作废，需要时通过/get_task_results重新读取
+        - {"type": "reconnect", "offset", "generation"}：本次连接已达到最长时间，客户端带上offset和generation重新连接
+        - {"type": "done", "status", "result", "error"}：任务结束（completed/failed/cancelled/not_found）
+    """
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        generation = int(request.args['generation']) if request.args.get('generation') else None
+    except ValueError:
+        return jsonify({'error': '无效的偏移量'}), 400
+    
+    def line(data):
+        return json.dumps(data, ensure_ascii=False) + '\n'
+    
+    def generate():
+        nonlocal offset, generation
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        last_progress = None
+        reset = False
+        while True:
+            with tasks_lock:
+                task = tasks.get(task_id)
+                if task is not None:
+                    status = task.get('status')
+                    progress = (task.get('progress', 0), task.get('current', ''), task.get('partial'))
+                    results = task.get('results')
+                    result = task.get('result')
+                    error = task.get('error')
+            if task is None:
+                yield line({'type': 'done', 'status': 'not_found', 'result': None, 'error': None})
+                return
+            if results is not None and not reset:
+                if generation is None:
+                    generation = results.generation
+                elif generation != results.generation:
+                    # 任务完成时结果按路径重新排序，原来的偏移量不再有效，之后只等待任务结束
+                    reset = True
+                    yield line({'type': 'reset'})
+                    continue
+                items = results.read(offset, STREAM_BATCH_SIZE)
+                if items:
+                    offset += len(items)
+                    yield line({'type': 'items', 'offset': offset, 'items': items})
+                    continue
+            if status != 'running':
+                yield line({'type': 'done', 'status': status, 'result': result, 'error': error})
+                return
+            if progress != last_progress:
+                last_progress = progress
+                yield line({'type': 'progress', 'progress': progress[0], 'current': progress[1], 'partial': progress[2]})
+            if time.monotonic() >= deadline:
+                yield line({'type': 'reconnect', 'offset': offset, 'generation': generation})
+                return
+            if results is not None and not reset:
+                results.wait(offset, 0.5)
+            else:
+                time.sleep(0.2)
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # 禁止反向代理缓冲，结果到达后立即推送
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/cleanup_tasks', methods=['POST'])
 def cleanup_tasks():
     """
@@ -2706,7 +3535,7 @@ def upload_images():
     """
     上传图片文件进行处理
     请求方法: POST
-    请求参数: files - 上传的文件列表, process_type - 处理类型(compress/convert), quality - 质量, max_workers - 线程数, target_format - 目标格式, skip_pdf - 是否跳过PDF
+    请求参数: files - 上传的文件列表, process_type - 处理类型(compress/convert), quality - 质量, max_workers - 线程数（默认自动）, target_format - 目标格式, skip_pdf - 是否跳过PDF, codec_backend - 编解码后端（pillow/subprocess）, execution_engine - 执行引擎（process/thread）
     返回: JSON格式的结果，包括任务ID
     """
     global upload_progress_data
@@ -2722,10 +3551,12 @@ def upload_images():
     # 获取处理参数
     process_type = request.form.get('process_type', 'compress')
     quality = int(request.form.get('quality', 80))
-    max_workers = int(request.form.get('max_workers', 4))
+    max_workers = SCHEDULER.workers_for(request.form.get('max_workers'))
     target_format = request.form.get('target_format', 'jpg')
     skip_pdf = request.form.get('skip_pdf', 'true').lower() == 'true'
     pdf_password = request.form.get('pdf_password', '') or ''
+    codec_backend = request.form.get('codec_backend') or None
+    execution_engine = request.form.get('execution_engine') or None
     
     logger.info(f"开始上传处理文件，数量: {len(files)}, 处理类型: {process_type}, 质量: {quality}, 线程数: {max_workers}, 目标格式: {target_format}, 跳过PDF: {skip_pdf}, PDF密码: {'已设置' if pdf_password else '无'}")
     
@@ -2822,8 +3653,8 @@ def upload_images():
             if normalized_target == 'jpg':
                 for pdf_file in pdf_files:
                     try:
-                        images = convert_from_path(pdf_file, dpi=1)
-                        pdf_page_count += len(images)
+                        # 使用pdfinfo读取页数，不渲染页面
+                        pdf_page_count += get_pdf_page_count(pdf_file)
                     except:
                         pdf_page_count += 1
             
@@ -2872,28 +3703,15 @@ def upload_images():
                         # 合并所有普通图片到一个PDF文件
                         logger.info(f"开始合并 {len(all_images_for_pdf)} 张图片到一个PDF文件")
                         
-                        images_for_pdf = []
-                        for img_path in all_images_for_pdf:
-                            try:
-                                with upload_progress_lock:
-                                    if task_id not in upload_progress_data:
-                                        return
+                        # 每打开一张图片更新一次进度
+                        def on_image_opened(event, value):
+                            index, opened = value
+                            img_path = all_images_for_pdf[index]
+                            with upload_progress_lock:
+                                if task_id in upload_progress_data:
                                     upload_progress_data[task_id]['current_file'] = img_path
-                                
-                                # 打开图片并转换为RGB模式（PDF需要RGB）
-                                img = Image.open(img_path)
-                                if img.mode in ('RGBA', 'P'):
-                                    img = img.convert('RGB')
-                                images_for_pdf.append(img)
-                                
-                                with upload_progress_lock:
-                                    if task_id in upload_progress_data:
-                                        upload_progress_data[task_id]['processed'] += 1
-                            except Exception as e:
-                                logger.error(f"打开图片失败: {img_path}, 错误: {e}")
-                                with upload_progress_lock:
-                                    if task_id in upload_progress_data:
-                                        upload_progress_data[task_id]['processed'] += 1
+                                    upload_progress_data[task_id]['processed'] += 1
+                                    if not opened:
                                         upload_progress_data[task_id]['failed_files'].append(f"{img_path} (无法识别图片格式)")
                         
                         # 生成PDF文件名
@@ -2905,15 +3723,13 @@ def upload_images():
                         
                         pdf_output_path = os.path.join(task_dir, f"{first_img_name}.pdf")
                         
-                        # 保存PDF文件
-                        if images_for_pdf:
-                            images_for_pdf[0].save(
-                                pdf_output_path,
-                                save_all=True,
-                                append_images=images_for_pdf[1:],
-                                quality=quality
+                        # 打开图片（转换为RGB模式）并保存为PDF文件，在进程池中执行
+                        with SCHEDULER.slot(pdf_output_path):
+                            pdf_saved, _ = PROCESS_ENGINE.call(
+                                merge_images_to_pdf, all_images_for_pdf, pdf_output_path, quality,
+                                on_event=on_image_opened, inline=not use_process_engine(execution_engine)
                             )
-                            
+                        if pdf_saved:
                             # 如果设置了密码，对PDF进行加密
                             if pdf_password:
                                 try:
@@ -2977,10 +3793,12 @@ def upload_images():
                             original_size = get_file_size(img_path)
                             
                             # 使用ImageMagick转换图片格式
-                            success, new_path = convert_image_with_imagemagick(img_path, target_format, quality)
+                            with SCHEDULER.slot(img_path):
+                                result, new_path = convert_image_with_imagemagick(img_path, target_format, quality, codec_backend, execution_engine)
                             
-                            if success:
-                                final_size = get_file_size(new_path) if os.path.exists(new_path) else original_size
+                            if result:
+                                # 输出文件大小由编解码后端返回
+                                final_size = result.size if result.size is not None else original_size
                                 with upload_progress_lock:
                                     if task_id in upload_progress_data:
                                         upload_progress_data[task_id]['processed'] += 1
@@ -3041,22 +3859,37 @@ def upload_images():
                             
                             # 使用pdf2image转换PDF为图片
                             logger.info(f"开始使用pdf2image转换PDF: {temp_pdf_path}")
-                            images = convert_from_path(temp_pdf_path, dpi=300, fmt='jpeg', thread_count=1)
-                            logger.info(f"PDF转换完成，共 {len(images)} 页")
-                            
                             dirname = os.path.dirname(pdf_path)
                             basename = os.path.basename(pdf_path).split('.')[0]
                             
-                            for i, img in enumerate(images):
-                                output_filename = os.path.join(dirname, f"{basename}-{i+1:03d}.jpg")
-                                img.save(output_filename, quality=quality)
-                                logger.info(f"保存图片: {output_filename}")
-                                
+                            # 每保存一页更新一次进度
+                            def on_page_saved(event, value):
+                                page, page_count, page_size = value
+                                logger.info(f"保存图片: {basename}-{page:03d}.jpg")
                                 with upload_progress_lock:
                                     if task_id in upload_progress_data:
                                         upload_progress_data[task_id]['processed'] += 1
-                                        upload_progress_data[task_id]['original_size'] += original_size // len(images)
-                                        upload_progress_data[task_id]['final_size'] += get_file_size(output_filename)
+                                        upload_progress_data[task_id]['original_size'] += original_size // page_count
+                                        upload_progress_data[task_id]['final_size'] += page_size
+                            
+                            # 按页码区间并行渲染，每个区间占用一个调度器名额
+                            page_count, _, _, failed_ranges, _ = convert_pdf_pages(
+                                temp_pdf_path, os.path.join(dirname, f"{basename}-{{page:03d}}.jpg"), quality, False,
+                                on_page=on_page_saved, engine_override=execution_engine
+                            )
+                            logger.info(f"PDF转换完成，共 {page_count} 页")
+                            
+                            if failed_ranges:
+                                logger.error(f"PDF部分页面转换失败: {pdf_path}, 失败的页码区间: {failed_ranges}")
+                                with upload_progress_lock:
+                                    if task_id in upload_progress_data:
+                                        # 失败区间的页面计入已处理，保证进度能够结束
+                                        upload_progress_data[task_id]['processed'] += sum(
+                                            last - first + 1 for first, last in failed_ranges
+                                        )
+                                        upload_progress_data[task_id]['failed_files'].append(
+                                            f"{pdf_path} (页码 {', '.join(f'{first}-{last}' for first, last in failed_ranges)})"
+                                        )
                             
                             # 清理临时解密文件
                             if temp_pdf_path != pdf_path and os.path.exists(temp_pdf_path):
@@ -3101,9 +3934,11 @@ def upload_images():
                         
                         original_size = get_file_size(img_path)
                         
-                        # 使用统一压缩函数
-                        if compress_image(img_path, quality):
-                            final_size = get_file_size(img_path)
+                        # 使用统一压缩函数，压缩后的大小由编解码后端返回
+                        with SCHEDULER.slot(img_path):
+                            result = compress_image(img_path, quality, codec_backend, execution_engine)
+                        if result:
+                            final_size = result.size if result.size is not None else get_file_size(img_path)
                             with upload_progress_lock:
                                 if task_id in upload_progress_data:
                                     upload_progress_data[task_id]['processed'] += 1
@@ -3381,6 +4216,56 @@ def start_cleanup_scheduler():
     run_cleanup()
     logger.info("已启动定时清理任务（每小时执行一次）")
 
+def start_index_scheduler():
+    """
+    启动元数据索引的后台刷新：立即增量刷新一次BASE_DIR并启动inotify监视，之后每隔METADATA_INDEX_REFRESH_INTERVAL秒刷新一次
+    inotify监视正常工作时跳过定时刷新；达到监视数量上限或inotify不可用时恢复定时刷新
+    """
+    global index_scheduler_started
+    if INDEX is None:
+        return
+    with index_scheduler_lock:
+        if index_scheduler_started:
+            return
+        index_scheduler_started = True
+    
+    def run_refresh():
+        """执行刷新任务"""
+        global WATCHER
+        try:
+            if WATCHER is not None and WATCHER.healthy:
+                logger.debug("inotify监视正常，跳过定时刷新元数据索引")
+            elif os.path.isdir(BASE_DIR):
+                INDEX.refresh()
+                if FILENAME_INDEX is not None:
+                    # 第一次刷新完成后构建文件名索引，之后由索引的变更通知更新
+                    FILENAME_INDEX.ensure_ready()
+                if METADATA_INDEX_WATCH and WATCHER is None:
+                    # 文件被原地修改时目录mtime不变，由监视线程使缓存的目录列表失效
+                    WATCHER = InotifyWatcher(INDEX, on_change=LISTING_CACHE.invalidate)
+                    WATCHER.start()
+        except Exception as e:
+            logger.error(f"后台刷新元数据索引失败: {e}")
+        finally:
+            # 安排下一次执行（只在刷新完成后安排）
+            if METADATA_INDEX_REFRESH_INTERVAL > 0:
+                next_timer = threading.Timer(METADATA_INDEX_REFRESH_INTERVAL, run_refresh)
+                next_timer.daemon = True
+                next_timer.start()
+    
+    thread = threading.Thread(target=run_refresh, daemon=True)
+    thread.start()
+    logger.info(f"已启动元数据索引后台刷新（间隔 {METADATA_INDEX_REFRESH_INTERVAL} 秒）")
+
+# gunicorn不执行__main__，后台刷新在第一个请求时启动（--preload会在主进程中导入模块后fork，导入时启动的线程不会带到工作进程中）
+index_scheduler_started = False
+index_scheduler_lock = threading.Lock()
+
+@app.before_request
+def ensure_index_scheduler():
+    if not index_scheduler_started:
+        start_index_scheduler()
+
 @app.route('/get_upload_progress/<task_id>')
 def get_upload_progress(task_id):
     """
@@ -3424,7 +4309,15 @@ def download_upload_result(task_id):
         return '文件不存在', 404
     
     try:
-        return send_file(file_path, as_attachment=True)
+        # 结果文件在任务期间不会变化，允许浏览器缓存；支持条件请求和Range请求
+        st = os.stat(file_path)
+        etag = file_etag(os.path.normpath(file_path), st, f"upload.{task_id}")
+        response = not_modified(etag, st, UPLOAD_RESULT_CACHE_CONTROL)
+        if response is not None:
+            return response
+        return send_cached_file(file_path, etag, st, UPLOAD_RESULT_CACHE_CONTROL, as_attachment=True)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"下载文件失败: {type(e).__name__}: {str(e)}")
         return f'Download failed: {str(e)}', 500
@@ -3496,4 +4389,7 @@ if __name__ == '__main__':
     # 启动定时清理任务
     start_cleanup_scheduler()
     
+    # 启动元数据索引的后台刷新和inotify监视
+    start_index_scheduler()
+    
     app.run(debug=DEBUG, host='0.0.0.0', port=5000)
\ No newline at end of file
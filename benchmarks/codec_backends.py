@@ -0,0 +1,136 @@
+# 编解码后端基准测试
+# 在同一批图片上分别使用pillow后端和subprocess后端压缩（或转换），比较耗时和输出大小
+#
+# 用法：
+#   python benchmarks/codec_backends.py /path/to/corpus --quality 80
+#   python benchmarks/codec_backends.py /path/to/corpus --operation convert --target webp --quality 90
+#
+# 每个后端在独立的临时目录中处理语料的副本，不会修改原文件
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from toolchain import ToolchainRegistry  # noqa: E402
+from codec_backends import build_backends, COMPRESSIBLE_FORMATS, UnsupportedByBackend  # noqa: E402
+
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'webp', 'avif', 'heic', 'bmp', 'gif', 'tiff', 'tif')
+
+
+def collect_corpus(corpus_dir, operation):
+    """收集语料目录下的图片文件"""
+    files = []
+    for root, _, names in os.walk(corpus_dir):
+        for name in names:
+            ext = os.path.splitext(name)[1].lower()[1:]
+            allowed = COMPRESSIBLE_FORMATS if operation == 'compress' else IMAGE_EXTENSIONS
+            if ext in allowed and not name.startswith('.'):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+def percentile(values, pct):
+    """计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_backend(backend, files, args):
+    """
+    使用指定后端处理语料副本
+
+    Returns:
+        dict: 统计结果
+    """
+    work_dir = tempfile.mkdtemp(prefix=f"bench-{backend.name}-")
+    timings = []
+    input_bytes = 0
+    output_bytes = 0
+    failed = 0
+    unsupported = 0
+    try:
+        for index, src in enumerate(files):
+            ext = os.path.splitext(src)[1].lower()
+            work_path = os.path.join(work_dir, f"{index:06d}{ext}")
+            shutil.copyfile(src, work_path)
+            input_bytes += os.path.getsize(work_path)
+
+            start = time.perf_counter()
+            try:
+                if args.operation == 'compress':
+                    ok = backend.compress(work_path, args.quality)
+                    out_path = work_path
+                else:
+                    out_path = os.path.join(work_dir, f"{index:06d}-out.{args.target}")
+                    ok = backend.convert(work_path, out_path, args.target, args.quality)
+            except UnsupportedByBackend:
+                unsupported += 1
+                continue
+            except Exception:
+                ok = False
+            timings.append(time.perf_counter() - start)
+
+            if ok and os.path.exists(out_path):
+                output_bytes += os.path.getsize(out_path)
+            else:
+                failed += 1
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'backend': backend.name,
+        'files': len(timings),
+        'failed': failed,
+        'unsupported': unsupported,
+        'total_seconds': sum(timings),
+        'mean_ms': statistics.mean(timings) * 1000 if timings else 0.0,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'input_bytes': input_bytes,
+        'output_bytes': output_bytes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较pillow与subprocess编解码后端的性能')
+    parser.add_argument('corpus', help='图片语料目录')
+    parser.add_argument('--operation', choices=['compress', 'convert'], default='compress')
+    parser.add_argument('--target', default='jpg', help='转换目标格式（仅convert）')
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--backends', nargs='+', default=['pillow', 'subprocess'])
+    args = parser.parse_args()
+
+    files = collect_corpus(args.corpus, args.operation)
+    if not files:
+        print('语料目录中没有可处理的图片')
+        return 1
+
+    cache_path = os.path.join(tempfile.gettempdir(), 'image-processor-bench-toolchain.json')
+    toolchain = ToolchainRegistry(cache_path)
+    toolchain.load()
+    backends = build_backends(toolchain)
+
+    print(f"语料: {len(files)} 个文件, 操作: {args.operation}, 质量: {args.quality}")
+    header = f"{'后端':<12}{'文件数':>8}{'失败':>6}{'不支持':>8}{'总耗时(s)':>12}{'平均(ms)':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'输出/输入':>10}"
+    print(header)
+    for name in args.backends:
+        result = run_backend(backends[name], files, args)
+        ratio = result['output_bytes'] / result['input_bytes'] if result['input_bytes'] else 0.0
+        print(
+            f"{result['backend']:<12}{result['files']:>8}{result['failed']:>6}{result['unsupported']:>8}"
+            f"{result['total_seconds']:>12.2f}{result['mean_ms']:>10.1f}{result['p50_ms']:>10.1f}"
+            f"{result['p95_ms']:>10.1f}{ratio:>10.3f}"
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
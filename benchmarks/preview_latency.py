@@ -0,0 +1,136 @@
+# 预览缩放基准测试
+# 在同一批图片上比较两种生成预览图的方式：
+#   full  - 原来的方式：完整解码原图，LANCZOS直接缩放到目标尺寸
+#   draft - 按目标尺寸解码：JPEG用draft缩小解码，其他格式先reduce再LANCZOS（thumbnail_cache.downscale）
+# 输出每种方式的p50/p99延迟和平均解码像素数（解码后图像占用的内存与像素数成正比）
+#
+# 用法：
+#   python benchmarks/preview_latency.py /path/to/corpus
+#   python benchmarks/preview_latency.py /path/to/corpus --variant hover --repeat 3
+#
+# 只读取语料，不写入缓存目录
+import io
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+from thumbnail_cache import VARIANTS, JPEG_QUALITY, downscale, fit_size  # noqa: E402
+
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'webp', 'bmp', 'gif', 'tiff', 'tif')
+
+
+def collect_corpus(corpus_dir):
+    """收集语料目录下的图片文件"""
+    files = []
+    for root, _, names in os.walk(corpus_dir):
+        for name in names:
+            ext = os.path.splitext(name)[1].lower()[1:]
+            if ext in IMAGE_EXTENSIONS and not name.startswith('.'):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+def percentile(values, pct):
+    """计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def render_full(path, box):
+    """原来的方式：完整解码后LANCZOS缩放，返回(解码像素数, 输出)"""
+    with Image.open(path) as img:
+        img.load()
+        pixels = img.size[0] * img.size[1]
+        resized = img.resize(fit_size(img.size, box), Image.LANCZOS)
+    return pixels, resized
+
+
+def render_draft(path, box):
+    """按目标尺寸解码，返回(解码像素数, 输出)"""
+    with Image.open(path) as img:
+        resized = downscale(img, box)
+        pixels = img.size[0] * img.size[1]
+    return pixels, resized
+
+
+METHODS = {'full': render_full, 'draft': render_draft}
+
+
+def run_method(name, files, box, repeat):
+    """
+    用指定方式为所有图片生成预览
+
+    Returns:
+        dict: 统计结果
+    """
+    render = METHODS[name]
+    timings = []
+    pixels = []
+    failed = 0
+    for _ in range(repeat):
+        for path in files:
+            start = time.perf_counter()
+            try:
+                decoded, resized = render(path, box)
+                # 包括编码时间，与/preview的实际开销一致
+                if resized.mode not in ('RGB', 'L'):
+                    resized = resized.convert('RGB')
+                resized.save(io.BytesIO(), format='JPEG', quality=JPEG_QUALITY)
+            except Exception:
+                failed += 1
+                continue
+            timings.append(time.perf_counter() - start)
+            pixels.append(decoded)
+    return {
+        'method': name,
+        'previews': len(timings),
+        'failed': failed,
+        'mean_ms': statistics.mean(timings) * 1000 if timings else 0.0,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'mean_mpixels': statistics.mean(pixels) / 1e6 if pixels else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较完整解码与按目标尺寸解码生成预览图的延迟')
+    parser.add_argument('corpus', help='图片语料目录')
+    parser.add_argument('--variant', choices=sorted(VARIANTS), default='modal')
+    parser.add_argument('--repeat', type=int, default=1, help='每张图片重复的次数')
+    parser.add_argument('--methods', nargs='+', choices=sorted(METHODS), default=['full', 'draft'])
+    args = parser.parse_args()
+
+    box = VARIANTS[args.variant]
+    files = []
+    for path in collect_corpus(args.corpus):
+        try:
+            with Image.open(path) as img:
+                if img.size[0] > box[0] or img.size[1] > box[1]:
+                    files.append(path)
+        except Exception:
+            continue
+    if not files:
+        print('语料目录中没有超过预览尺寸的图片')
+        return 1
+
+    print(f"语料: {len(files)} 个文件, 预览尺寸: {args.variant} {box[0]}x{box[1]}, 重复: {args.repeat}")
+    print(f"{'方式':<8}{'预览数':>8}{'失败':>6}{'平均(ms)':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'解码像素(M)':>14}")
+    for name in args.methods:
+        result = run_method(name, files, box, args.repeat)
+        print(
+            f"{result['method']:<8}{result['previews']:>8}{result['failed']:>6}{result['mean_ms']:>10.1f}"
+            f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['mean_mpixels']:>14.2f}"
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
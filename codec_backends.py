@@ -0,0 +1,855 @@
+# 图片编解码后端
+# - pillow：进程内使用Pillow编码，省去每个文件一次fork+exec，适合常见的JPEG/PNG/WebP
+# - subprocess：调用外部工具（jpegoptim/pngquant/cwebp/ImageMagick），作为可选的回退后端
+import os
+import io
+import shutil
+import platform
+import subprocess
+import logging
+from PIL import Image
+from quality_search import search_quality, MODE_FIXED, DEFAULT_MIN_QUALITY, DEFAULT_MIN_PSNR
+
+logger = logging.getLogger(__name__)
+
+# 支持压缩的格式
+COMPRESSIBLE_FORMATS = ('jpg', 'jpeg', 'png', 'webp')
+
+# Pillow后端可写入的目标格式 -> Pillow格式名
+PILLOW_TARGET_FORMATS = {
+    'jpg': 'JPEG',
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+    'webp': 'WEBP',
+}
+
+# 默认的 格式 -> 后端 映射，未列出的格式使用subprocess后端
+# 可在config.py中通过CODEC_BACKENDS覆盖，也可在单个任务中通过codec_backend参数覆盖
+DEFAULT_BACKENDS = {
+    'jpg': 'pillow',
+    'jpeg': 'pillow',
+    'png': 'pillow',
+    'webp': 'pillow',
+}
+
+# 回退后端名称
+FALLBACK_BACKEND = 'subprocess'
+
+# ImageMagick批处理默认参数：每批最多文件数、每批最大总字节数、每个文件的超时时间（秒）
+DEFAULT_BATCH_MAX_FILES = 16
+DEFAULT_BATCH_MAX_BYTES = 64 * 1024 * 1024
+BATCH_TIMEOUT_PER_FILE = 30
+
+# IJG标准亮度量化表（质量50），用于估算JPEG质量
+STD_LUMINANCE_QUANT_TABLE = [
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99,
+]
+
+
+def plan_batches(items, max_files=DEFAULT_BATCH_MAX_FILES, max_bytes=DEFAULT_BATCH_MAX_BYTES):
+    """
+    按文件大小自适应地把文件划分为批次
+
+    Args:
+        items (list): [(路径, 文件大小)]
+        max_files (int): 每批最多文件数
+        max_bytes (int): 每批最大总字节数，超过此大小的单个文件单独成批，避免一个大TIFF拖住整批
+
+    Returns:
+        list: [[路径, ...], ...]
+    """
+    batches = []
+    current = []
+    current_bytes = 0
+    for path, size in items:
+        if size >= max_bytes:
+            batches.append([path])
+            continue
+        if current and (len(current) >= max_files or current_bytes + size > max_bytes):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(path)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def mogrify_output_matches(img_path, new_path):
+    """
+    判断mogrify -format生成的文件名是否与期望的输出路径一致
+    mogrify只替换最后一个扩展名，而转换逻辑使用第一个点之前的部分作为文件名
+    """
+    name = os.path.basename(img_path)
+    return os.path.splitext(name)[0] == name.split('.')[0] and \
+        os.path.dirname(img_path) == os.path.dirname(new_path)
+
+
+def _file_state(path):
+    """返回文件的(大小, mtime)，文件不存在时返回None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class UnsupportedByBackend(Exception):
+    """后端不支持该文件（格式、动图等），调用方应回退到其他后端"""
+
+
+def normalize_ext(ext):
+    """规范化扩展名，jpeg统一为jpg"""
+    ext = ext.lower().lstrip('.')
+    return 'jpg' if ext == 'jpeg' else ext
+
+
+def resolve_backend_name(ext, override=None, configured=None):
+    """
+    解析某个格式使用的后端名称
+
+    优先级：任务参数 > config.py中的CODEC_BACKENDS > DEFAULT_BACKENDS > subprocess
+
+    Args:
+        ext (str): 文件扩展名（源格式或目标格式）
+        override (str|dict, optional): 任务参数，字符串表示所有格式使用同一后端，字典表示按格式指定
+        configured (dict, optional): config.py中的CODEC_BACKENDS
+
+    Returns:
+        str: 后端名称
+    """
+    ext = normalize_ext(ext)
+    for mapping in (override, configured, DEFAULT_BACKENDS):
+        if not mapping:
+            continue
+        if isinstance(mapping, str):
+            return mapping
+        name = mapping.get(ext) or (mapping.get('jpeg') if ext == 'jpg' else None)
+        if name:
+            return name
+    return FALLBACK_BACKEND
+
+
+def estimate_jpeg_quality(img):
+    """
+    根据亮度量化表估算JPEG质量（IJG质量刻度）
+
+    Args:
+        img (PIL.Image.Image): 已打开的JPEG图片
+
+    Returns:
+        int: 估算的质量，1-100，无法估算时返回None
+    """
+    tables = getattr(img, 'quantization', None)
+    if not tables or 0 not in tables:
+        return None
+    actual = sum(tables[0])
+    if actual <= 0:
+        return None
+    scale = actual * 100 / sum(STD_LUMINANCE_QUANT_TABLE)
+    if scale <= 100:
+        quality = (200 - scale) / 2
+    else:
+        quality = 5000 / scale
+    return max(1, min(100, int(round(quality))))
+
+
+def write_file_atomic(path, data):
+    """
+    原子写入文件：先写入同目录的临时文件，再替换目标文件，保留原文件权限
+
+    Args:
+        path (str): 目标文件路径
+        data (bytes): 文件内容
+    """
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class CodecResult:
+    """
+    压缩或转换的结果，布尔值表示是否成功（与原来返回的bool兼容），同时带回输出文件的状态，
+    调用方统计大小和写入压缩记录时不需要再stat
+
+    Attributes:
+        ok (bool): 是否成功
+        size (int|None): 输出文件大小，未知时为None
+        mtime_ns (int|None): 输出文件mtime，未知时为None；保留原文件时为压缩时读取的原文件的状态
+    """
+
+    __slots__ = ('ok', 'size', 'mtime_ns')
+
+    def __init__(self, ok, size=None, mtime_ns=None):
+        self.ok = ok
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return f"CodecResult(ok={self.ok}, size={self.size})"
+
+    @classmethod
+    def from_file(cls, path):
+        """写入输出文件后stat一次取得大小和mtime，输出文件不存在时视为失败"""
+        state = _file_state(path)
+        if state is None:
+            return FAILED
+        return cls(True, state[0], state[1])
+
+
+# 失败的结果
+FAILED = CodecResult(False)
+
+
+class CodecBackend:
+    """
+    编解码后端接口
+
+    compress: 原地压缩图片
+    convert: 转换图片格式，写入新路径
+    """
+    name = ''
+
+    def can_compress(self, ext):
+        """是否支持压缩该格式"""
+        return False
+
+    def can_convert(self, src_ext, target_ext):
+        """是否支持从源格式转换为目标格式"""
+        return False
+
+    def compress_tool(self, ext):
+        """返回压缩该格式时实际使用的工具名，用于记录"""
+        return self.name
+
+    def compress(self, img_path, quality):
+        """
+        原地压缩图片
+
+        Returns:
+            CodecResult: 是否成功及压缩后的文件状态
+
+        Raises:
+            UnsupportedByBackend: 后端不支持该文件
+        """
+        raise NotImplementedError
+
+    def convert(self, img_path, new_path, target_format, quality):
+        """
+        转换图片格式
+
+        Returns:
+            CodecResult: 是否成功及输出文件的状态
+
+        Raises:
+            UnsupportedByBackend: 后端不支持该文件
+        """
+        raise NotImplementedError
+
+
+class PillowBackend(CodecBackend):
+    """
+    进程内Pillow后端
+    - JPEG: 渐进式、4:2:0色度抽样，已经低于目标质量的图片复用原量化表，不重复降质
+    - PNG: 按质量量化调色板，质量100时只做无损优化
+    - WebP: 有损编码
+    - 保留EXIF和ICC色彩配置
+    - 压缩结果不比原文件小时保留原文件
+    """
+    name = 'pillow'
+
+    def can_compress(self, ext):
+        return normalize_ext(ext) in COMPRESSIBLE_FORMATS
+
+    def can_convert(self, src_ext, target_ext):
+        src_ext = normalize_ext(src_ext)
+        if normalize_ext(target_ext) not in PILLOW_TARGET_FORMATS or src_ext == 'pdf':
+            return False
+        # 源格式需要Pillow能够读取（AVIF/HEIC依赖Pillow版本或插件）
+        return f".{src_ext}" in Image.registered_extensions() or src_ext in ('jpg', 'tif')
+
+    def _save_kwargs(self, img, pil_format, quality, keep_jpeg_tables=False):
+        """构建Image.save的参数"""
+        kwargs = {'format': pil_format}
+        exif = img.info.get('exif')
+        if exif:
+            kwargs['exif'] = exif
+        icc_profile = img.info.get('icc_profile')
+        if icc_profile:
+            kwargs['icc_profile'] = icc_profile
+        if pil_format == 'JPEG':
+            kwargs['optimize'] = True
+            kwargs['progressive'] = True  # 渐进式JPEG
+            if keep_jpeg_tables:
+                # 复用原图的量化表和色度抽样，避免再次降质
+                kwargs['quality'] = 'keep'
+            else:
+                kwargs['quality'] = quality
+                kwargs['subsampling'] = '4:2:0'  # 色度抽样
+        elif pil_format == 'WEBP':
+            kwargs['quality'] = quality
+            kwargs['method'] = 4
+        elif pil_format == 'PNG':
+            kwargs['optimize'] = True
+        return kwargs
+
+    def _prepare_image(self, img, pil_format, quality):
+        """按目标格式转换色彩模式，PNG按质量量化调色板"""
+        if pil_format == 'JPEG':
+            if img.mode not in ('RGB', 'L'):
+                # CMYK、带透明通道等模式转换为sRGB
+                img = img.convert('RGB')
+        elif pil_format == 'WEBP':
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        elif pil_format == 'PNG' and quality < 100:
+            if img.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+                img = img.convert('RGBA')
+            if img.mode != 'P':
+                colors = max(16, int(round(256 * quality / 100)))
+                # 带透明通道的图片只能使用FASTOCTREE量化
+                method = Image.Quantize.FASTOCTREE if img.mode in ('RGBA', 'LA') else Image.Quantize.MEDIANCUT
+                img = img.quantize(colors=colors, method=method)
+        return img
+
+    def encode(self, img, target_ext, quality, keep_jpeg_tables=False):
+        """
+        在内存中编码图片
+
+        Args:
+            img (PIL.Image.Image): 已打开的图片
+            target_ext (str): 目标格式扩展名
+            quality (int): 质量，1-100
+            keep_jpeg_tables (bool): JPEG是否复用原量化表
+
+        Returns:
+            bytes: 编码后的文件内容
+        """
+        pil_format = PILLOW_TARGET_FORMATS[normalize_ext(target_ext)]
+        kwargs = self._save_kwargs(img, pil_format, quality, keep_jpeg_tables)
+        prepared = self._prepare_image(img, pil_format, quality)
+        buffer = io.BytesIO()
+        prepared.save(buffer, **kwargs)
+        return buffer.getvalue()
+
+    def compress(self, img_path, quality):
+        ext = normalize_ext(os.path.splitext(img_path)[1])
+        if not self.can_compress(ext):
+            raise UnsupportedByBackend(f"Pillow后端不支持压缩格式: {ext}")
+
+        logger.info(f"使用Pillow压缩图片: {img_path}, 质量: {quality}")
+        # 原文件大小取自实际读取的文件句柄，扫描后被原地覆盖的文件也能正确比较
+        with open(img_path, 'rb') as f, Image.open(f) as img:
+            original = os.fstat(f.fileno())
+            # 动图交给外部工具处理
+            if getattr(img, 'is_animated', False):
+                raise UnsupportedByBackend(f"Pillow后端不处理动图: {img_path}")
+            keep_jpeg_tables = False
+            if img.format == 'JPEG':
+                # 与jpegoptim --max一致：质量已低于目标质量时不再降质
+                estimated = estimate_jpeg_quality(img)
+                keep_jpeg_tables = estimated is not None and estimated <= quality and img.mode in ('RGB', 'L')
+            data = self.encode(img, ext, quality, keep_jpeg_tables)
+
+        if len(data) >= original.st_size:
+            logger.info(f"压缩结果不小于原文件，保留原文件: {img_path}")
+            return CodecResult(True, original.st_size, original.st_mtime_ns)
+        write_file_atomic(img_path, data)
+        logger.info(f"压缩完成: {img_path}")
+        return CodecResult.from_file(img_path)
+
+    def compress_search(self, img_path, mode, max_quality, target_bytes=None, min_psnr=None):
+        """
+        按目标大小或画质下限搜索质量并原地压缩图片，中间结果只在内存中编码
+
+        Args:
+            img_path (str): 图片路径
+            mode (str): target_size或perceptual
+            max_quality (int): 搜索的最高质量
+            target_bytes (int, optional): target_size模式的目标字节数
+            min_psnr (float, optional): perceptual模式的PSNR下限
+
+        Returns:
+            dict: {'quality': 选中的质量, 'attempts': 编码次数, 'met': 是否满足目标, 'written': 是否写入了新文件,
+                   'result': CodecResult}
+        """
+        ext = normalize_ext(os.path.splitext(img_path)[1])
+        if not self.can_compress(ext):
+            raise UnsupportedByBackend(f"Pillow后端不支持压缩格式: {ext}")
+
+        with open(img_path, 'rb') as f, Image.open(f) as img:
+            original = os.fstat(f.fileno())
+            if getattr(img, 'is_animated', False):
+                raise UnsupportedByBackend(f"Pillow后端不处理动图: {img_path}")
+            img.load()
+            result = search_quality(
+                lambda quality: self.encode(img, ext, quality),
+                img, mode,
+                target_bytes=target_bytes,
+                min_psnr=min_psnr if min_psnr is not None else DEFAULT_MIN_PSNR,
+                min_quality=min(DEFAULT_MIN_QUALITY, max_quality),
+                max_quality=max_quality
+            )
+
+        written = len(result['data']) < original.st_size
+        if written:
+            write_file_atomic(img_path, result['data'])
+        logger.info(f"质量搜索压缩完成: {img_path}, 质量: {result['quality']}, 编码次数: {result['attempts']}, "
+                    f"满足目标: {result['met']}, 写入: {written}")
+        return {
+            'quality': result['quality'],
+            'attempts': result['attempts'],
+            'met': result['met'],
+            'written': written,
+            'result': (CodecResult.from_file(img_path) if written
+                       else CodecResult(True, original.st_size, original.st_mtime_ns)),
+        }
+
+    def convert(self, img_path, new_path, target_format, quality):
+        src_ext = os.path.splitext(img_path)[1]
+        if not self.can_convert(src_ext, target_format):
+            raise UnsupportedByBackend(f"Pillow后端不支持转换: {src_ext} -> {target_format}")
+
+        logger.info(f"使用Pillow转换图片: {img_path} -> {new_path}, 质量: {quality}")
+        with Image.open(img_path) as img:
+            if getattr(img, 'is_animated', False):
+                raise UnsupportedByBackend(f"Pillow后端不处理动图: {img_path}")
+            data = self.encode(img, target_format, quality)
+        write_file_atomic(new_path, data)
+        logger.info(f"转换完成: {img_path} -> {new_path}")
+        return CodecResult.from_file(new_path)
+
+
+class SubprocessBackend(CodecBackend):
+    """
+    外部工具后端
+    - Linux平台：JPG使用jpegoptim，PNG使用pngquant，WEBP使用cwebp，工具不可用时回退到ImageMagick
+    - Windows平台：使用ImageMagick
+    - 命令路径由工具链注册表解析
+    """
+    name = 'subprocess'
+
+    def __init__(self, toolchain):
+        self.toolchain = toolchain
+
+    def can_compress(self, ext):
+        return normalize_ext(ext) in COMPRESSIBLE_FORMATS
+
+    def can_convert(self, src_ext, target_ext):
+        return self.toolchain.imagemagick_available
+
+    def special_tool_for(self, ext):
+        """返回格式对应的专用压缩工具名"""
+        ext = normalize_ext(ext)
+        if ext == 'jpg':
+            return 'jpegoptim'
+        if ext == 'png':
+            return 'pngquant'
+        if ext == 'webp':
+            return 'cwebp'
+        return None
+
+    def compress_with_special_tools(self, img_path, quality):
+        """
+        使用专门的压缩工具压缩图片（仅Linux平台）
+        - JPG: jpegoptim
+        - PNG: pngquant
+        - WEBP: cwebp
+
+        Args:
+            img_path (str): 图片文件路径
+            quality (int): 压缩质量，1-100，数值越高质量越好，文件越大
+
+        Returns:
+            CodecResult: 是否成功及压缩后的文件状态
+        """
+        try:
+            # 获取文件扩展名
+            ext = os.path.splitext(img_path)[1].lower()[1:]
+
+            # 根据文件格式选择不同的压缩工具
+            if ext in ['jpg', 'jpeg']:
+                # JPG文件使用jpegoptim压缩
+                tool_name = 'jpegoptim'
+                cmd = [
+                    self.toolchain.binary('jpegoptim'),
+                    '--max', str(quality),
+                    '--all-progressive',  # 生成渐进式JPEG
+                    '--quiet',  # 静默模式
+                    img_path
+                ]
+            elif ext == 'png':
+                # PNG文件使用pngquant压缩
+                # pngquant的质量范围是0-100，与其他工具一致
+                tool_name = 'pngquant'
+                cmd = [
+                    self.toolchain.binary('pngquant'),
+                    '--skip-if-larger',
+                    '--quality', str(quality),
+                    '--output', img_path,
+                    '--force',  # 覆盖原文件
+                    img_path
+                ]
+            elif ext == 'webp':
+                # WEBP文件使用cwebp压缩
+                tool_name = 'cwebp'
+                cmd = [
+                    self.toolchain.binary('cwebp'),
+                    '-q', str(quality),
+                    '-metadata', 'all',  # 保留所有元数据
+                    '-o', img_path,
+                    img_path
+                ]
+            else:
+                # 其他格式不支持，返回False
+                logger.info(f"不支持的格式，无法使用专门工具压缩: {ext}")
+                return FAILED
+
+            # 执行命令
+            logger.info(f"使用{tool_name}压缩图片: {img_path}, 质量: {quality}")
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            if result.returncode != 0:
+                logger.error(f"使用{tool_name}压缩图片失败: {img_path}, 错误: {result.stderr}")
+                return FAILED
+
+            logger.info(f"压缩完成: {img_path}")
+            return CodecResult.from_file(img_path)
+        except Exception as e:
+            logger.error(f"使用专门工具压缩图片失败: {img_path}, 错误: {e}")
+            return FAILED
+
+    def compress_with_imagemagick(self, img_path, quality):
+        """
+        使用ImageMagick压缩图片
+
+        Args:
+            img_path (str): 图片文件路径
+            quality (int): 压缩质量，1-100，数值越高质量越好，文件越大
+
+        Returns:
+            CodecResult: 是否成功及压缩后的文件状态
+
+        说明：
+            - 通过工具链注册表选择ImageMagick命令，不再每次执行 `magick --version` 探测
+            - 优先使用magick命令（ImageMagick 7+），不可用时使用convert命令（ImageMagick 6）
+            - 保留EXIF元数据
+            - 使用-interlace Plane生成渐进式JPEG，提高网页加载体验
+            - 使用-sampling-factor 4:2:0进行色度抽样，平衡质量和大小
+            - 使用-colorspace sRGB确保输出图片使用sRGB色彩空间，提高兼容性
+        """
+        prefix = self.toolchain.imagemagick_command()
+        if prefix is None:
+            logger.error(f"ImageMagick不可用，无法压缩图片: {img_path}")
+            return FAILED
+        try:
+            # 使用列表构建命令，确保中文路径被正确处理
+            # 命令前缀由工具链注册表解析：ImageMagick 7+ 使用magick，ImageMagick 6 使用convert
+            cmd = prefix + [
+                img_path,
+                '-quality', str(quality),
+                '-interlace', 'Plane',  # 渐进式JPEG
+                '-sampling-factor', '4:2:0',  # 色度抽样
+                '-colorspace', 'sRGB',  # 确保sRGB色彩空间
+                img_path
+            ]
+
+            # 执行命令
+            logger.info(f"使用ImageMagick压缩图片: {img_path}, 质量: {quality}")
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            if result.returncode != 0:
+                logger.error(f"使用ImageMagick压缩图片失败: {img_path}, 错误: {result.stderr}")
+                return FAILED
+
+            logger.info(f"压缩完成: {img_path}")
+            return CodecResult.from_file(img_path)
+        except Exception as e:
+            logger.error(f"压缩图片失败: {img_path}, 错误: {e}")
+            return FAILED
+
+    def compress_tool(self, ext):
+        if self.uses_imagemagick_for_compress(ext):
+            return 'imagemagick'
+        return self.special_tool_for(ext)
+
+    def uses_imagemagick_for_compress(self, ext):
+        """压缩该格式时是否使用ImageMagick（Windows平台或专用工具不可用）"""
+        if platform.system() == 'Windows':
+            return True
+        tool_name = self.special_tool_for(ext)
+        return not (tool_name and self.toolchain.available(tool_name))
+
+    def _run_mogrify(self, img_paths, args, outputs, retry_single):
+        """
+        一次调用mogrify处理一批文件，并把成功/失败归属到每个文件
+
+        Args:
+            img_paths (list): 输入文件路径列表
+            args (list): mogrify参数（不含文件）
+            outputs (dict): {输入路径: 输出路径}
+            retry_single (callable): 单个文件重试函数，返回CodecResult
+
+        Returns:
+            dict: {输入路径: CodecResult}
+
+        说明：
+            - 命令返回0时，输出文件存在即视为成功
+            - 命令失败或超时时，输出文件状态发生变化的视为已在批处理中成功，其余文件单独重试，
+              从而准确判断是哪一个文件失败
+        """
+        prefix = self.toolchain.imagemagick_command('mogrify')
+        if prefix is None:
+            # ImageMagick 6 未安装mogrify，逐个处理
+            logger.warning(f"mogrify不可用，逐个处理 {len(img_paths)} 个文件")
+            return {path: retry_single(path) for path in img_paths}
+        before = {path: _file_state(outputs[path]) for path in img_paths}
+        cmd = prefix + args + list(img_paths)
+        batch_ok = False
+        try:
+            logger.info(f"使用mogrify批量处理 {len(img_paths)} 个文件: {img_paths[0]} 等")
+            result = subprocess.run(
+                cmd, capture_output=True, text=True,
+                timeout=BATCH_TIMEOUT_PER_FILE * len(img_paths)
+            )
+            batch_ok = result.returncode == 0
+            if not batch_ok:
+                logger.warning(f"mogrify批处理部分失败，逐个确认结果: {result.stderr.strip()}")
+        except subprocess.TimeoutExpired:
+            logger.error(f"mogrify批处理超时，逐个确认结果: {img_paths[0]} 等 {len(img_paths)} 个文件")
+        except Exception as e:
+            logger.error(f"mogrify批处理失败，逐个确认结果: {e}")
+
+        results = {}
+        for path in img_paths:
+            after = _file_state(outputs[path])
+            if after is not None and (batch_ok or after != before[path]):
+                results[path] = CodecResult(True, after[0], after[1])
+            else:
+                results[path] = retry_single(path)
+        return results
+
+    def compress_batch(self, img_paths, quality):
+        """
+        使用一次mogrify调用原地压缩一批图片
+
+        Args:
+            img_paths (list): 图片路径列表
+            quality (int): 压缩质量，1-100
+
+        Returns:
+            dict: {图片路径: CodecResult}
+        """
+        if not self.toolchain.imagemagick_available:
+            logger.error("ImageMagick不可用，无法批量压缩图片")
+            return {path: FAILED for path in img_paths}
+        args = [
+            '-quality', str(quality),
+            '-interlace', 'Plane',  # 渐进式JPEG
+            '-sampling-factor', '4:2:0',  # 色度抽样
+            '-colorspace', 'sRGB',  # 确保sRGB色彩空间
+        ]
+        return self._run_mogrify(
+            img_paths, args,
+            outputs={path: path for path in img_paths},
+            retry_single=lambda path: self.compress_with_imagemagick(path, quality)
+        )
+
+    def convert_batch(self, items, target_format, quality):
+        """
+        使用一次mogrify -format调用转换一批图片
+
+        Args:
+            items (list): [(源路径, 输出路径)]，输出路径须满足mogrify_output_matches
+            target_format (str): 目标格式
+            quality (int): 转换质量，1-100
+
+        Returns:
+            dict: {源路径: CodecResult}
+        """
+        img_paths = [img_path for img_path, _ in items]
+        if not self.toolchain.imagemagick_available:
+            logger.error("ImageMagick不可用，无法批量转换图片")
+            return {path: FAILED for path in img_paths}
+        outputs = dict(items)
+        args = [
+            '-format', normalize_ext(target_format),
+            '-quality', str(quality),
+            '-interlace', 'Plane',  # 渐进式JPEG
+            '-colorspace', 'sRGB',  # 确保sRGB色彩空间
+        ]
+        return self._run_mogrify(
+            img_paths, args,
+            outputs=outputs,
+            retry_single=lambda path: self.convert(path, outputs[path], target_format, quality)
+        )
+
+    def compress(self, img_path, quality):
+        ext = os.path.splitext(img_path)[1].lower()[1:]
+
+        # Linux平台优先使用专门的压缩工具
+        if platform.system() != 'Windows':
+            tool_name = self.special_tool_for(ext)
+            if tool_name and self.toolchain.available(tool_name):
+                logger.debug(f"使用专门工具压缩图片，格式: {ext}")
+                result = self.compress_with_special_tools(img_path, quality)
+                logger.info(f"专门工具压缩结果: {'成功' if result else '失败'}")
+                return result
+            # 工具不可用，记录日志并回退到ImageMagick
+            logger.warning(f"{tool_name}不可用，回退到ImageMagick")
+
+        # Windows平台或专门工具不可用时，使用ImageMagick
+        logger.debug("使用ImageMagick压缩图片")
+        result = self.compress_with_imagemagick(img_path, quality)
+        logger.info(f"ImageMagick压缩结果: {'成功' if result else '失败'}")
+        return result
+
+    def convert(self, img_path, new_path, target_format, quality):
+        prefix = self.toolchain.imagemagick_command()
+        if prefix is None:
+            logger.error(f"ImageMagick不可用，无法转换图片: {img_path}")
+            return FAILED
+        # 使用列表构建命令，确保中文路径被正确处理
+        # 命令前缀由工具链注册表解析：ImageMagick 7+ 使用magick，ImageMagick 6 使用convert
+        cmd = prefix + [
+            img_path,
+            '-quality', str(quality),
+            # 不使用-strip，保留元数据
+            '-interlace', 'Plane',  # 渐进式JPEG
+            '-colorspace', 'sRGB',  # 确保sRGB色彩空间
+            new_path
+        ]
+
+        # 执行命令
+        logger.debug(f"执行转换命令: {cmd}")
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        if result.returncode != 0:
+            logger.error(f"转换图片失败: {img_path}, 错误: {result.stderr}")
+            return FAILED
+
+        logger.info(f"转换完成: {img_path} -> {new_path}")
+        return CodecResult.from_file(new_path)
+
+
+def build_backends(toolchain):
+    """
+    创建所有可用的编解码后端
+
+    Args:
+        toolchain (ToolchainRegistry): 工具链注册表
+
+    Returns:
+        dict: {后端名称: 后端实例}
+    """
+    return {
+        PillowBackend.name: PillowBackend(),
+        SubprocessBackend.name: SubprocessBackend(toolchain),
+    }
+
+
+def compress_with_fallback(backends, backend_name, img_path, quality):
+    """
+    使用指定后端压缩图片，进程内后端不支持或失败时回退到subprocess后端
+
+    Args:
+        backends (dict): build_backends() 返回的后端字典
+        backend_name (str): 首选后端名称
+        img_path (str): 图片路径
+        quality (int): 压缩质量，1-100
+
+    Returns:
+        CodecResult: 是否成功及压缩后的文件状态
+    """
+    backend = backends.get(backend_name, backends[FALLBACK_BACKEND])
+    if backend.name != FALLBACK_BACKEND:
+        try:
+            result = backend.compress(img_path, quality)
+            if result:
+                return result
+            logger.warning(f"{backend.name}后端压缩失败，回退到{FALLBACK_BACKEND}后端: {img_path}")
+        except UnsupportedByBackend as e:
+            logger.info(f"{e}，回退到{FALLBACK_BACKEND}后端")
+        except Exception as e:
+            logger.warning(f"{backend.name}后端压缩失败，回退到{FALLBACK_BACKEND}后端: {img_path}, 错误: {e}")
+
+    return backends[FALLBACK_BACKEND].compress(img_path, quality)
+
+
+def convert_with_fallback(backends, backend_name, img_path, new_path, target_format, quality):
+    """
+    使用指定后端转换单个普通图片，进程内后端不支持源格式或失败时回退到ImageMagick
+
+    Args:
+        backends (dict): build_backends() 返回的后端字典
+        backend_name (str): 首选后端名称
+        img_path (str): 源图片路径
+        new_path (str): 输出路径
+        target_format (str): 目标格式
+        quality (int): 转换质量，1-100
+
+    Returns:
+        CodecResult: 是否成功及输出文件的状态
+    """
+    backend = backends.get(backend_name, backends[FALLBACK_BACKEND])
+    if backend.name != FALLBACK_BACKEND:
+        try:
+            result = backend.convert(img_path, new_path, target_format, quality)
+            if result:
+                return result
+            logger.warning(f"{backend.name}后端转换失败，回退到{FALLBACK_BACKEND}后端: {img_path}")
+        except UnsupportedByBackend as e:
+            logger.info(f"{e}，回退到{FALLBACK_BACKEND}后端")
+        except Exception as e:
+            logger.warning(f"{backend.name}后端转换失败，回退到{FALLBACK_BACKEND}后端: {img_path}, 错误: {e}")
+        # 清理后端失败时可能残留的输出文件
+        if os.path.exists(new_path):
+            try:
+                os.remove(new_path)
+            except OSError:
+                pass
+
+    return backends[FALLBACK_BACKEND].convert(img_path, new_path, target_format, quality)
+
+
+def compress_search_with_fallback(backends, img_path, quality, mode, target_bytes=None, min_psnr=None):
+    """
+    按目标大小或画质下限搜索质量压缩图片
+    质量搜索需要在内存中反复编码，只有pillow后端支持；不支持的文件（动图等）回退到subprocess后端按固定质量压缩
+
+    Args:
+        backends (dict): build_backends() 返回的后端字典
+        img_path (str): 图片路径
+        quality (int): 搜索的最高质量，回退时使用的固定质量
+        mode (str): target_size或perceptual
+        target_bytes (int, optional): 目标字节数
+        min_psnr (float, optional): PSNR下限
+
+    Returns:
+        tuple: (CodecResult, 选中的质量, 编码次数, 实际使用的质量模式)，回退到固定质量压缩时模式为fixed
+    """
+    try:
+        result = backends[PillowBackend.name].compress_search(
+            img_path, mode, quality, target_bytes, min_psnr
+        )
+        return result['result'], result['quality'], result['attempts'], mode
+    except UnsupportedByBackend as e:
+        logger.info(f"{e}，回退到{FALLBACK_BACKEND}后端按固定质量压缩")
+    except Exception as e:
+        logger.warning(f"质量搜索压缩失败，回退到{FALLBACK_BACKEND}后端按固定质量压缩: {img_path}, 错误: {e}")
+    return backends[FALLBACK_BACKEND].compress(img_path, quality), quality, 1, MODE_FIXED
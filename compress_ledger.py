@@ -0,0 +1,262 @@
+# 压缩记录账本
+# 夜间任务会反复压缩同一批目录，每次都重新压缩既浪费CPU，又会让画质逐渐下降。
+# 这里用SQLite记录每个文件压缩后的状态（路径 + 大小 + mtime + 内容指纹）以及使用的质量和工具：
+# - 文件当前状态与某次压缩输出一致，且当时的压缩不比本次宽松时跳过：
+#   固定质量比较质量；按目标大小搜索时还要求当时的目标不大于本次目标，按画质下限搜索时要求当时的PSNR下限不高于本次下限
+# - 压缩失败的文件记录为已知坏文件，文件未变化且连续失败多次后暂停重试，一段时间后再重试一次
+#   （超时、进程池异常、内存不足等偶发失败不会让文件永久被跳过）
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from quality_search import MODE_FIXED, MODE_TARGET_SIZE, MODE_PERCEPTUAL
+
+logger = logging.getLogger(__name__)
+
+# 内容指纹读取文件头尾各多少字节
+FINGERPRINT_CHUNK = 64 * 1024
+
+# 文件未变化时连续失败多少次后才作为已知坏文件跳过
+KNOWN_BAD_ATTEMPTS = 3
+
+# 已知坏文件跳过的时长（秒），超过后重试一次
+KNOWN_BAD_TTL = 7 * 24 * 3600
+
+# 跳过原因
+SKIP_OPTIMIZED = 'optimized'
+SKIP_KNOWN_BAD = 'known_bad'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS optimized (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    quality INTEGER NOT NULL,
+    tool TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    mode TEXT NOT NULL DEFAULT 'fixed',
+    target REAL
+);
+CREATE TABLE IF NOT EXISTS known_bad (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def file_fingerprint(path, size=None):
+    """
+    计算文件内容指纹：文件大小 + 头尾各64KB的blake2b摘要
+    只读取少量数据，避免对大文件做全量哈希
+
+    Args:
+        path (str): 文件路径
+        size (int, optional): 文件大小，已知时避免重复stat
+
+    Returns:
+        str: 指纹的十六进制字符串
+    """
+    if size is None:
+        size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_CHUNK))
+        if size > FINGERPRINT_CHUNK * 2:
+            f.seek(-FINGERPRINT_CHUNK, os.SEEK_END)
+            digest.update(f.read(FINGERPRINT_CHUNK))
+        elif size > FINGERPRINT_CHUNK:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class CompressLedger:
+    """
+    压缩记录账本，多个线程共享一个SQLite连接，通过锁串行访问
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        """旧版本的账本没有质量模式和目标列，补上后旧记录视为固定质量"""
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(optimized)')}
+        if 'mode' not in columns:
+            self._conn.execute(f"ALTER TABLE optimized ADD COLUMN mode TEXT NOT NULL DEFAULT '{MODE_FIXED}'")
+        if 'target' not in columns:
+            self._conn.execute('ALTER TABLE optimized ADD COLUMN target REAL')
+
+    def _state(self, path):
+        """返回文件当前状态 (size, mtime_ns)，文件不存在时返回None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _matches(self, path, row, state):
+        """
+        判断记录是否与文件当前状态一致
+        大小和mtime不同直接返回False；都相同时再比较内容指纹，防止mtime被保留的替换（如rsync -t）
+        """
+        size, mtime_ns, fingerprint = row
+        if (size, mtime_ns) != state:
+            return False
+        try:
+            return file_fingerprint(path, size) == fingerprint
+        except OSError:
+            return False
+
+    @staticmethod
+    def _covers(row, quality, mode, target):
+        """
+        判断记录中的那次压缩是否不比本次宽松
+
+        Args:
+            row (tuple): (quality, mode, target)
+            quality (int): 本次的质量（搜索模式下为搜索的最高质量）
+            mode (str): 本次的质量模式
+            target (float|None): 本次的目标字节数（target_size）或PSNR下限（perceptual）
+        """
+        used_quality, used_mode, used_target = row
+        if used_quality > quality:
+            return False
+        if mode == MODE_FIXED:
+            # 无论当时用哪种模式，实际使用的质量不高于本次质量，再压缩也不会更小
+            return True
+        if mode not in (MODE_TARGET_SIZE, MODE_PERCEPTUAL) or used_mode != mode:
+            return False
+        if used_target is None or target is None:
+            return False
+        # 目标大小越小、PSNR下限越低，选中的质量越低
+        return used_target <= target
+
+    def check(self, path, quality, state=None, mode=MODE_FIXED, target=None):
+        """
+        检查文件是否可以跳过压缩
+
+        Args:
+            path (str): 文件路径
+            quality (int): 本次压缩质量（搜索模式下为搜索的最高质量）
+            state (tuple, optional): 扫描时取得的 (size, mtime_ns)，已知时不再stat
+            mode (str): 质量模式
+            target (float, optional): target_size模式的目标字节数，perceptual模式的PSNR下限
+
+        Returns:
+            str|None: 跳过原因（SKIP_OPTIMIZED或SKIP_KNOWN_BAD），不能跳过时返回None
+        """
+        if state is None:
+            state = self._state(path)
+        if state is None:
+            return None
+        with self._lock:
+            optimized = self._conn.execute(
+                'SELECT size, mtime_ns, fingerprint, quality, mode, target FROM optimized WHERE path = ?', (path,)
+            ).fetchone()
+            bad = self._conn.execute(
+                'SELECT size, mtime_ns, fingerprint, attempts, updated_at FROM known_bad WHERE path = ?', (path,)
+            ).fetchone()
+        if optimized and self._covers(optimized[3:], quality, mode, target) and self._matches(path, optimized[:3], state):
+            return SKIP_OPTIMIZED
+        if (bad and bad[3] >= KNOWN_BAD_ATTEMPTS and time.time() - bad[4] < KNOWN_BAD_TTL
+                and self._matches(path, bad[:3], state)):
+            return SKIP_KNOWN_BAD
+        return None
+
+    def record_success(self, path, quality, tool, state=None, mode=MODE_FIXED, target=None):
+        """
+        记录压缩成功后的文件状态
+
+        Args:
+            path (str): 文件路径
+            quality (int): 使用的压缩质量（搜索模式下为选中的质量）
+            tool (str): 使用的压缩工具
+            state (tuple, optional): 编解码后端返回的压缩后 (size, mtime_ns)，已知时不再stat
+            mode (str): 质量模式
+            target (float, optional): target_size模式的目标字节数，perceptual模式的PSNR下限
+        """
+        if state is None:
+            state = self._state(path)
+        if state is None:
+            return
+        try:
+            fingerprint = file_fingerprint(path, state[0])
+        except OSError as e:
+            logger.warning(f"计算文件指纹失败: {path}, 错误: {e}")
+            return
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO optimized (path, size, mtime_ns, fingerprint, quality, tool, updated_at, mode, target) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (path, state[0], state[1], fingerprint, quality, tool, time.time(), mode, target)
+            )
+            self._conn.execute('DELETE FROM known_bad WHERE path = ?', (path,))
+            self._conn.commit()
+
+    def record_failure(self, path, error=None, state=None):
+        """
+        记录压缩失败的文件，文件未变化时累计失败次数，达到KNOWN_BAD_ATTEMPTS后在KNOWN_BAD_TTL内不再重试
+
+        Args:
+            path (str): 文件路径
+            error (str, optional): 失败原因
+            state (tuple, optional): 扫描时取得的 (size, mtime_ns)，已知时不再stat
+        """
+        if state is None:
+            state = self._state(path)
+        if state is None:
+            return
+        try:
+            fingerprint = file_fingerprint(path, state[0])
+        except OSError:
+            return
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO known_bad (path, size, mtime_ns, fingerprint, error, attempts, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, 1, ?) '
+                'ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, '
+                'fingerprint = excluded.fingerprint, error = excluded.error, '
+                # 文件变化后重新计数
+                'attempts = CASE WHEN known_bad.fingerprint = excluded.fingerprint '
+                'AND known_bad.size = excluded.size AND known_bad.mtime_ns = excluded.mtime_ns '
+                'THEN known_bad.attempts + 1 ELSE 1 END, updated_at = excluded.updated_at',
+                (path, state[0], state[1], fingerprint, error, time.time())
+            )
+            self._conn.commit()
+
+    def forget(self, paths):
+        """删除文件的所有记录（文件被删除、重命名或转换后删除原文件时调用）"""
+        with self._lock:
+            for path in paths:
+                self._conn.execute('DELETE FROM optimized WHERE path = ?', (path,))
+                self._conn.execute('DELETE FROM known_bad WHERE path = ?', (path,))
+            self._conn.commit()
+
+    def clear_known_bad(self):
+        """清空已知坏文件记录，下次任务重试所有失败过的文件"""
+        with self._lock:
+            count = self._conn.execute('DELETE FROM known_bad').rowcount
+            self._conn.commit()
+        return count
+
+    def stats(self):
+        """返回账本统计信息"""
+        with self._lock:
+            optimized = self._conn.execute('SELECT COUNT(*) FROM optimized').fetchone()[0]
+            bad = self._conn.execute('SELECT COUNT(*) FROM known_bad').fetchone()[0]
+        return {'optimized': optimized, 'known_bad': bad}
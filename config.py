@@ -3,4 +3,72 @@
 BASE_DIR = '/data'
 
 # 是否启用调试模式
-DEBUG = False
\ No newline at end of file
+DEBUG = False
+
+# 按格式指定编解码后端：pillow（进程内编码，省去进程启动开销）或subprocess（jpegoptim/pngquant/cwebp/ImageMagick）
+# 未指定的格式使用内置映射：JPG/PNG/WebP使用pillow，其余使用subprocess
+CODEC_BACKENDS = {
+    'jpg': 'pillow',
+    'png': 'pillow',
+    'webp': 'pillow',
+}
+
+# 是否把ImageMagick调用合并为批处理（mogrify），每批只启动一次进程
+IMAGEMAGICK_BATCH = True
+
+# 每批最多文件数和最大总字节数
+IMAGEMAGICK_BATCH_MAX_FILES = 16
+IMAGEMAGICK_BATCH_MAX_BYTES = 64 * 1024 * 1024
+
+# 进程内编码（Pillow压缩/转换、PDF逐页保存、图片合并PDF）的执行引擎：
+# process：交给常驻进程池执行，不受GIL限制；thread：在处理线程中直接执行
+EXECUTION_ENGINE = 'process'
+
+# 进程池工作进程数，0表示CPU核心数减1
+PROCESS_POOL_WORKERS = 0
+
+# 是否跳过已压缩且未变化的文件：压缩记录保存在cache/compress_ledger.db，
+# 文件状态（路径、大小、mtime、内容指纹）与上次压缩输出一致且上次质量不高于本次质量时跳过，压缩失败过的文件未变化时也不再重试
+COMPRESS_LEDGER = True
+
+# PDF转图片时按页码区间并行渲染，每个区间的页数；每个区间占用一个重格式并发名额，与其他任务共享调度器的并发预算
+PDF_PAGES_PER_TASK = 8
+
+# 遍历目录树（统计格式、搜索、按格式删除、修复后缀、清理空文件夹、获取图片列表）时同时扫描的目录数，
+# 遍历主要等待I/O，NFS等高延迟文件系统上可以适当调大
+WALK_WORKERS = 8
+
+# 是否使用BASE_DIR元数据索引：目录和文件的路径、大小、mtime、扩展名保存在cache/metadata_index.db，
+# 浏览、统计格式、搜索以及压缩/转换任务的文件列表直接从索引读取；刷新时只重新扫描mtime变化的目录
+METADATA_INDEX = True
+
+# 后台增量刷新元数据索引的间隔（秒），0表示只在启动后刷新一次
+METADATA_INDEX_REFRESH_INTERVAL = 600
+
+# 是否使用inotify实时更新元数据索引（仅Linux）：inotify正常工作时跳过定时刷新；
+# 目录数超过fs.inotify.max_user_watches或inotify不可用时自动恢复按METADATA_INDEX_REFRESH_INTERVAL定时刷新
+METADATA_INDEX_WATCH = True
+
+# 缓存的目录列表数量：浏览文件夹时目录mtime不变则直接返回缓存的排序后列表，客户端已有最新列表时返回304
+LISTING_CACHE_SIZE = 256
+
+# 内存中缓存的文件名排序键数量：每个文件名的拼音+自然排序键只计算一次，启用元数据索引时同时持久化到索引数据库
+SORT_KEY_CACHE_SIZE = 200000
+
+# 是否使用文件名三元组索引加速搜索：按文件名中每三个连续字符建立倒排表，只对包含模式中全部字面量的候选文件执行匹配；
+# 启用元数据索引时从索引构建并随索引实时更新，否则遍历BASE_DIR构建；模式中没有长度不少于3的必需字面量时回退到逐个匹配
+NAME_INDEX = True
+
+# 没有元数据索引时遍历构建的文件名索引的有效期（秒），过期后在下一次搜索时重新构建
+NAME_INDEX_MAX_AGE = 600
+
+# 预览缩略图磁盘缓存的大小上限（MB）：悬停、网格和弹窗预览的缩放结果保存在cache/thumbnails，
+# 以路径、mtime、文件大小和尺寸为键，超出上限时淘汰最近最少使用的缩略图
+THUMBNAIL_CACHE_SIZE_MB = 512
+
+# 打开文件夹后在后台预取悬停预览缩略图的线程数，0表示不预取：只预取当前文件夹，可见的文件优先；
+# 预取线程以最低优先级运行，压缩/转换等批处理任务运行时只保留一个预取线程
+THUMBNAIL_PREFETCH_WORKERS = 2
+
+# 缩略图预取队列的长度上限，超出的文件不预取（悬停时再生成）
+THUMBNAIL_PREFETCH_QUEUE = 500
@@ -95,6 +95,7 @@ echo "DEBUG mode: $DEBUG"
 if [ "$DEBUG" = "True" ] || [ "$DEBUG" = "true" ]; then
     exec gosu $PUID:$ACTUAL_GID bash -c "umask $UMASK && python3 app.py"
 else
-    # 生产环境使用gunicorn，启动4个工作进程，增加超时时间到120秒
-    exec gosu $PUID:$ACTUAL_GID bash -c "umask $UMASK && gunicorn -w 1 -b 0.0.0.0:5000 --preload app:app"
+    # 生产环境使用gunicorn：任务状态保存在进程内存中，只启动1个工作进程；
+    # 使用多线程处理请求，流式推送任务结果的长连接不会阻塞其他请求
+    exec gosu $PUID:$ACTUAL_GID bash -c "umask $UMASK && gunicorn -w 1 --threads 8 -b 0.0.0.0:5000 --preload app:app"
 fi
\ No newline at end of file
@@ -0,0 +1,179 @@
+# 并行目录遍历
+# 统计格式、搜索、按格式删除、修复后缀、清理空文件夹和获取图片列表都需要遍历目录树。
+# 在NFS等高延迟文件系统上，单线程逐个目录scandir的耗时主要花在等待网络往返上，
+# 这里用线程池同时扫描多个目录，以生成器的形式逐个返回os.DirEntry（携带scandir已获取的类型和stat缓存），
+# 并统一处理隐藏文件、符号链接和BASE_DIR范围检查。
+# 任务使用walk_records得到FileRecord，大小、mtime和扩展名在扫描时取得一次，
+# 之后的过滤、处理和进度统计都不再stat原文件
+import os
+import logging
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+# 默认同时扫描的目录数，遍历主要等待I/O，可以高于CPU核心数
+DEFAULT_WALK_WORKERS = 8
+
+
+def is_within(path, base_dir):
+    """
+    判断路径是否位于base_dir内（包括base_dir本身）
+
+    Args:
+        path (str): 要检查的路径
+        base_dir (str): 根目录
+
+    Returns:
+        bool: 位于base_dir内时返回True
+    """
+    path = os.path.normpath(path)
+    base_dir = os.path.normpath(base_dir)
+    return path == base_dir or path.startswith(base_dir.rstrip(os.sep) + os.sep)
+
+
+def is_hidden(name):
+    """判断文件或目录名是否为隐藏文件"""
+    return name.startswith('.')
+
+
+class FileRecord:
+    """
+    扫描得到的文件记录，在过滤、处理和统计进度时传递，避免重复stat
+
+    Attributes:
+        path (str): 文件路径
+        name (str): 文件名
+        ext (str): 小写扩展名（不含点号），没有扩展名时为空字符串
+        size (int): 扫描时的文件大小
+        mtime_ns (int): 扫描时的mtime（纳秒）
+    """
+
+    __slots__ = ('path', 'name', 'ext', 'size', 'mtime_ns')
+
+    def __init__(self, path, name, size, mtime_ns, ext=None):
+        self.path = path
+        self.name = name
+        self.ext = (os.path.splitext(name)[1][1:] if ext is None else ext).lower()
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    @classmethod
+    def from_entry(cls, entry):
+        """从os.DirEntry创建，使用scandir缓存的stat结果（Linux上为一次lstat）"""
+        st = entry.stat(follow_symlinks=False)
+        return cls(entry.path, entry.name, st.st_size, st.st_mtime_ns)
+
+    @classmethod
+    def from_path(cls, path):
+        """从路径创建（单独选中的文件），文件不存在时抛出OSError"""
+        st = os.stat(path)
+        return cls(path, os.path.basename(path), st.st_size, st.st_mtime_ns)
+
+    @property
+    def state(self):
+        """(大小, mtime)，与压缩记录中的文件状态格式相同"""
+        return self.size, self.mtime_ns
+
+    def __repr__(self):
+        return f"FileRecord({self.path!r}, size={self.size})"
+
+
+def scan_directory(directory, base_dir=None, include_hidden=False, strict=False):
+    """
+    扫描单个目录
+
+    Args:
+        directory (str): 目录路径
+        base_dir (str, optional): 只返回位于该目录内的条目
+        include_hidden (bool): 是否返回隐藏文件和隐藏目录
+        strict (bool): 目录无法读取时抛出异常，而不是返回空结果
+
+    Returns:
+        tuple: (文件条目列表, 子目录条目列表)
+    """
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if not include_hidden and is_hidden(entry.name):
+                        continue
+                    if base_dir and not is_within(entry.path, base_dir):
+                        continue
+                    # 不跟随符号链接：指向目录的链接不进入，指向文件的链接不返回
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry)
+                    elif entry.is_file(follow_symlinks=False):
+                        files.append(entry)
+                except OSError as e:
+                    logger.error(f"处理条目 {entry.path} 失败: {e}")
+    except OSError as e:
+        if strict:
+            raise
+        logger.error(f"扫描目录 {directory} 失败: {e}")
+    return files, subdirs
+
+
+def walk(roots, base_dir=None, include_dirs=False, include_hidden=False,
+         max_workers=DEFAULT_WALK_WORKERS, should_stop=None):
+    """
+    并行遍历目录树
+
+    Args:
+        roots (str|list): 要遍历的目录或目录列表，不是目录的路径会被忽略
+        base_dir (str, optional): 只返回位于该目录内的条目，根目录不在范围内时跳过
+        include_dirs (bool): 是否同时返回子目录条目（不包括根目录本身）
+        include_hidden (bool): 是否返回以.开头的隐藏文件，并进入隐藏目录
+        max_workers (int): 同时扫描的目录数
+        should_stop (callable, optional): 返回True时停止扫描新的目录
+
+    Yields:
+        os.DirEntry: 文件条目（include_dirs为True时也包括目录条目），顺序不固定
+    """
+    if isinstance(roots, str):
+        roots = [roots]
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers),
+                                                     thread_name_prefix='file-walker')
+    pending = set()
+    try:
+        for root in roots:
+            if base_dir and not is_within(root, base_dir):
+                logger.warning(f"路径 {root} 不在BASE_DIR {base_dir} 范围内，跳过遍历")
+                continue
+            if os.path.isdir(root):
+                pending.add(executor.submit(scan_directory, root, base_dir, include_hidden))
+
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                # 先提交子目录，让线程池在调用方处理文件条目时继续扫描
+                if not (should_stop and should_stop()):
+                    for subdir in subdirs:
+                        pending.add(executor.submit(scan_directory, subdir.path, base_dir, include_hidden))
+                if include_dirs:
+                    yield from subdirs
+                yield from files
+    finally:
+        # 调用方提前结束迭代时取消尚未开始的扫描
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def walk_records(roots, base_dir=None, include_hidden=False,
+                 max_workers=DEFAULT_WALK_WORKERS, should_stop=None):
+    """
+    并行遍历目录树，返回文件记录
+
+    参数与walk相同，不返回目录
+
+    Yields:
+        FileRecord: 文件记录，顺序不固定；stat失败的文件跳过
+    """
+    for entry in walk(roots, base_dir=base_dir, include_hidden=include_hidden,
+                      max_workers=max_workers, should_stop=should_stop):
+        try:
+            yield FileRecord.from_entry(entry)
+        except OSError as e:
+            logger.error(f"获取文件信息失败: {entry.path}, 错误: {e}")
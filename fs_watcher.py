@@ -0,0 +1,295 @@
+# 基于inotify的元数据索引实时更新（仅Linux）
+# 增量刷新需要逐个stat目录，几百万个目录时代价仍然很高，而且两次刷新之间索引会过期。
+# 这里为索引中的每个目录添加inotify监视，把创建、删除、重命名、修改事件合并后按批写入索引：
+# - 达到内核监视数量上限（fs.inotify.max_user_watches）时不再添加监视，由调用方恢复定时刷新
+# - 事件队列溢出（IN_Q_OVERFLOW）时记录次数并增量刷新整个索引
+import os
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+import threading
+
+from file_walker import is_hidden, is_within
+
+logger = logging.getLogger(__name__)
+
+# inotify事件标志（linux/inotify.h）
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# 文件修改只监听IN_CLOSE_WRITE（写完时），不监听写入过程中大量产生的IN_MODIFY
+WATCH_MASK = (IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+# inotify_event结构体头部：wd, mask, cookie, len
+EVENT_HEADER = struct.Struct('iIII')
+
+# 事件合并写入索引的时间间隔（秒）
+DEFAULT_BATCH_INTERVAL = 1.0
+
+# 单次read的缓冲区大小
+READ_BUFFER_SIZE = 64 * 1024
+
+
+def _load_libc():
+    """加载libc中的inotify函数，不支持的平台返回None"""
+    name = ctypes.util.find_library('c')
+    if not name:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class InotifyWatcher:
+    """
+    监视BASE_DIR目录树并把变化写入元数据索引
+
+    - healthy为True时索引由事件实时更新，调用方可以跳过定时刷新
+    - 达到监视数量上限或inotify不可用时healthy为False，调用方应恢复定时刷新
+    - on_change(目录集合)在每批事件写入索引后调用，用于使依赖这些目录的缓存失效
+    """
+
+    def __init__(self, index, batch_interval=DEFAULT_BATCH_INTERVAL, on_change=None):
+        self.index = index
+        self.on_change = on_change
+        self.base_dir = index.base_dir
+        self.batch_interval = batch_interval
+        self._libc = None
+        self._fd = None
+        self._wd_to_path = {}
+        self._path_to_wd = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.active = False
+        self.limit_reached = False
+        self.error = None
+        self.overflows = 0
+        self.events = 0
+        self.batches = 0
+        self.last_batch_at = None
+
+    @property
+    def healthy(self):
+        return self.active and not self.limit_reached
+
+    def start(self):
+        """启动监视线程，inotify不可用时返回False"""
+        self._libc = _load_libc()
+        if self._libc is None or not hasattr(self._libc, 'inotify_init1'):
+            self.error = 'inotify不可用'
+            logger.warning("当前平台不支持inotify，元数据索引使用定时刷新")
+            return False
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            self.error = os.strerror(err)
+            logger.warning(f"初始化inotify失败: {self.error}，元数据索引使用定时刷新")
+            return False
+        self._fd = fd
+        self._thread = threading.Thread(target=self._run, name='index-watcher', daemon=True)
+        self._thread.start()
+        return True
+
+    # ---------- 监视管理 ----------
+
+    def _add_watch(self, path):
+        """为单个目录添加监视，达到数量上限时返回False"""
+        if self.limit_reached:
+            return False
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                self.limit_reached = True
+                logger.warning(f"已达到inotify监视数量上限（已监视 {len(self._wd_to_path)} 个目录），"
+                               f"请调大fs.inotify.max_user_watches；元数据索引恢复定时刷新")
+                return False
+            if err not in (errno.ENOENT, errno.ENOTDIR):
+                logger.debug(f"添加inotify监视失败: {path}, 错误: {os.strerror(err)}")
+            return True
+        with self._lock:
+            old_path = self._wd_to_path.get(wd)
+            if old_path is not None and old_path != path:
+                self._path_to_wd.pop(old_path, None)
+            self._wd_to_path[wd] = path
+            self._path_to_wd[path] = wd
+        return True
+
+    def _watch_tree(self, root):
+        """为索引中root及其下所有目录添加监视"""
+        for path in self.index.directories(root):
+            if not self._add_watch(path):
+                break
+
+    def _watch_new_tree(self, root):
+        """
+        为新建或移入的目录添加监视并扫描其内容
+
+        先添加监视再扫描，逐层进行：扫描发现的子目录同样先添加监视再扫描，
+        扫描与添加监视之间创建的文件和目录不会遗漏（之后的变化由事件更新）
+        """
+        attempted = set()
+        pending = [root]
+        while pending:
+            for path in pending:
+                attempted.add(path)
+                if not self._add_watch(path):
+                    # 达到监视数量上限，由定时刷新补上
+                    self.index.refresh(root)
+                    return
+            self.index.refresh_dirs(pending)
+            pending = [path for path in self.index.directories(root) if path not in attempted]
+
+    def _unwatch_tree(self, root):
+        """移除root及其下所有目录的监视（目录被移出或删除）"""
+        with self._lock:
+            paths = [path for path in self._path_to_wd if is_within(path, root)]
+            wds = [self._path_to_wd.pop(path) for path in paths]
+            for wd in wds:
+                self._wd_to_path.pop(wd, None)
+        for wd in wds:
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    # ---------- 事件处理 ----------
+
+    def _read_events(self):
+        """读取并解析当前可读的所有事件"""
+        try:
+            data = os.read(self._fd, READ_BUFFER_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def _run(self):
+        try:
+            # 先添加监视，再增量刷新一次，补上添加监视之前发生的变化
+            self._watch_tree(self.base_dir)
+            self.active = True
+            logger.info(f"已启动inotify监视，监视 {len(self._wd_to_path)} 个目录")
+            self.index.refresh()
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"启动inotify监视失败: {e}")
+            return
+
+        try:
+            self._loop()
+        except Exception as e:
+            # 监视线程退出后索引不再实时更新，调用方据此恢复定时刷新
+            self.error = str(e)
+            logger.error(f"inotify监视线程异常退出: {e}，元数据索引恢复定时刷新", exc_info=True)
+        finally:
+            self.active = False
+
+    def _loop(self):
+        """读取事件并按批写入索引"""
+        changed = set()
+        new_dirs = set()
+        removed_dirs = set()
+        overflow = False
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                readable, _, _ = select.select([self._fd], [], [], timeout)
+            except InterruptedError:
+                continue
+            if readable:
+                for wd, mask, name in self._read_events():
+                    self.events += 1
+                    if mask & IN_Q_OVERFLOW:
+                        overflow = True
+                        continue
+                    if mask & IN_IGNORED:
+                        with self._lock:
+                            path = self._wd_to_path.pop(wd, None)
+                            if path is not None and self._path_to_wd.get(path) == wd:
+                                del self._path_to_wd[path]
+                        continue
+                    with self._lock:
+                        directory = self._wd_to_path.get(wd)
+                    if directory is None or mask & IN_DELETE_SELF or not name or is_hidden(name):
+                        continue
+                    path = os.path.join(directory, name)
+                    changed.add(path)
+                    if mask & IN_ISDIR:
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            new_dirs.add(path)
+                        elif mask & (IN_DELETE | IN_MOVED_FROM):
+                            removed_dirs.add(path)
+                            new_dirs.discard(path)
+                if deadline is None and (changed or overflow):
+                    deadline = time.monotonic() + self.batch_interval
+            if deadline is not None and time.monotonic() >= deadline:
+                self._flush(changed, new_dirs, removed_dirs, overflow)
+                changed, new_dirs, removed_dirs = set(), set(), set()
+                overflow = False
+                deadline = None
+
+    def _flush(self, changed, new_dirs, removed_dirs, overflow):
+        """把一批事件写入索引"""
+        try:
+            for path in removed_dirs:
+                self._unwatch_tree(path)
+            self.index.update_paths(changed)
+            if self.on_change:
+                self.on_change({os.path.dirname(path) for path in changed} | new_dirs | removed_dirs)
+            for path in new_dirs:
+                # 新建或移入的目录：添加监视并扫描其内容
+                if os.path.isdir(path):
+                    self._watch_new_tree(path)
+            if overflow:
+                self.overflows += 1
+                logger.warning(f"inotify事件队列溢出（第 {self.overflows} 次），部分事件已丢失，增量刷新整个索引")
+                self.index.refresh()
+            self.batches += 1
+            self.last_batch_at = time.time()
+            logger.debug(f"已写入一批文件系统事件: {len(changed)} 个路径，新目录 {len(new_dirs)} 个，删除目录 {len(removed_dirs)} 个")
+        except Exception as e:
+            logger.error(f"写入文件系统事件失败: {e}")
+
+    def to_dict(self):
+        with self._lock:
+            watches = len(self._wd_to_path)
+        return {
+            'active': self.active,
+            'healthy': self.healthy,
+            'watches': watches,
+            'limit_reached': self.limit_reached,
+            'overflows': self.overflows,
+            'events': self.events,
+            'batches': self.batches,
+            'last_batch_at': self.last_batch_at,
+            'error': self.error,
+        }
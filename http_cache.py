@@ -0,0 +1,76 @@
+# HTTP缓存验证和断点续传
+# /preview、/download和/download_upload_result原来直接返回send_file的默认结果：
+# ETag取自实际发送的文件（缩略图重新生成后就会变化），Cache-Control一律为no-cache，
+# 重复查看时要重新生成或重新下载。这里统一处理：
+# - 强ETag由原文件路径、mtime、大小和变体（预览尺寸等）计算，Last-Modified使用原文件的mtime
+# - 条件请求（If-None-Match/If-Modified-Since）在生成缩略图之前就返回304
+# - 每个接口使用各自的Cache-Control
+# - Range请求返回206（磁盘上的原文件和缓存的缩略图都支持），大文件下载可以断点续传
+import hashlib
+from datetime import datetime, timezone
+from flask import request, send_file, make_response
+from werkzeug.http import is_resource_modified
+
+# 预览：URL不随文件内容变化（压缩后同一URL返回新的内容），每次用ETag验证
+PREVIEW_CACHE_CONTROL = 'private, no-cache'
+
+# 下载BASE_DIR中的文件：同样需要每次验证
+DOWNLOAD_CACHE_CONTROL = 'private, no-cache'
+
+# 上传处理结果：任务目录中的结果文件在任务过期前不会变化
+UPLOAD_RESULT_CACHE_CONTROL = 'private, max-age=3600'
+
+
+def file_etag(path, st, variant=''):
+    """
+    强ETag：原文件路径 + mtime + 大小 + 变体
+
+    Args:
+        path (str): 原文件路径
+        st (os.stat_result): 原文件的stat结果
+        variant (str): 同一文件的不同表示（如预览尺寸），原样发送时可以为空
+    """
+    raw = f"{path}|{st.st_mtime_ns}|{st.st_size}|{variant}"
+    return hashlib.blake2b(raw.encode('utf-8', 'surrogateescape'), digest_size=16).hexdigest()
+
+
+def last_modified(st):
+    """Last-Modified：原文件的mtime（HTTP日期精确到秒）"""
+    return datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+
+
+def not_modified(etag, st, cache_control):
+    """
+    客户端缓存仍然有效时返回304响应，否则返回None
+
+    Args:
+        etag (str): file_etag的结果
+        st (os.stat_result): 原文件的stat结果
+        cache_control (str): Cache-Control响应头
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified(st)):
+        return None
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.last_modified = last_modified(st)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def send_cached_file(path, etag, st, cache_control, **kwargs):
+    """
+    发送文件，带上ETag、Last-Modified和Cache-Control，并处理条件请求和Range请求
+
+    Args:
+        path (str): 实际发送的文件（原文件或缓存的缩略图）
+        etag (str): file_etag的结果（由原文件计算）
+        st (os.stat_result): 原文件的stat结果
+        cache_control (str): Cache-Control响应头
+        **kwargs: 传给send_file的其他参数（mimetype、as_attachment等）
+
+    Raises:
+        werkzeug.exceptions.RequestedRangeNotSatisfiable: Range超出文件范围（416）
+    """
+    response = send_file(path, etag=etag, last_modified=last_modified(st), conditional=True, **kwargs)
+    response.headers['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,261 @@
+# 目录列表缓存
+# 浏览文件夹时，每次请求都要scandir、逐个stat，再用natsorted + lazy_pinyin排序，
+# 文件夹内容没有变化时这些工作都是重复的。这里缓存排序后的列表：
+# - 以目录路径和目录mtime为键，mtime变化（增删条目）时重新生成；文件被原地修改时由调用方使缓存失效
+# - 每个列表有一个版本号，用作ETag，客户端带上版本号时可以得到304；获取完整列表（不分页）时还可以只获取变化的条目
+# - 十几万个文件的目录按页返回：按排序方式和后缀过滤生成的视图缓存在列表上，游标记录视图和位置
+import os
+import json
+import base64
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+
+# 默认缓存的目录数
+DEFAULT_MAX_ENTRIES = 256
+
+# 每个目录保留的历史版本数，用于计算增量结果
+DEFAULT_HISTORY = 4
+
+# 支持的排序方式
+SORT_FIELDS = ('name', 'size', 'mtime', 'format')
+
+# 单页最大条目数
+MAX_PAGE_SIZE = 5000
+
+# 每个列表缓存的视图数（排序方式 + 顺序 + 后缀过滤的组合）
+MAX_VIEWS = 8
+
+
+def _signature(item):
+    """条目的比较签名，任一字段变化都视为条目有变化"""
+    return item['type'], item['size'], item['mtime'], item['name']
+
+
+def _format_key(item):
+    """按格式排序的键：文件后缀（小写）"""
+    return os.path.splitext(item['name'])[1].lower()
+
+
+def _size_key(item):
+    return item['size']
+
+
+def _mtime_key(item):
+    return item['mtime']
+
+
+_VIEW_KEYS = {'size': _size_key, 'mtime': _mtime_key, 'format': _format_key}
+
+
+def parse_extensions(value):
+    """把逗号分隔的后缀过滤参数解析为排序后的小写后缀元组（不带点），空字符串表示不过滤"""
+    exts = {ext.strip().lower().lstrip('.') for ext in value.split(',')}
+    exts.discard('')
+    return tuple(sorted(exts))
+
+
+def encode_cursor(data):
+    """把游标内容编码为不透明的字符串"""
+    raw = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，格式不正确时抛出ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"无效的游标: {e}")
+    if not isinstance(data, dict) or not isinstance(data.get('o'), int) or data['o'] < 0:
+        raise ValueError("无效的游标")
+    return data
+
+
+class Listing:
+    """一个目录在某个版本的排序后列表"""
+
+    __slots__ = ('path', 'mtime_ns', 'version', 'files', 'views', '_lock')
+
+    def __init__(self, path, mtime_ns, version, files):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.version = version
+        self.files = files
+        # (排序方式, 是否倒序, 后缀过滤) -> 条目列表
+        self.views = OrderedDict()
+        self._lock = threading.Lock()
+
+    def view(self, sort='name', reverse=False, exts=()):
+        """
+        返回按指定方式排序和过滤后的条目列表，文件夹始终在文件之前
+
+        Args:
+            sort (str): 排序方式，name（自然排序+拼音，即files的顺序）、size、mtime、format
+            reverse (bool): 是否倒序
+            exts (tuple): 只保留这些后缀的文件（小写，不带点），文件夹不过滤；为空时不过滤
+
+        说明：
+            - 排序是稳定的，大小、时间或格式相同的条目保持名称顺序
+            - 生成的视图缓存在列表上，翻页时不再重新排序
+        """
+        key = (sort, reverse, exts)
+        with self._lock:
+            items = self.views.get(key)
+            if items is not None:
+                self.views.move_to_end(key)
+                return items
+
+        dirs = [item for item in self.files if item['type'] == 'dir']
+        files = [item for item in self.files if item['type'] != 'dir']
+        if exts:
+            files = [item for item in files if _format_key(item)[1:] in exts]
+        if sort in _VIEW_KEYS:
+            dirs.sort(key=_VIEW_KEYS[sort], reverse=reverse)
+            files.sort(key=_VIEW_KEYS[sort], reverse=reverse)
+        elif reverse:
+            dirs.reverse()
+            files.reverse()
+        items = dirs + files
+
+        with self._lock:
+            self.views[key] = items
+            while len(self.views) > MAX_VIEWS:
+                self.views.popitem(last=False)
+        return items
+
+    def view_version(self, sort, reverse, exts, page_size):
+        """分页响应的版本号（ETag），列表版本号相同但排序、过滤或页大小不同时也不同"""
+        params = f"{sort}|{int(reverse)}|{','.join(exts)}|{page_size}"
+        return f"{self.version}.{hashlib.blake2b(params.encode('utf-8'), digest_size=4).hexdigest()}"
+
+    def page(self, items, offset, page_size):
+        """
+        从视图中取一页
+
+        Returns:
+            tuple: (本页条目, 下一页的游标，没有更多条目时为None)
+        """
+        page = items[offset:offset + page_size]
+        end = offset + len(page)
+        if end >= len(items) or not page:
+            return page, None
+        return page, encode_cursor({'v': self.version, 'o': end, 'p': page[-1]['path']})
+
+    def resume(self, items, cursor):
+        """
+        计算游标在视图中的位置
+
+        说明：
+            - 游标生成后目录没有变化时直接使用其中的位置
+            - 目录有变化时（版本号不同）在新的视图中查找上一页最后一个条目，从它之后继续，
+              避免新增或删除的条目导致重复或遗漏；该条目已被删除时退回原位置
+        """
+        offset = cursor['o']
+        if cursor.get('v') == self.version:
+            return offset
+        last_path = cursor.get('p')
+        for position, item in enumerate(items):
+            if item['path'] == last_path:
+                return position + 1
+        return min(offset, len(items))
+
+
+class ListingCache:
+    """
+    排序后目录列表的LRU缓存，多个线程共享，通过锁串行访问
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, history=DEFAULT_HISTORY):
+        self.max_entries = max_entries
+        self.history = history
+        self._listings = OrderedDict()
+        # 目录路径 -> OrderedDict(版本号 -> {条目路径: 签名})
+        self._versions = OrderedDict()
+        self._counter = itertools.count(1)
+        # 进程重启后序号从头开始，加上随机前缀避免与重启前的版本号重复
+        self._epoch = os.urandom(2).hex()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _make_version(self, path, mtime_ns):
+        """版本号：目录路径摘要 + 目录mtime + 进程前缀和自增序号（同一mtime下缓存失效后重新生成的列表版本号也不同）"""
+        digest = hashlib.blake2b(os.fsencode(path), digest_size=4).hexdigest()
+        return f"{digest}-{mtime_ns:x}-{self._epoch}{next(self._counter):x}"
+
+    def get(self, path, mtime_ns):
+        """
+        返回缓存的列表，目录mtime与缓存时不同时返回None
+
+        Args:
+            path (str): 目录路径
+            mtime_ns (int): 目录当前的mtime
+        """
+        with self._lock:
+            listing = self._listings.get(path)
+            if listing is None or listing.mtime_ns != mtime_ns:
+                self.misses += 1
+                return None
+            self._listings.move_to_end(path)
+            self.hits += 1
+            return listing
+
+    def put(self, path, mtime_ns, files):
+        """
+        缓存目录的排序后列表，返回带版本号的Listing
+
+        Args:
+            path (str): 目录路径
+            mtime_ns (int): 生成列表前读取的目录mtime
+            files (list): 排序后的条目列表（dict，包含name、path、type、size、mtime）
+        """
+        with self._lock:
+            listing = Listing(path, mtime_ns, self._make_version(path, mtime_ns), files)
+            self._listings[path] = listing
+            self._listings.move_to_end(path)
+            while len(self._listings) > self.max_entries:
+                self._listings.popitem(last=False)
+
+            versions = self._versions.setdefault(path, OrderedDict())
+            versions[listing.version] = {item['path']: _signature(item) for item in files}
+            while len(versions) > self.history:
+                versions.popitem(last=False)
+            self._versions.move_to_end(path)
+            while len(self._versions) > self.max_entries:
+                self._versions.popitem(last=False)
+            return listing
+
+    def delta(self, listing, since):
+        """
+        计算从客户端版本since到listing的增量
+
+        Returns:
+            dict|None: {'changed': 新增或变化的条目, 'removed': 删除的条目路径, 'order': 排序后的条目路径}，
+                       since不在历史版本中时返回None（客户端需要完整列表）
+        """
+        with self._lock:
+            old = self._versions.get(listing.path, {}).get(since)
+        if old is None:
+            return None
+        current = set()
+        changed = []
+        for item in listing.files:
+            current.add(item['path'])
+            if old.get(item['path']) != _signature(item):
+                changed.append(item)
+        removed = [path for path in old if path not in current]
+        return {'changed': changed, 'removed': removed, 'order': [item['path'] for item in listing.files]}
+
+    def invalidate(self, paths):
+        """使目录的缓存列表失效（目录中的文件被原地修改，目录mtime不变）；历史版本保留用于增量"""
+        with self._lock:
+            for path in paths:
+                self._listings.pop(os.path.normpath(path), None)
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            return {'entries': len(self._listings), 'hits': self.hits, 'misses': self.misses}
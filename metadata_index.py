@@ -0,0 +1,592 @@
+# BASE_DIR元数据索引
+# 浏览、统计格式、搜索和压缩/转换任务都需要知道目录树中有哪些文件，每次都从磁盘重新遍历，
+# 在NFS上几百万个文件需要几分钟。这里用SQLite持久化保存目录和文件的元数据：
+# - 文件：路径、大小、mtime、扩展名，以及按需读取的宽高和EXIF拍摄时间
+# - 目录：目录mtime和上次扫描时的mtime，目录mtime不变说明其中的条目没有增删，刷新时不再scandir
+# 增量刷新只对mtime变化的目录重新scandir，未变化的目录直接从索引中取得子目录继续向下检查
+# 每个目录保存整棵子树按扩展名汇总的文件数和大小，目录中的文件变化时只使该目录及其上级目录的汇总失效，
+# 统计格式时只重新汇总失效的目录，其余直接读取
+import os
+import stat
+import time
+import sqlite3
+import logging
+import threading
+import concurrent.futures
+from PIL import Image
+
+from file_walker import DEFAULT_WALK_WORKERS, is_hidden, is_within, scan_directory
+
+logger = logging.getLogger(__name__)
+
+# EXIF拍摄时间标签：DateTimeOriginal位于Exif子IFD，DateTime位于IFD0
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER,
+    scanned_mtime_ns INTEGER,
+    scanned_at REAL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    exif_date TEXT,
+    details_loaded INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sort_keys (
+    name TEXT PRIMARY KEY,
+    sort_key TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    dir TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (dir, ext)
+);
+CREATE TABLE IF NOT EXISTS rollup_dirs (
+    path TEXT PRIMARY KEY
+);
+"""
+
+# 按名称批量查询排序键时每条SQL的参数个数（SQLite默认上限999）
+SORT_KEY_BATCH = 500
+
+# 文件内容变化（大小或mtime不同）时清空按需读取的字段
+UPSERT_FILE = (
+    'INSERT INTO files (path, dir, name, ext, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT(path) DO UPDATE SET '
+    'width = CASE WHEN files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns THEN files.width END, '
+    'height = CASE WHEN files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns THEN files.height END, '
+    'exif_date = CASE WHEN files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns THEN files.exif_date END, '
+    'details_loaded = CASE WHEN files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns '
+    'THEN files.details_loaded ELSE 0 END, '
+    'size = excluded.size, mtime_ns = excluded.mtime_ns'
+)
+
+
+def file_ext(name):
+    """返回文件扩展名（保留大小写，不含点号），没有扩展名时返回空字符串"""
+    return os.path.splitext(name)[1][1:]
+
+
+def subtree_range(root):
+    """
+    返回root下所有路径的字符串范围 [lo, hi)，用于在path索引上做范围查询
+    '0'是'/'之后的下一个字符，root/之后的所有路径都小于root0
+    """
+    prefix = os.path.normpath(root).rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def read_exif_date(img):
+    """读取EXIF拍摄时间，优先DateTimeOriginal，没有时返回None"""
+    try:
+        exif = img.getexif()
+    except Exception:
+        return None
+    if not exif:
+        return None
+    value = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+    if isinstance(value, bytes):
+        value = value.decode('ascii', errors='ignore')
+    if not isinstance(value, str):
+        return None
+    return value.strip('\x00 ') or None
+
+
+class MetadataIndex:
+    """
+    BASE_DIR元数据索引，多个线程共享一个SQLite连接，通过锁串行访问
+    """
+
+    def __init__(self, db_path, base_dir, walk_workers=DEFAULT_WALK_WORKERS):
+        self.db_path = db_path
+        self.base_dir = os.path.normpath(base_dir)
+        self.walk_workers = walk_workers
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._listeners = []
+        # 本进程中重新汇总的目录数
+        self.rollups_computed = 0
+
+    def add_listener(self, callback):
+        """
+        注册文件变更通知，每次写入索引后调用 callback(新增或更新的文件, 删除的文件, 删除的目录)
+        - 新增或更新的文件：[(路径, 文件名, 大小), ...]
+        - 删除的文件：[路径, ...]
+        - 删除的目录：[路径, ...]，其下所有文件和目录都已删除
+        回调在索引的锁内调用，与写入的顺序一致，不能再访问索引
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, upserted, removed_files, removed_dirs):
+        """通知文件变更，调用时需持有锁"""
+        if not (upserted or removed_files or removed_dirs):
+            return
+        for callback in self._listeners:
+            try:
+                callback(upserted, removed_files, removed_dirs)
+            except Exception as e:
+                logger.error(f"索引变更通知失败: {e}")
+
+    # ---------- 刷新 ----------
+
+    def _visit(self, directory, force):
+        """
+        在工作线程中检查单个目录，目录mtime未变化时只从索引中取出子目录
+
+        Returns:
+            tuple: (目录, 目录mtime, 文件行列表, 子目录行列表)
+                - 目录不存在时目录mtime为None
+                - 目录未变化时文件行列表为None，子目录行列表为子目录路径列表
+        """
+        try:
+            st = os.stat(directory)
+            with self._lock:
+                row = self._conn.execute(
+                    'SELECT scanned_mtime_ns FROM dirs WHERE path = ?', (directory,)
+                ).fetchone()
+                if not force and row and row[0] == st.st_mtime_ns:
+                    subdirs = [r[0] for r in self._conn.execute(
+                        'SELECT path FROM dirs WHERE parent = ?', (directory,)
+                    )]
+                    return directory, st.st_mtime_ns, None, subdirs
+            files, subdirs = scan_directory(directory, self.base_dir, strict=True)
+        except FileNotFoundError:
+            return directory, None, None, []
+
+        file_rows = []
+        for entry in files:
+            try:
+                fst = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            file_rows.append((entry.path, directory, entry.name, file_ext(entry.name), fst.st_size, fst.st_mtime_ns))
+        subdir_rows = []
+        for entry in subdirs:
+            try:
+                subdir_rows.append((entry.path, directory, entry.stat(follow_symlinks=False).st_mtime_ns))
+            except OSError:
+                continue
+        return directory, st.st_mtime_ns, file_rows, subdir_rows
+
+    def _remove_tree(self, directory):
+        """删除目录及其下所有目录和文件的记录，调用时需持有锁"""
+        lo, hi = subtree_range(directory)
+        self._conn.execute('DELETE FROM files WHERE dir = ? OR (path >= ? AND path < ?)', (directory, lo, hi))
+        self._conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (directory, lo, hi))
+        self._conn.execute('DELETE FROM rollups WHERE dir = ? OR (dir >= ? AND dir < ?)', (directory, lo, hi))
+        self._conn.execute('DELETE FROM rollup_dirs WHERE path = ? OR (path >= ? AND path < ?)', (directory, lo, hi))
+        self._invalidate_rollups([os.path.dirname(directory)])
+
+    def _invalidate_rollups(self, directories):
+        """使目录及其所有上级目录（直到BASE_DIR）的汇总失效，调用时需持有锁"""
+        stale = set()
+        for directory in directories:
+            directory = os.path.normpath(directory)
+            while directory not in stale and is_within(directory, self.base_dir):
+                stale.add(directory)
+                parent = os.path.dirname(directory)
+                if parent == directory:
+                    break
+                directory = parent
+        self._conn.executemany('DELETE FROM rollups WHERE dir = ?', ((d,) for d in stale))
+        self._conn.executemany('DELETE FROM rollup_dirs WHERE path = ?', ((d,) for d in stale))
+
+    def _apply(self, result):
+        """
+        把_visit的结果写入索引
+
+        Returns:
+            tuple: (需要继续检查的子目录列表, 是否重新扫描了该目录)
+        """
+        directory, mtime_ns, file_rows, subdir_rows = result
+        with self._lock:
+            if mtime_ns is None:
+                self._remove_tree(directory)
+                self._conn.commit()
+                self._notify([], [], [directory])
+                return [], True
+            if file_rows is None:
+                return subdir_rows, False
+
+            removed_files = []
+            removed_dirs = []
+            current_files = {row[0] for row in file_rows}
+            for (path,) in self._conn.execute('SELECT path FROM files WHERE dir = ?', (directory,)).fetchall():
+                if path not in current_files:
+                    self._conn.execute('DELETE FROM files WHERE path = ?', (path,))
+                    removed_files.append(path)
+            self._conn.executemany(UPSERT_FILE, file_rows)
+            self._invalidate_rollups([directory])
+
+            current_dirs = {row[0] for row in subdir_rows}
+            for (path,) in self._conn.execute('SELECT path FROM dirs WHERE parent = ?', (directory,)).fetchall():
+                if path not in current_dirs:
+                    self._remove_tree(path)
+                    removed_dirs.append(path)
+            self._conn.executemany(
+                'INSERT INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?) '
+                'ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns',
+                subdir_rows
+            )
+            self._conn.execute(
+                'INSERT INTO dirs (path, parent, mtime_ns, scanned_mtime_ns, scanned_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns, '
+                'scanned_mtime_ns = excluded.scanned_mtime_ns, scanned_at = excluded.scanned_at',
+                (directory, os.path.dirname(directory), mtime_ns, mtime_ns, time.time())
+            )
+            self._conn.commit()
+            self._notify([(row[0], row[2], row[4]) for row in file_rows], removed_files, removed_dirs)
+        return list(current_dirs), True
+
+    def refresh(self, root=None, full=False, on_progress=None, should_stop=None):
+        """
+        增量刷新索引：只对mtime变化的目录重新scandir
+
+        Args:
+            root (str, optional): 要刷新的目录，默认为BASE_DIR
+            full (bool): 是否强制重新扫描所有目录（目录内文件被原地修改时目录mtime不会变化）
+            on_progress (callable, optional): 每检查完一个目录调用 on_progress(已检查目录数, 当前目录)
+            should_stop (callable, optional): 返回True时停止检查新的目录
+
+        Returns:
+            dict: {'dirs': 检查的目录数, 'rescanned': 重新扫描的目录数, 'elapsed': 耗时（秒）}
+        """
+        root = os.path.normpath(root or self.base_dir)
+        if not is_within(root, self.base_dir):
+            raise ValueError(f"路径 {root} 不在索引范围 {self.base_dir} 内")
+
+        start = time.monotonic()
+        visited = 0
+        rescanned = 0
+        completed = True
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.walk_workers),
+                                                         thread_name_prefix='metadata-index')
+        try:
+            pending = {executor.submit(self._visit, root, full)}
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                        subdirs, changed = self._apply(result)
+                    except Exception as e:
+                        logger.error(f"刷新索引目录失败: {e}")
+                        completed = False
+                        continue
+                    visited += 1
+                    rescanned += changed
+                    if on_progress:
+                        on_progress(visited, result[0])
+                    if should_stop and should_stop():
+                        completed = False
+                        continue
+                    for subdir in subdirs:
+                        pending.add(executor.submit(self._visit, subdir, full))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        elapsed = time.monotonic() - start
+        if completed and root == self.base_dir:
+            self._set_meta('last_refresh', str(time.time()))
+        logger.info(f"索引刷新完成: {root}, 检查 {visited} 个目录，重新扫描 {rescanned} 个，耗时 {elapsed:.2f} 秒")
+        return {'dirs': visited, 'rescanned': rescanned, 'elapsed': elapsed}
+
+    def refresh_dirs(self, directories):
+        """
+        重新扫描指定目录（不递归），用于本程序修改了目录中的文件之后
+        目录已不存在时删除其记录
+
+        Args:
+            directories (iterable): 目录路径
+        """
+        for directory in set(os.path.normpath(d) for d in directories):
+            if not is_within(directory, self.base_dir):
+                continue
+            try:
+                self._apply(self._visit(directory, True))
+            except Exception as e:
+                logger.error(f"刷新索引目录失败: {directory}, 错误: {e}")
+
+    def update_paths(self, paths):
+        """
+        按文件系统事件更新索引中的路径（不递归）
+        - 路径不存在：删除该文件的记录，或该目录及其下所有记录
+        - 普通文件：更新大小和mtime
+        - 目录：只记录目录本身，目录内容由调用方刷新
+        隐藏文件、符号链接和BASE_DIR之外的路径被忽略
+
+        Args:
+            paths (iterable): 发生变化的路径
+        """
+        rows = []
+        for path in set(os.path.normpath(p) for p in paths):
+            if path == self.base_dir or not is_within(path, self.base_dir) or is_hidden(os.path.basename(path)):
+                continue
+            try:
+                st = os.lstat(path)
+            except FileNotFoundError:
+                st = None
+            except OSError as e:
+                logger.debug(f"读取文件状态失败: {path}, 错误: {e}")
+                continue
+            rows.append((path, st))
+        if not rows:
+            return
+        upserted = []
+        removed_files = []
+        removed_dirs = []
+        with self._lock:
+            for path, st in rows:
+                if st is not None and stat.S_ISREG(st.st_mode):
+                    name = os.path.basename(path)
+                    self._conn.execute(UPSERT_FILE, (
+                        path, os.path.dirname(path), name, file_ext(name), st.st_size, st.st_mtime_ns
+                    ))
+                    upserted.append((path, name, st.st_size))
+                elif st is not None and stat.S_ISDIR(st.st_mode):
+                    if self._conn.execute('DELETE FROM files WHERE path = ?', (path,)).rowcount:
+                        removed_files.append(path)
+                    self._conn.execute(
+                        'INSERT INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?) '
+                        'ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns',
+                        (path, os.path.dirname(path), st.st_mtime_ns)
+                    )
+                else:
+                    # 已删除，或变成了符号链接等不索引的类型
+                    if self._conn.execute('DELETE FROM files WHERE path = ?', (path,)).rowcount:
+                        removed_files.append(path)
+                    else:
+                        self._remove_tree(path)
+                        removed_dirs.append(path)
+            self._invalidate_rollups(os.path.dirname(path) for path, _ in rows)
+            self._conn.commit()
+            self._notify(upserted, removed_files, removed_dirs)
+
+    # ---------- 查询 ----------
+
+    def directories(self, root=None):
+        """返回索引中root及其下所有目录的路径"""
+        root = os.path.normpath(root or self.base_dir)
+        lo, hi = subtree_range(root)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                'SELECT path FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (root, lo, hi)
+            )]
+
+    def _get_meta(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+            self._conn.commit()
+
+    @property
+    def ready(self):
+        """是否已完成过一次BASE_DIR的完整刷新"""
+        return self._get_meta('last_refresh') is not None
+
+    def covers(self, path):
+        """索引是否可以回答该路径的查询"""
+        return self.ready and is_within(path, self.base_dir)
+
+    def files_under(self, root):
+        """
+        返回目录下（递归）的所有文件
+
+        Returns:
+            list: [(路径, 文件名, 扩展名, 大小, mtime_ns), ...]
+        """
+        root = os.path.normpath(root)
+        lo, hi = subtree_range(root)
+        with self._lock:
+            return self._conn.execute(
+                'SELECT path, name, ext, size, mtime_ns FROM files WHERE dir = ? OR (path >= ? AND path < ?)',
+                (root, lo, hi)
+            ).fetchall()
+
+    def format_stats(self, root):
+        """
+        按扩展名统计目录下（递归）的文件数量和大小，使用每个目录保存的子树汇总
+
+        Returns:
+            list: [(扩展名, 文件数, 总大小), ...]
+
+        说明：
+            - 汇总有效的目录直接读取；失效或尚未汇总的目录由其自身的文件和各子目录的汇总合并得到
+            - 每次只在锁内处理一个目录，汇总期间索引仍可写入；子目录在合并前又失效时重新汇总
+        """
+        root = os.path.normpath(root)
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            with self._lock:
+                if self._rollup_valid(directory):
+                    continue
+                children = [row[0] for row in self._conn.execute(
+                    'SELECT path FROM dirs WHERE parent = ?', (directory,)
+                )]
+                stale = [child for child in children if not self._rollup_valid(child)]
+                if stale:
+                    # 先汇总子目录（深度优先，用栈代替递归）
+                    stack.append(directory)
+                    stack.extend(stale)
+                    continue
+                totals = {}
+                for ext, count, size in self._conn.execute(
+                    'SELECT ext, COUNT(*), SUM(size) FROM files WHERE dir = ? GROUP BY ext', (directory,)
+                ):
+                    totals[ext] = [count, size]
+                for child in children:
+                    for ext, count, size in self._conn.execute(
+                        'SELECT ext, count, size FROM rollups WHERE dir = ?', (child,)
+                    ):
+                        total = totals.setdefault(ext, [0, 0])
+                        total[0] += count
+                        total[1] += size
+                if self._conn.execute('SELECT 1 FROM dirs WHERE path = ?', (directory,)).fetchone() is None:
+                    # 不在索引中的目录（尚未扫描）不保存汇总
+                    return [(ext, count, size) for ext, (count, size) in totals.items()]
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO rollups (dir, ext, count, size) VALUES (?, ?, ?, ?)',
+                    ((directory, ext, count, size) for ext, (count, size) in totals.items())
+                )
+                self._conn.execute('INSERT OR REPLACE INTO rollup_dirs (path) VALUES (?)', (directory,))
+                self._conn.commit()
+                self.rollups_computed += 1
+        with self._lock:
+            return self._conn.execute('SELECT ext, count, size FROM rollups WHERE dir = ?', (root,)).fetchall()
+
+    def _rollup_valid(self, directory):
+        """目录的子树汇总是否有效，调用时需持有锁"""
+        return self._conn.execute('SELECT 1 FROM rollup_dirs WHERE path = ?', (directory,)).fetchone() is not None
+
+    def list_dir(self, directory):
+        """
+        返回目录的直接子目录和文件，目录mtime变化时先重新扫描该目录
+
+        Returns:
+            tuple: ([(子目录路径, 名称, mtime_ns), ...], [(文件路径, 文件名, 大小, mtime_ns), ...])
+        """
+        directory = os.path.normpath(directory)
+        st = os.stat(directory)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT scanned_mtime_ns FROM dirs WHERE path = ?', (directory,)
+            ).fetchone()
+        if not row or row[0] != st.st_mtime_ns:
+            self._apply(self._visit(directory, True))
+        with self._lock:
+            dirs = [
+                (path, os.path.basename(path), mtime_ns)
+                for path, mtime_ns in self._conn.execute(
+                    'SELECT path, mtime_ns FROM dirs WHERE parent = ?', (directory,)
+                )
+            ]
+            files = self._conn.execute(
+                'SELECT path, name, size, mtime_ns FROM files WHERE dir = ?', (directory,)
+            ).fetchall()
+        return dirs, files
+
+    def details(self, path):
+        """
+        返回文件的宽高和EXIF拍摄时间，第一次请求时读取图片头并保存到索引
+
+        Returns:
+            dict|None: {'width', 'height', 'exif_date'}，文件不在索引中时返回None
+        """
+        path = os.path.normpath(path)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT width, height, exif_date, details_loaded FROM files WHERE path = ?', (path,)
+            ).fetchone()
+        if row is None:
+            return None
+        width, height, exif_date, loaded = row
+        if not loaded:
+            width = height = exif_date = None
+            try:
+                # Image.open只读取文件头，不解码像素
+                with Image.open(path) as img:
+                    width, height = img.size
+                    exif_date = read_exif_date(img)
+            except Exception as e:
+                logger.debug(f"读取图片信息失败: {path}, 错误: {e}")
+            with self._lock:
+                self._conn.execute(
+                    'UPDATE files SET width = ?, height = ?, exif_date = ?, details_loaded = 1 WHERE path = ?',
+                    (width, height, exif_date, path)
+                )
+                self._conn.commit()
+        return {'width': width, 'height': height, 'exif_date': exif_date}
+
+    # ---------- 排序键 ----------
+
+    def prepare_sort_keys(self, key_format):
+        """排序键格式与保存时不同时清空已保存的排序键"""
+        if self._get_meta('sort_key_format') == key_format:
+            return
+        with self._lock:
+            self._conn.execute('DELETE FROM sort_keys')
+            self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('sort_key_format', key_format))
+            self._conn.commit()
+
+    def load_sort_keys(self, names):
+        """返回已保存的排序键 {名称: 排序键JSON}"""
+        result = {}
+        with self._lock:
+            for start in range(0, len(names), SORT_KEY_BATCH):
+                batch = names[start:start + SORT_KEY_BATCH]
+                result.update(self._conn.execute(
+                    f"SELECT name, sort_key FROM sort_keys WHERE name IN ({','.join('?' * len(batch))})", batch
+                ))
+        return result
+
+    def save_sort_keys(self, keys):
+        """保存排序键 {名称: 排序键JSON}"""
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO sort_keys (name, sort_key) VALUES (?, ?)', keys.items())
+            self._conn.commit()
+
+    def stats(self):
+        """返回索引统计信息"""
+        with self._lock:
+            files = self._conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+            dirs = self._conn.execute('SELECT COUNT(*) FROM dirs').fetchone()[0]
+            rollups = self._conn.execute('SELECT COUNT(*) FROM rollup_dirs').fetchone()[0]
+        last_refresh = self._get_meta('last_refresh')
+        return {
+            'base_dir': self.base_dir,
+            'files': files,
+            'dirs': dirs,
+            'rollups': rollups,
+            'rollups_computed': self.rollups_computed,
+            'last_refresh': float(last_refresh) if last_refresh else None,
+        }
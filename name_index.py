@@ -0,0 +1,358 @@
+# 文件名三元组（trigram）倒排索引
+# 搜索原来要遍历选中的每棵目录树，对每个文件名执行regex.search，在BASE_DIR上一次搜索需要几分钟。
+# 这里为文件名的每个连续三字符建立倒排表，搜索时先从模式中提取必须出现的字面量，
+# 取这些字面量的三元组倒排表的交集作为候选，只对候选文件名执行正则匹配：
+# - 倒排表是按文件编号递增的array('I')，新文件的编号总是最大，追加后仍然有序
+# - 元数据索引可用时从索引构建，并通过索引的变更通知实时更新；否则用一次单独的遍历构建，过期后重新构建
+# - 模式中没有长度>=3的必需字面量（如 .*、\d+、a|b）时返回None，由调用方回退到全量扫描
+import os
+import time
+import logging
+import threading
+from array import array
+
+try:
+    import re._parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+from file_walker import DEFAULT_WALK_WORKERS, is_within, walk_records
+
+logger = logging.getLogger(__name__)
+
+# 三元组长度
+GRAM = 3
+
+# 无法安全折叠大小写的字符替换为该字符，包含它的三元组不进入索引，也不用于查询
+UNINDEXED = '\0'
+
+# 正则在忽略大小写时把这些非ASCII字符与ASCII字母视为相同，折叠为对应的ASCII字母
+_ASCII_FOLDS = {'ı': 'i', 'İ': 'i', 'ſ': 's', 'K': 'k'}
+
+# 删除的条目超过该比例时重新编号，回收倒排表中的无效编号
+COMPACT_RATIO = 0.3
+
+# 默认的遍历构建结果有效期（秒）
+DEFAULT_MAX_AGE = 600
+
+
+def fold(text):
+    """
+    把文本折叠为索引使用的形式：ASCII字母转小写，没有大小写的字符（如中文、数字）保持不变，
+    其他有大小写的字符在正则忽略大小写时可能与别的字符等价，替换为UNINDEXED
+    """
+    chars = []
+    for ch in text:
+        if ch < '\x80':
+            chars.append(ch.lower())
+        elif ch in _ASCII_FOLDS:
+            chars.append(_ASCII_FOLDS[ch])
+        elif ch.lower() == ch.upper():
+            chars.append(ch)
+        else:
+            chars.append(UNINDEXED)
+    return ''.join(chars)
+
+
+def trigrams(text):
+    """返回折叠后文本中的三元组集合，跳过包含UNINDEXED的三元组"""
+    text = fold(text)
+    return {
+        text[i:i + GRAM] for i in range(len(text) - GRAM + 1)
+        if UNINDEXED not in text[i:i + GRAM]
+    }
+
+
+def _literal_runs(items, runs, current):
+    """
+    从sre_parse的解析结果中收集必然按顺序连续出现的字面量
+
+    Args:
+        items: 子模式的操作列表
+        runs (list): 收集到的字面量（已结束的）
+        current (list): 当前正在延伸的字面量字符
+
+    Returns:
+        list: 结束时仍在延伸的字面量字符（调用方可以继续追加）
+    """
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            current.append(chr(av))
+        elif op is sre_parse.SUBPATTERN:
+            # 分组只匹配一次，其中的字面量与前后的字面量相连；内联标志只影响大小写，索引本身不区分大小写
+            current = _literal_runs(av[-1], runs, current)
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            # 至少重复一次：重复体中的字面量必然出现，但与前后的字面量不一定相连
+            runs.append(''.join(current))
+            runs.append(''.join(_literal_runs(av[2], runs, [])))
+            current = []
+        else:
+            # 字符集、任意字符、分支、锚点、可选重复等：在这里截断字面量
+            runs.append(''.join(current))
+            current = []
+    return current
+
+
+def required_trigrams(pattern, is_regex):
+    """
+    提取匹配该模式的文件名必然包含的三元组
+
+    Args:
+        pattern (str): 搜索模式
+        is_regex (bool): 是否为正则表达式
+
+    Returns:
+        set|None: 三元组集合；没有可用的字面量时返回None（需要全量扫描）
+    """
+    if is_regex:
+        try:
+            parsed = sre_parse.parse(pattern)
+        except Exception:
+            return None
+        runs = []
+        runs.append(''.join(_literal_runs(list(parsed), runs, [])))
+    else:
+        runs = [pattern]
+    grams = set()
+    for run in runs:
+        grams |= trigrams(run)
+    return grams or None
+
+
+class NameIndex:
+    """
+    文件名三元组倒排索引，多个线程共享，通过锁串行访问
+
+    - 元数据索引可用时（store不为None）从store.files_under(base_dir)构建，之后由store的变更通知增量更新
+    - 没有元数据索引时遍历base_dir构建，超过max_age秒后在下一次查询时重新构建
+    """
+
+    def __init__(self, base_dir, store=None, walk_workers=DEFAULT_WALK_WORKERS, max_age=DEFAULT_MAX_AGE):
+        self.base_dir = os.path.normpath(base_dir)
+        self.store = store
+        self.walk_workers = walk_workers
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._reset()
+        # 构建期间收到的变更，构建完成后按顺序重放；None表示不在构建中
+        self._pending = None
+        self.built_at = None
+        self.build_seconds = None
+        self.queries = 0
+        self.fallbacks = 0
+        self.candidates_checked = 0
+        if store is not None:
+            store.add_listener(self._on_store_change)
+
+    def _reset(self):
+        """清空索引，调用时需持有锁（或在初始化中）"""
+        self._paths = []
+        self._names = []
+        self._sizes = array('q')
+        self._ids = {}
+        # 目录 -> 其中文件的编号集合，用于按目录删除
+        self._dirs = {}
+        self._postings = {}
+        self._dead = 0
+
+    # ---------- 修改 ----------
+
+    def _add(self, path, name, size):
+        """添加或更新一个文件，调用时需持有锁"""
+        file_id = self._ids.get(path)
+        if file_id is not None:
+            self._sizes[file_id] = size
+            return
+        file_id = len(self._paths)
+        self._paths.append(path)
+        self._names.append(name)
+        self._sizes.append(size)
+        self._ids[path] = file_id
+        self._dirs.setdefault(os.path.dirname(path), set()).add(file_id)
+        for gram in trigrams(name):
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array('I')
+            postings.append(file_id)
+
+    def _remove(self, path):
+        """删除一个文件，倒排表中的编号在查询时过滤，调用时需持有锁"""
+        file_id = self._ids.pop(path, None)
+        if file_id is None:
+            return
+        directory = os.path.dirname(path)
+        members = self._dirs.get(directory)
+        if members is not None:
+            members.discard(file_id)
+            if not members:
+                del self._dirs[directory]
+        self._paths[file_id] = None
+        self._dead += 1
+
+    def _remove_tree(self, root):
+        """删除目录下（递归）的所有文件，调用时需持有锁"""
+        prefix = root.rstrip(os.sep) + os.sep
+        for directory in [d for d in self._dirs if d == root or d.startswith(prefix)]:
+            for file_id in self._dirs.pop(directory):
+                del self._ids[self._paths[file_id]]
+                self._paths[file_id] = None
+                self._dead += 1
+
+    def _apply_changes(self, upserted, removed_files, removed_dirs):
+        """应用一批变更，调用时需持有锁"""
+        for path in removed_files:
+            self._remove(path)
+        for path in removed_dirs:
+            self._remove_tree(path)
+        for path, name, size in upserted:
+            self._add(path, name, size)
+        if self._dead > 1000 and self._dead > len(self._paths) * COMPACT_RATIO:
+            self._compact()
+
+    def _compact(self):
+        """按当前存活的文件重新编号，调用时需持有锁"""
+        live = [(path, self._names[i], self._sizes[i]) for i, path in enumerate(self._paths) if path is not None]
+        self._reset()
+        for path, name, size in live:
+            self._add(path, name, size)
+        logger.debug(f"文件名索引已重新编号，当前 {len(live)} 个文件")
+
+    def _on_store_change(self, upserted, removed_files, removed_dirs):
+        """
+        元数据索引的变更通知（在元数据索引的锁内调用，保证与索引写入的顺序一致）
+
+        Args:
+            upserted (list): [(路径, 文件名, 大小), ...] 新增或更新的文件
+            removed_files (list): 删除的文件路径
+            removed_dirs (list): 删除的目录路径，删除其下所有文件
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((upserted, removed_files, removed_dirs))
+            elif self.built_at is not None:
+                self._apply_changes(upserted, removed_files, removed_dirs)
+
+    # ---------- 构建 ----------
+
+    def _rows(self):
+        """构建索引的数据源：元数据索引或单独遍历"""
+        if self.store is not None:
+            for path, name, _, size, _ in self.store.files_under(self.base_dir):
+                yield path, name, size
+        else:
+            for record in walk_records(self.base_dir, base_dir=self.base_dir, max_workers=self.walk_workers):
+                yield record.path, record.name, record.size
+
+    def build(self):
+        """重新构建索引"""
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        """重新构建索引，调用时需持有构建锁"""
+        start = time.monotonic()
+        with self._lock:
+            self._pending = []
+        try:
+            rows = list(self._rows())
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            self._reset()
+            for path, name, size in rows:
+                self._add(path, name, size)
+            # 重放读取数据源之后发生的变更（与数据源重叠的部分重复应用也没有影响）
+            for changes in self._pending:
+                self._apply_changes(*changes)
+            self._pending = None
+            self.built_at = time.time()
+            self.build_seconds = time.monotonic() - start
+            count = len(self._ids)
+            grams = len(self._postings)
+        logger.info(f"文件名索引构建完成: {count} 个文件，{grams} 个三元组，耗时 {self.build_seconds:.2f} 秒")
+
+    def ensure_ready(self):
+        """
+        确保索引可用：第一次查询时构建；遍历构建的索引过期后重新构建
+        元数据索引尚未完成第一次刷新时返回False（调用方使用原来的扫描方式）
+        """
+        if self.store is not None and not self.store.ready:
+            return False
+        if self._expired():
+            with self._build_lock:
+                if self._expired():
+                    self._build()
+        return True
+
+    def _expired(self):
+        """索引尚未构建，或遍历构建的索引已超过有效期"""
+        if self.built_at is None:
+            return True
+        return self.store is None and time.time() - self.built_at > self.max_age
+
+    def covers(self, path):
+        """索引是否可以回答该路径下的查询"""
+        return is_within(path, self.base_dir) and self.ensure_ready()
+
+    # ---------- 查询 ----------
+
+    def candidates(self, grams, root):
+        """
+        返回root下（递归）包含所有三元组的文件
+
+        Args:
+            grams (set): required_trigrams返回的三元组集合
+            root (str): 目录
+
+        Returns:
+            list: [(路径, 文件名, 大小), ...]，文件名仍需由调用方用正则确认
+        """
+        root = os.path.normpath(root)
+        prefix = root.rstrip(os.sep) + os.sep
+        with self._lock:
+            self.queries += 1
+            postings = []
+            for gram in grams:
+                ids = self._postings.get(gram)
+                if ids is None:
+                    return []
+                postings.append(ids)
+            # 从最短的倒排表开始求交集
+            postings.sort(key=len)
+            ids = set(postings[0])
+            for other in postings[1:]:
+                if not ids:
+                    break
+                ids.intersection_update(other)
+            result = []
+            for file_id in sorted(ids):
+                path = self._paths[file_id]
+                if path is not None and (path.startswith(prefix) or os.path.dirname(path) == root):
+                    result.append((path, self._names[file_id], self._sizes[file_id]))
+            self.candidates_checked += len(result)
+        return result
+
+    def record_fallback(self):
+        """记录一次因模式中没有可用字面量而回退到全量扫描的搜索"""
+        with self._lock:
+            self.fallbacks += 1
+
+    def stats(self):
+        """返回索引统计信息"""
+        with self._lock:
+            posting_bytes = sum(ids.buffer_info()[1] * ids.itemsize for ids in self._postings.values())
+            return {
+                'source': 'metadata_index' if self.store is not None else 'scan',
+                'files': len(self._ids),
+                'trigrams': len(self._postings),
+                'posting_bytes': posting_bytes,
+                'dead': self._dead,
+                'built_at': self.built_at,
+                'build_seconds': self.build_seconds,
+                'queries': self.queries,
+                'fallbacks': self.fallbacks,
+                'candidates_checked': self.candidates_checked,
+            }
@@ -0,0 +1,113 @@
+# PDF逐页光栅化
+# convert_from_path一次把所有页面渲染为PIL图片放在内存中，几百页的扫描件会超出容器内存限制。
+# 这里让pdftoppm每次只渲染几页到临时目录（paths_only），逐页打开、交给调用方保存后立即删除，
+# 内存峰值只与单页大小有关，与总页数无关
+import os
+import shutil
+import tempfile
+import logging
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+logger = logging.getLogger(__name__)
+
+# 默认渲染分辨率
+DEFAULT_DPI = 300
+
+# pdftoppm每次渲染的页数，临时目录中最多同时存在这么多页
+RENDER_CHUNK_PAGES = 4
+
+
+def page_count(pdf_path, userpw=None):
+    """
+    使用pdfinfo读取PDF页数，不渲染任何页面
+
+    Args:
+        pdf_path (str): PDF文件路径
+        userpw (str, optional): PDF打开密码
+
+    Returns:
+        int: 页数
+    """
+    info = pdfinfo_from_path(pdf_path, userpw=userpw)
+    return int(info['Pages'])
+
+
+def _chunks(pages, chunk_pages):
+    """把页码列表划分为连续的页码区间 [(first, last), ...]，每个区间不超过chunk_pages页"""
+    ranges = []
+    start = prev = None
+    for page in pages:
+        if start is None:
+            start = prev = page
+        elif page == prev + 1 and page - start < chunk_pages:
+            prev = page
+        else:
+            ranges.append((start, prev))
+            start = prev = page
+    if start is not None:
+        ranges.append((start, prev))
+    return ranges
+
+
+def _page_number(path):
+    """从pdftoppm的输出文件名（前缀-页码.ppm）中解析页码"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return int(name.rsplit('-', 1)[1])
+
+
+def render_pages(pdf_path, pages, dpi=DEFAULT_DPI, userpw=None, chunk_pages=RENDER_CHUNK_PAGES):
+    """
+    逐页渲染PDF
+
+    Args:
+        pdf_path (str): PDF文件路径
+        pages (iterable): 要渲染的页码（从1开始）
+        dpi (int): 渲染分辨率
+        userpw (str, optional): PDF打开密码
+        chunk_pages (int): pdftoppm每次渲染的页数
+
+    Yields:
+        tuple: (页码, PIL.Image.Image)，图片只在本次迭代内有效，调用方需在下一次迭代前保存
+    """
+    temp_dir = tempfile.mkdtemp(prefix='pdf-raster-')
+    try:
+        for first_page, last_page in _chunks(sorted(pages), chunk_pages):
+            paths = convert_from_path(
+                pdf_path,
+                dpi=dpi,
+                first_page=first_page,
+                last_page=last_page,
+                output_folder=temp_dir,
+                paths_only=True,
+                fmt='ppm',
+                userpw=userpw,
+                thread_count=1
+            )
+            for path in sorted(paths, key=_page_number):
+                try:
+                    with Image.open(path) as img:
+                        img.load()
+                        yield _page_number(path), img
+                finally:
+                    os.remove(path)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def split_page_ranges(total_pages, pages_per_task):
+    """
+    把页码划分为多个区间，用于并行渲染
+
+    Args:
+        total_pages (int): 总页数
+        pages_per_task (int): 每个区间的页数
+
+    Returns:
+        list: [(起始页, 结束页), ...]，页码从1开始，包含结束页
+    """
+    pages_per_task = max(1, pages_per_task)
+    return [
+        (first, min(first + pages_per_task - 1, total_pages))
+        for first in range(1, total_pages + 1, pages_per_task)
+    ]
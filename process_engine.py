@@ -0,0 +1,335 @@
+# 进程池执行引擎
+# 进程内的Pillow编码、PDF逐页保存、图片合并PDF等纯Python工作在线程中会被GIL串行化，
+# 这里把单个文件的工作交给常驻的进程池执行：
+# - 工作进程启动时预先导入Pillow/pdf2image并构建编解码后端，在多个任务之间复用
+# - 任务只传递路径和参数，结果以紧凑的元组返回，不在进程间传递图片对象
+# - 进度事件通过共享队列发送 (job_id, 事件, 数值)，由主进程的监听线程分发给回调
+# - 进程池不可用时在调用线程中直接执行，行为与进程池一致
+import os
+import uuid
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# 任务结束事件，主进程收到后才认为该任务的所有进度事件都已分发
+DONE_EVENT = 'done'
+
+# 等待任务结束事件的超时时间（秒）
+DONE_TIMEOUT = 5
+
+# 当前进程的工作状态：编解码后端和进度事件发送函数
+_state = {}
+
+
+def _init_state(toolchain_cache_path, emit):
+    """
+    初始化当前进程的工作状态：导入Pillow/pdf2image，加载工具链缓存并构建编解码后端
+    """
+    from PIL import Image, ImageFile
+    import pdf_raster  # noqa: F401  预先导入pdf2image，避免第一个PDF任务承担导入开销
+    from toolchain import ToolchainRegistry
+    from codec_backends import build_backends
+
+    Image.init()
+    ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+    toolchain = ToolchainRegistry(toolchain_cache_path)
+    toolchain.load()
+    _state['backends'] = build_backends(toolchain)
+    _state['emit'] = emit
+
+
+def _init_worker(toolchain_cache_path, events):
+    """工作进程初始化函数"""
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] [pid %(process)d] %(message)s')
+    _init_state(toolchain_cache_path, lambda job_id, event, value: events.put((job_id, event, value)))
+    logger.info("进程池工作进程已启动")
+
+
+def _emit(job_id, event, value=None):
+    """发送进度事件"""
+    if job_id is not None:
+        _state['emit'](job_id, event, value)
+
+
+def _run_job(job_id, func, args):
+    """在工作进程中执行任务，结束时发送结束事件"""
+    try:
+        return func(job_id, *args)
+    finally:
+        _emit(job_id, DONE_EVENT)
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+# ---------------------------------------------------------------------------
+# 任务函数：第一个参数为job_id，返回值只包含数字、布尔值和字符串
+# ---------------------------------------------------------------------------
+
+def compress_file(job_id, img_path, quality, backend_name):
+    """
+    压缩单个图片
+
+    Returns:
+        tuple: (是否成功, 新大小, 新mtime)，大小或mtime未知时为None
+    """
+    from codec_backends import compress_with_fallback
+
+    result = compress_with_fallback(_state['backends'], backend_name, img_path, quality)
+    return result.ok, result.size, result.mtime_ns
+
+
+def compress_file_search(job_id, img_path, quality, mode, target_bytes, min_psnr):
+    """
+    按目标大小或画质下限搜索质量压缩单个图片
+
+    Returns:
+        tuple: (是否成功, 新大小, 新mtime, 选中的质量, 编码次数, 实际使用的质量模式)，大小或mtime未知时为None
+    """
+    from codec_backends import compress_search_with_fallback
+
+    result, chosen, attempts, used_mode = compress_search_with_fallback(
+        _state['backends'], img_path, quality, mode, target_bytes, min_psnr
+    )
+    return result.ok, result.size, result.mtime_ns, chosen, attempts, used_mode
+
+
+def convert_file(job_id, img_path, new_path, target_format, quality, backend_name):
+    """
+    转换单个普通图片
+
+    Returns:
+        tuple: (是否成功, 输出文件大小, 输出文件mtime)，失败时大小和mtime为None
+    """
+    from codec_backends import convert_with_fallback
+
+    result = convert_with_fallback(_state['backends'], backend_name, img_path, new_path, target_format, quality)
+    return result.ok, result.size, result.mtime_ns
+
+
+def convert_pdf(job_id, pdf_path, output_pattern, quality, skip_existing, first_page=1, last_page=None,
+                total_pages=None):
+    """
+    把PDF的页面逐页渲染并保存为图片，每处理一页发送一次 ('page', (页码, 总页数, 输出大小)) 事件
+    每次只渲染少量页面，内存峰值与总页数无关
+
+    Args:
+        pdf_path (str): PDF文件路径
+        output_pattern (str): 输出路径模板，包含 {page} 占位符，如 /a/b-{page:03d}.jpg，按扩展名决定保存格式
+        quality (int): 保存质量
+        skip_existing (bool): 输出文件已存在时是否跳过（跳过的页面不渲染）
+        first_page (int): 起始页码（从1开始）
+        last_page (int, optional): 结束页码（含），默认到最后一页
+        total_pages (int, optional): 总页数，调用方已读取时传入，不再执行pdfinfo
+
+    Returns:
+        tuple: (总页数, 输出总大小（包括跳过的已存在文件）, 跳过的输出路径元组)
+    """
+    from PIL import Image
+    from pdf_raster import page_count, render_pages
+
+    if total_pages is None:
+        total_pages = page_count(pdf_path)
+    last_page = min(last_page or total_pages, total_pages)
+    pil_format = Image.registered_extensions().get(os.path.splitext(output_pattern)[1].lower())
+    total_size = 0
+    skipped = []
+    pages = []
+    for page in range(first_page, last_page + 1):
+        output_filename = output_pattern.format(page=page)
+        # 一次stat同时判断是否存在和取得大小
+        try:
+            size = os.stat(output_filename).st_size if skip_existing else None
+        except OSError:
+            size = None
+        if size is not None:
+            skipped.append(output_filename)
+            total_size += size
+            _emit(job_id, 'page', (page, total_pages, size))
+        else:
+            pages.append(page)
+
+    for page, img in render_pages(pdf_path, pages):
+        output_filename = output_pattern.format(page=page)
+        if pil_format:
+            # 写入打开的文件，写完后的位置就是文件大小，不需要再stat
+            with open(output_filename, 'wb') as f:
+                img.save(f, format=pil_format, quality=quality)
+                size = f.tell()
+        else:
+            img.save(output_filename, quality=quality)
+            size = _file_size(output_filename)
+        total_size += size
+        _emit(job_id, 'page', (page, total_pages, size))
+    return total_pages, total_size, tuple(skipped)
+
+
+def merge_images_to_pdf(job_id, img_paths, pdf_output_path, quality):
+    """
+    把多张图片合并为一个PDF，每打开一张图片发送一次 ('image', (序号, 是否成功)) 事件
+
+    Returns:
+        tuple: (是否生成了PDF, 打开失败的图片序号元组)
+    """
+    from PIL import Image
+
+    images = []
+    failed = []
+    for index, img_path in enumerate(img_paths):
+        try:
+            img = Image.open(img_path)
+            # PDF需要RGB模式
+            if img.mode in ('RGBA', 'P'):
+                img = img.convert('RGB')
+            images.append(img)
+            _emit(job_id, 'image', (index, True))
+        except Exception as e:
+            logger.error(f"打开图片失败: {img_path}, 错误: {e}")
+            failed.append(index)
+            _emit(job_id, 'image', (index, False))
+
+    if not images:
+        return False, tuple(failed)
+    images[0].save(pdf_output_path, save_all=True, append_images=images[1:], quality=quality)
+    return True, tuple(failed)
+
+
+class ProcessEngine:
+    """
+    常驻进程池执行引擎
+
+    - 进程池在第一次使用时创建，之后在所有任务之间复用
+    - 使用spawn方式创建工作进程，避免在多线程的服务进程中fork
+    - 进程池损坏（工作进程被杀死等）时重建，当次调用在当前线程中执行
+    """
+
+    def __init__(self, max_workers, toolchain_cache_path, backends):
+        self.max_workers = max(1, max_workers)
+        self.toolchain_cache_path = toolchain_cache_path
+        self.backends = backends
+        self._executor = None
+        self._events = None
+        self._listeners = {}
+        self._done = {}
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """创建进程池和事件监听线程"""
+        with self._lock:
+            if self._executor is not None:
+                return self._executor
+            ctx = multiprocessing.get_context('spawn')
+            self._events = ctx.Queue()
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(self.toolchain_cache_path, self._events)
+            )
+            listener = threading.Thread(target=self._listen, args=(self._events,), daemon=True)
+            listener.start()
+            logger.info(f"进程池已创建，工作进程数: {self.max_workers}")
+            return self._executor
+
+    def _listen(self, events):
+        """监听工作进程发送的进度事件并分发给回调"""
+        while True:
+            try:
+                job_id, event, value = events.get()
+            except (EOFError, OSError):
+                return
+            if job_id is None:
+                return
+            self._dispatch(job_id, event, value)
+
+    def _dispatch(self, job_id, event, value):
+        if event == DONE_EVENT:
+            done = self._done.get(job_id)
+            if done is not None:
+                done.set()
+            return
+        callback = self._listeners.get(job_id)
+        if callback is None:
+            return
+        try:
+            callback(event, value)
+        except Exception as e:
+            logger.error(f"处理进度事件失败: {job_id} {event}, 错误: {e}")
+
+    def _reset(self):
+        """丢弃损坏的进程池，下次调用时重建"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            events, self._events = self._events, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if events is not None:
+            try:
+                events.put((None, None, None))
+            except (OSError, ValueError):
+                pass
+
+    def _call_inline(self, job_id, func, args):
+        """在当前线程中执行任务，使用主进程的编解码后端，事件直接分发给回调"""
+        if not _state:
+            _state['backends'] = self.backends
+            _state['emit'] = self._dispatch
+        return _run_job(job_id, func, args)
+
+    def call(self, func, *args, on_event=None, inline=False):
+        """
+        执行任务并等待结果
+
+        Args:
+            func (callable): 本模块中的任务函数
+            *args: 任务参数（不含job_id）
+            on_event (callable, optional): 进度事件回调 on_event(事件, 数值)
+            inline (bool): 是否在当前线程中执行（线程执行引擎）
+
+        Returns:
+            任务函数的返回值
+        """
+        job_id = uuid.uuid4().hex
+        done = threading.Event()
+        self._done[job_id] = done
+        if on_event is not None:
+            self._listeners[job_id] = on_event
+        try:
+            if inline:
+                return self._call_inline(job_id, func, args)
+            try:
+                future = self._ensure_started().submit(_run_job, job_id, func, args)
+                result = future.result()
+            except BrokenProcessPool as e:
+                logger.warning(f"进程池已损坏，重建进程池并在当前线程中执行: {e}")
+                self._reset()
+                done.clear()
+                return self._call_inline(job_id, func, args)
+            # 等待该任务的所有进度事件分发完成
+            if not done.wait(DONE_TIMEOUT):
+                logger.warning(f"等待任务进度事件超时: {job_id}")
+            return result
+        finally:
+            self._listeners.pop(job_id, None)
+            self._done.pop(job_id, None)
+
+    def shutdown(self):
+        """关闭进程池"""
+        self._reset()
+
+    def to_dict(self):
+        """返回引擎状态，供 /get_config 使用"""
+        return {
+            'max_workers': self.max_workers,
+            'started': self._executor is not None,
+        }
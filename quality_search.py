@@ -0,0 +1,122 @@
+# 按图片搜索压缩质量
+# - target_size：在不超过目标字节数的前提下选择最高的质量
+# - perceptual：在PSNR不低于下限的前提下选择最低的质量（文件最小）
+# 中间结果只在内存中编码，由调用方把最终结果写入磁盘
+import io
+import math
+import logging
+from PIL import Image, ImageChops, ImageStat
+
+logger = logging.getLogger(__name__)
+
+# 质量搜索模式
+MODE_FIXED = 'fixed'
+MODE_TARGET_SIZE = 'target_size'
+MODE_PERCEPTUAL = 'perceptual'
+SEARCH_MODES = (MODE_FIXED, MODE_TARGET_SIZE, MODE_PERCEPTUAL)
+
+# 默认搜索范围和PSNR下限（dB）
+DEFAULT_MIN_QUALITY = 10
+DEFAULT_MAX_QUALITY = 95
+DEFAULT_MIN_PSNR = 40.0
+
+# 计算PSNR时参考图的最长边，缩小后比较以控制耗时
+PSNR_MAX_SIDE = 1024
+
+
+def _comparable(img):
+    """转换为可比较的RGB图片并缩小到PSNR_MAX_SIDE以内"""
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    if max(img.size) > PSNR_MAX_SIDE:
+        img = img.copy()
+        img.thumbnail((PSNR_MAX_SIDE, PSNR_MAX_SIDE), Image.Resampling.BILINEAR)
+    return img
+
+
+def psnr(reference, candidate):
+    """
+    计算两张图片的PSNR（dB），完全相同时返回无穷大
+
+    Args:
+        reference (PIL.Image.Image): 参考图（已经过_comparable处理）
+        candidate (PIL.Image.Image): 待比较的图片
+    """
+    candidate = candidate.convert(reference.mode)
+    if candidate.size != reference.size:
+        candidate = candidate.resize(reference.size, Image.Resampling.BILINEAR)
+    stat = ImageStat.Stat(ImageChops.difference(reference, candidate))
+    pixels = reference.size[0] * reference.size[1] * len(stat.sum2)
+    mse = sum(stat.sum2) / pixels
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def search_quality(encode, img, mode, target_bytes=None, min_psnr=DEFAULT_MIN_PSNR,
+                   min_quality=DEFAULT_MIN_QUALITY, max_quality=DEFAULT_MAX_QUALITY):
+    """
+    二分搜索压缩质量
+
+    Args:
+        encode (callable): encode(quality) -> bytes，在内存中编码
+        img (PIL.Image.Image): 原图，perceptual模式用作参考图
+        mode (str): MODE_TARGET_SIZE或MODE_PERCEPTUAL
+        target_bytes (int): target_size模式的目标字节数
+        min_psnr (float): perceptual模式的PSNR下限
+        min_quality (int): 搜索的最低质量
+        max_quality (int): 搜索的最高质量
+
+    Returns:
+        dict: {
+            'quality': 选中的质量,
+            'data': 选中质量的编码结果,
+            'attempts': 编码次数,
+            'met': 是否满足目标（不满足时返回最接近目标的结果）
+        }
+    """
+    results = {}
+    reference = _comparable(img) if mode == MODE_PERCEPTUAL else None
+
+    def evaluate(quality):
+        if quality not in results:
+            data = encode(quality)
+            if mode == MODE_TARGET_SIZE:
+                ok = len(data) <= target_bytes
+            else:
+                with Image.open(io.BytesIO(data)) as decoded:
+                    ok = psnr(reference, _comparable(decoded)) >= min_psnr
+            results[quality] = (ok, data)
+        return results[quality]
+
+    lo, hi = min_quality, max_quality
+    if mode == MODE_TARGET_SIZE:
+        # 文件大小随质量单调递增：找满足大小限制的最高质量
+        best = None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            ok, _ = evaluate(mid)
+            if ok:
+                best = mid
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        met = best is not None
+        chosen = best if met else min_quality
+    else:
+        # PSNR随质量单调递增：找满足画质下限的最低质量
+        best = None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            ok, _ = evaluate(mid)
+            if ok:
+                best = mid
+                hi = mid - 1
+            else:
+                lo = mid + 1
+        met = best is not None
+        chosen = best if met else max_quality
+
+    _, data = evaluate(chosen)
+    logger.debug(f"质量搜索完成，模式: {mode}, 质量: {chosen}, 编码次数: {len(results)}, 满足目标: {met}")
+    return {'quality': chosen, 'data': data, 'attempts': len(results), 'met': met}
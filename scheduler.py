@@ -0,0 +1,304 @@
+# 自适应并发调度
+# - 启动时读取cgroup的CPU配额、CPU亲和性和可用内存，得到容器内真正可用的资源（os.cpu_count()会忽略cgroup配额）
+# - 处理过程中按实测的每文件吞吐量和系统负载调整并发数
+# - 重格式（AVIF/HEIC/TIFF/PDF）和轻格式（JPEG/PNG/WebP等）使用不同的并发上限，重格式还受内存限制
+import os
+import time
+import math
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 解码/编码开销大的格式
+HEAVY_FORMATS = ('avif', 'heic', 'tiff', 'tif', 'pdf')
+
+# 每个重格式任务预留的内存（字节），用于按可用内存限制重格式并发数
+HEAVY_TASK_MEMORY = 512 * 1024 * 1024
+
+# 轻格式任务主要等待外部进程或I/O，并发上限为CPU数的倍数
+LIGHT_TASK_FACTOR = 2
+
+# 调整并发数的时间间隔（秒）
+ADJUST_INTERVAL = 2.0
+
+# 负载阈值（相对于可用CPU数）：高于上限时减少并发，低于下限时允许增加并发
+LOAD_HIGH = 1.25
+LOAD_LOW = 0.8
+
+# cgroup文件路径
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+
+def _read_text(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def read_cgroup_cpu_quota():
+    """
+    读取cgroup的CPU配额
+
+    Returns:
+        float|None: 可用的CPU数（配额/周期），没有限制时返回None
+    """
+    # cgroup v2: cpu.max 内容为 "配额 周期" 或 "max 周期"
+    text = _read_text(os.path.join(CGROUP_ROOT, 'cpu.max'))
+    if text:
+        parts = text.split()
+        if len(parts) == 2 and parts[0] != 'max':
+            try:
+                return int(parts[0]) / int(parts[1])
+            except (ValueError, ZeroDivisionError):
+                return None
+        return None
+
+    # cgroup v1: cpu.cfs_quota_us 为-1表示没有限制
+    quota = _read_text(os.path.join(CGROUP_ROOT, 'cpu', 'cpu.cfs_quota_us'))
+    period = _read_text(os.path.join(CGROUP_ROOT, 'cpu', 'cpu.cfs_period_us'))
+    try:
+        quota = int(quota)
+        period = int(period)
+    except (TypeError, ValueError):
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return quota / period
+
+
+def read_cgroup_memory_available():
+    """
+    读取cgroup的内存限制，返回限制内剩余的内存
+
+    Returns:
+        int|None: 剩余可用内存（字节），没有限制时返回None
+    """
+    # cgroup v2
+    limit = _read_text(os.path.join(CGROUP_ROOT, 'memory.max'))
+    usage = _read_text(os.path.join(CGROUP_ROOT, 'memory.current'))
+    if limit is None:
+        # cgroup v1
+        limit = _read_text(os.path.join(CGROUP_ROOT, 'memory', 'memory.limit_in_bytes'))
+        usage = _read_text(os.path.join(CGROUP_ROOT, 'memory', 'memory.usage_in_bytes'))
+    if limit is None or limit == 'max':
+        return None
+    try:
+        limit = int(limit)
+        usage = int(usage) if usage else 0
+    except ValueError:
+        return None
+    # cgroup v1没有限制时为一个接近2^63的数
+    if limit >= 1 << 60:
+        return None
+    return max(0, limit - usage)
+
+
+def read_mem_available():
+    """
+    读取 /proc/meminfo 中的 MemAvailable
+
+    Returns:
+        int|None: 可用内存（字节），无法读取时返回None
+    """
+    text = _read_text('/proc/meminfo')
+    if not text:
+        return None
+    for line in text.splitlines():
+        if line.startswith('MemAvailable:'):
+            try:
+                return int(line.split()[1]) * 1024
+            except (IndexError, ValueError):
+                return None
+    return None
+
+
+def load_average():
+    """返回1分钟平均负载，不支持的平台返回None"""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+class SystemResources:
+    """
+    容器内可用的CPU和内存
+
+    - cpu_count: min(os.cpu_count(), CPU亲和性, cgroup配额向上取整)
+    - memory_available: min(MemAvailable, cgroup内存限制内剩余内存)
+    """
+
+    def __init__(self):
+        self.host_cpu_count = os.cpu_count() or 1
+        try:
+            self.affinity_cpu_count = len(os.sched_getaffinity(0))
+        except (AttributeError, OSError):
+            self.affinity_cpu_count = self.host_cpu_count
+        self.cpu_quota = read_cgroup_cpu_quota()
+
+        cpu_count = min(self.host_cpu_count, self.affinity_cpu_count)
+        if self.cpu_quota is not None:
+            cpu_count = min(cpu_count, max(1, math.ceil(self.cpu_quota)))
+        self.cpu_count = max(1, cpu_count)
+
+        self.refresh_memory()
+
+    def refresh_memory(self):
+        """重新读取可用内存"""
+        candidates = [m for m in (read_mem_available(), read_cgroup_memory_available()) if m is not None]
+        self.memory_available = min(candidates) if candidates else None
+        return self.memory_available
+
+    def to_dict(self):
+        return {
+            'cpu_count': self.cpu_count,
+            'host_cpu_count': self.host_cpu_count,
+            'affinity_cpu_count': self.affinity_cpu_count,
+            'cpu_quota': self.cpu_quota,
+            'memory_available': self.memory_available,
+        }
+
+
+def task_class(path):
+    """返回文件的任务类别：heavy（重格式）或light（轻格式）"""
+    ext = os.path.splitext(path)[1].lower()[1:]
+    return 'heavy' if ext in HEAVY_FORMATS else 'light'
+
+
+class AdaptiveScheduler:
+    """
+    全局并发调度器，所有任务（压缩、转换、上传）共享
+
+    - 每个类别（heavy/light）有独立的并发上限和当前并发数
+    - 每隔ADJUST_INTERVAL秒按吞吐量和负载调整当前并发数：
+        - 负载高于LOAD_HIGH：减少1
+        - 上次增加并发后吞吐量没有提高：退回1
+        - 并发已用满且负载低于LOAD_LOW：增加1
+    """
+
+    def __init__(self, resources):
+        self.resources = resources
+        cpu_count = resources.cpu_count
+        memory_slots = None
+        if resources.memory_available is not None:
+            memory_slots = max(1, resources.memory_available // HEAVY_TASK_MEMORY)
+
+        heavy_max = cpu_count if memory_slots is None else min(cpu_count, memory_slots)
+        light_max = cpu_count * LIGHT_TASK_FACTOR
+        self.max_limits = {'heavy': max(1, heavy_max), 'light': max(1, light_max)}
+        # 初始并发：重格式取上限的一半，轻格式等于CPU数
+        self.limits = {
+            'heavy': max(1, self.max_limits['heavy'] // 2),
+            'light': min(cpu_count, self.max_limits['light']),
+        }
+        self.active = {'heavy': 0, 'light': 0}
+        self._completed = {'heavy': 0, 'light': 0}
+        self._saturated = {'heavy': False, 'light': False}
+        self._last_throughput = {'heavy': None, 'light': None}
+        self._direction = {'heavy': 0, 'light': 0}
+        self._window_start = time.monotonic()
+        self._cond = threading.Condition()
+
+    @property
+    def ceiling(self):
+        """单个任务最多使用的线程数"""
+        return self.max_limits['light']
+
+    @property
+    def busy(self):
+        """是否有任务正在占用并发名额（后台预取等低优先级工作据此让出CPU）"""
+        with self._cond:
+            return any(self.active.values())
+
+    def workers_for(self, requested=None):
+        """
+        计算单个任务的线程数
+
+        Args:
+            requested (int, optional): 客户端请求的线程数，None或0表示自动
+
+        Returns:
+            int: 线程数，不超过调度器的上限
+        """
+        try:
+            requested = int(requested) if requested else 0
+        except (TypeError, ValueError):
+            requested = 0
+        if requested <= 0:
+            return self.ceiling
+        return max(1, min(requested, self.ceiling))
+
+    @contextmanager
+    def slot(self, path=None, kind=None):
+        """
+        获取一个并发名额，处理完成后释放
+
+        Args:
+            path (str, optional): 文件路径，用于判断任务类别
+            kind (str, optional): 直接指定任务类别
+        """
+        kind = kind or task_class(path or '')
+        with self._cond:
+            while self.active[kind] >= self.limits[kind]:
+                self._saturated[kind] = True
+                self._cond.wait()
+            self.active[kind] += 1
+            if self.active[kind] >= self.limits[kind]:
+                self._saturated[kind] = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active[kind] -= 1
+                self._completed[kind] += 1
+                self._maybe_adjust()
+                self._cond.notify_all()
+
+    def _maybe_adjust(self):
+        """按吞吐量和负载调整并发数，调用时需持有锁"""
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < ADJUST_INTERVAL:
+            return
+        load = load_average()
+        cpu_count = self.resources.cpu_count
+        for kind in ('heavy', 'light'):
+            completed = self._completed[kind]
+            if completed == 0 and not self._saturated[kind]:
+                continue
+            throughput = completed / elapsed
+            last = self._last_throughput[kind]
+            limit = self.limits[kind]
+            if load is not None and load > cpu_count * LOAD_HIGH and limit > 1:
+                limit -= 1
+                self._direction[kind] = -1
+            elif self._direction[kind] > 0 and last is not None and throughput < last * 1.05 and limit > 1:
+                # 上次增加并发没有带来吞吐量提升
+                limit -= 1
+                self._direction[kind] = 0
+            elif self._saturated[kind] and (load is None or load < cpu_count * LOAD_LOW) \
+                    and limit < self.max_limits[kind]:
+                limit += 1
+                self._direction[kind] = 1
+            else:
+                self._direction[kind] = 0
+            if limit != self.limits[kind]:
+                logger.info(f"调整{kind}并发数: {self.limits[kind]} -> {limit}, 吞吐量: {throughput:.2f} 个/秒, 负载: {load}")
+                self.limits[kind] = limit
+            self._last_throughput[kind] = throughput
+            self._completed[kind] = 0
+            self._saturated[kind] = False
+        self._window_start = now
+
+    def to_dict(self):
+        with self._cond:
+            return {
+                'limits': dict(self.limits),
+                'max_limits': dict(self.max_limits),
+                'active': dict(self.active),
+                'load_average': load_average(),
+            }
@@ -0,0 +1,190 @@
+# 文件名排序键
+# 文件列表按"英文在前、中文按拼音、数字按自然顺序"排序，原来每次请求都对每个条目调用lazy_pinyin，
+# natsort再在此基础上生成自己的排序键，十几万个中文文件名的目录大部分时间花在这里。
+# 这里把两步合并为一个复合排序键，每个文件名只计算一次：
+# - 计算结果保存在有上限的LRU缓存中
+# - 元数据索引可用时持久化到索引数据库，重启后不需要重新计算
+# - 路径的排序键由各级名称的排序键组成，用于搜索结果和任务中的文件顺序
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import natsort
+import pypinyin
+from natsort import natsort_keygen, ns
+from pypinyin import lazy_pinyin
+
+logger = logging.getLogger(__name__)
+
+# 默认缓存的文件名数量
+DEFAULT_MAX_ENTRIES = 200000
+
+# 排序键格式，算法或依赖库版本变化时持久化的排序键全部失效
+SORT_KEY_FORMAT = f"1|natsort {natsort.__version__}|pypinyin {pypinyin.__version__}"
+
+# 与原来natsorted(key=..., alg=ns.PATH | ns.IGNORECASE)相同的排序规则
+_natsort_key = natsort_keygen(alg=ns.PATH | ns.IGNORECASE)
+
+
+def compute_sort_key(name):
+    """
+    计算文件名的复合排序键：(是否为中文, 拼音或原名称, 原名称)，再由natsort拆分数字
+
+    Args:
+        name (str): 文件或目录名
+
+    Returns:
+        tuple: 可以直接比较的排序键
+    """
+    # 检查文件名首字符是否为中文
+    is_chinese = len(name) > 0 and '\u4e00' <= name[0] <= '\u9fff'
+    return _natsort_key((
+        is_chinese,  # 英文在前，中文在后
+        ''.join(lazy_pinyin(name)),  # 中文按拼音排序
+        name.lower()  # 保持自然排序的准确性
+    ))
+
+
+def _to_tuple(value):
+    """JSON反序列化后把列表还原为元组（列表与元组不能相互比较）"""
+    if isinstance(value, list):
+        return tuple(_to_tuple(item) for item in value)
+    return value
+
+
+class SortKeyService:
+    """
+    文件名排序键服务，多个线程共享，通过锁串行访问LRU缓存
+
+    store需要提供prepare_sort_keys(格式)、load_sort_keys(名称列表)和save_sort_keys({名称: 排序键JSON})，
+    为None时只在内存中缓存
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, store=None):
+        self.max_entries = max_entries
+        self.store = store
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loaded = 0
+        self.computed = 0
+        if store is not None:
+            try:
+                store.prepare_sort_keys(SORT_KEY_FORMAT)
+            except Exception as e:
+                logger.error(f"初始化持久化排序键失败: {e}，只在内存中缓存")
+                self.store = None
+
+    def keys(self, names):
+        """
+        批量获取排序键，依次查找内存缓存、持久化的排序键，都没有时计算并保存
+
+        Args:
+            names (iterable): 文件或目录名
+
+        Returns:
+            dict: {名称: 排序键}
+        """
+        result = {}
+        missing = []
+        with self._lock:
+            for name in names:
+                if name in result:
+                    continue
+                key = self._cache.get(name)
+                if key is None:
+                    result[name] = None
+                    missing.append(name)
+                else:
+                    self._cache.move_to_end(name)
+                    result[name] = key
+                    self.hits += 1
+        if not missing:
+            return result
+
+        loaded = {}
+        if self.store is not None:
+            try:
+                loaded = self.store.load_sort_keys(missing)
+            except Exception as e:
+                logger.error(f"读取持久化排序键失败: {e}")
+        new_keys = {}
+        for name in missing:
+            encoded = loaded.get(name)
+            if encoded is not None:
+                result[name] = _to_tuple(json.loads(encoded))
+            else:
+                result[name] = new_keys[name] = compute_sort_key(name)
+        if new_keys and self.store is not None:
+            try:
+                self.store.save_sort_keys({
+                    name: json.dumps(key, ensure_ascii=False, separators=(',', ':'))
+                    for name, key in new_keys.items()
+                })
+            except Exception as e:
+                logger.error(f"保存排序键失败: {e}")
+
+        with self._lock:
+            self.loaded += len(missing) - len(new_keys)
+            self.computed += len(new_keys)
+            for name in missing:
+                self._cache[name] = result[name]
+                self._cache.move_to_end(name)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def key(self, name):
+        """获取单个名称的排序键"""
+        return self.keys([name])[name]
+
+    def sort(self, items, key=None, reverse=False):
+        """
+        按名称排序
+
+        Args:
+            items (iterable): 要排序的条目
+            key (callable, optional): 从条目中取得名称，默认条目本身就是名称
+            reverse (bool): 是否倒序
+
+        Returns:
+            list: 排序后的新列表
+        """
+        items = list(items)
+        names = [key(item) for item in items] if key else items
+        keys = self.keys(names)
+        order = sorted(range(len(items)), key=lambda i: keys[names[i]], reverse=reverse)
+        return [items[i] for i in order]
+
+    def sort_paths(self, items, key=None):
+        """
+        按路径排序：逐级比较目录名和文件名的排序键，同一目录下的条目排在一起
+
+        Args:
+            items (iterable): 要排序的条目
+            key (callable, optional): 从条目中取得路径，默认条目本身就是路径
+
+        Returns:
+            list: 排序后的新列表
+        """
+        items = list(items)
+        parts = [
+            tuple(part for part in os.path.normpath(key(item) if key else item).split(os.sep) if part)
+            for item in items
+        ]
+        keys = self.keys(part for path_parts in parts for part in path_parts)
+        order = sorted(range(len(items)), key=lambda i: tuple(keys[part] for part in parts[i]))
+        return [items[i] for i in order]
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                'entries': len(self._cache),
+                'hits': self.hits,
+                'loaded': self.loaded,
+                'computed': self.computed,
+                'persistent': self.store is not None,
+            }
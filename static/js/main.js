@@ -49,6 +49,25 @@ let history = [];
 let historyIndex = -1;
 // 历史记录最大长度
 const MAX_HISTORY_LENGTH = 20;
+// 已加载的文件列表（键为 路径|autoEnter|排序|顺序|后缀过滤），用于304和增量更新
+let listingCache = new Map();
+// 文件列表缓存的最大目录数
+const MAX_LISTING_CACHE = 50;
+// 文件列表每页条目数，滚动到底部时加载下一页
+const LISTING_PAGE_SIZE = 500;
+// 距离底部多少像素时开始加载下一页
+const LOAD_MORE_THRESHOLD = 300;
+// 全选时一次获取剩余条目的页大小（服务器单页上限）
+const MAX_LISTING_PAGE_SIZE = 5000;
+// 当前目录的分页状态：{ key, path, entry（listingCache中的条目）, loading }
+let listingState = null;
+// 搜索结果最多渲染的条数，超过时只显示排序后的前面部分
+const SEARCH_RENDER_LIMIT = 2000;
+// 正在流式接收结果的搜索任务：{ taskId, controller（AbortController） }
+let searchStream = null;
+// 滚动停止多久后（毫秒）请求服务器优先预取可见文件的缩略图
+const PREFETCH_VISIBLE_DELAY = 300;
+let prefetchVisibleTimeout = null;
 
 // 通用确认回调函数
 let confirmCallback = null;
@@ -222,6 +241,22 @@ $(document).ready(function() {
     fileListElement.on('scroll', function() {
         // 保存当前目录的滚动位置
         scrollPositions[currentPath] = $(this).scrollTop();
+        // 接近底部时加载下一页
+        loadMoreFilesIfNeeded();
+        // 滚动停止后优先预取可见文件的悬停预览
+        schedulePrefetchVisible();
+    });
+    
+    // 排序和后缀过滤变化时重新加载当前目录（不记录历史）
+    $('#sort-select, #sort-order').on('change', function() {
+        loadFiles(false, true);
+    });
+    let extFilterTimeout = null;
+    $('#ext-filter').on('input', function() {
+        clearTimeout(extFilterTimeout);
+        extFilterTimeout = setTimeout(function() {
+            loadFiles(false, true);
+        }, 500);
     });
     
     // 添加全局鼠标事件监听，捕获所有鼠标事件
@@ -304,7 +339,14 @@ $(document).ready(function() {
     $('#compression-quality').on('input', function() {
         $('#quality-value').text($(this).val());
     });
-    
+
+    // 质量模式切换，显示对应的参数输入框
+    $('#quality-mode').on('change', function() {
+        const mode = $(this).val();
+        $('#target-size-group').toggle(mode === 'target_size');
+        $('#min-psnr-group').toggle(mode === 'perceptual');
+    });
+
     // 线程数滑块
     $('#thread-count').on('input', function() {
         $('#thread-value').text($(this).val());
@@ -408,38 +450,24 @@ $(document).ready(function() {
     
     // 全选按钮 - 选中当前路径下所有图片
     $('#select-all-btn').on('click', function() {
-        // 选中当前目录下的所有图片文件
-        const fileItems = $('.file-list-item');
-        let selectedCount = 0;
-        
-        fileItems.each(function() {
-            const checkbox = $(this).find('.checkbox');
-            // 检查是否有复选框
-            if (checkbox.length === 0) {
-                return; // 跳过没有复选框的项目（如返回上级项）
-            }
-            
-            // 强制设置为选中状态
-            checkbox.prop('checked', true);
-                
-            // 获取路径
-            const path = $(this).data('path');
-            // 检查是否已经在selectedFiles列表中
-            if (!selectedFiles.includes(path)) {
-                // 添加到selectedFiles列表
-                selectedFiles.push(path);
-                // 更新已选择文件列表
-                updateSelectedFilesList();
-                // 更新按钮状态
-                updateButtons();
-                selectedCount++;
-            }
-        });
-        
-        // 如果没有选中任何项目，可能是因为所有项目都是文件夹
-        if (selectedCount === 0) {
-                showToast('当前目录下没有可选中的文件');
+        const state = listingState;
+        if (state && state.entry.next_cursor) {
+            // 分页列表还有未加载的条目，不能只选中已加载的部分
+            if (!getListOptions().ext) {
+                // 没有后缀过滤时选中文件夹本身，服务器处理时遍历整个文件夹
+                selectCurrentDirectory(state);
+                return;
             }
+            // 有后缀过滤时先加载剩余的页，再选中过滤后的所有条目
+            showToast('正在加载剩余的 ' + (state.entry.total - state.entry.files.length) + ' 项...');
+            fetchRemainingListing(state, function(files) {
+                selectListingItems(state.entry.files.concat(files));
+            }, function() {
+                showToast('加载剩余条目失败，未全选，已加载 ' + state.entry.files.length + ' / ' + state.entry.total + ' 项');
+            });
+            return;
+        }
+        selectListingItems(state ? state.entry.files : []);
     });
     
     // 取消全选按钮 - 清空右侧选中列表
@@ -455,6 +483,15 @@ $(document).ready(function() {
         updateButtons();
     });
     
+    // 取消当前正在轮询的任务
+    $('#loading-cancel-btn').on('click', function() {
+        if (!currentTaskId) {
+            return;
+        }
+        $(this).prop('disabled', true).text('正在取消...');
+        cancelTask(currentTaskId);
+    });
+    
     // 搜索文件按钮
     $('#search-btn').on('click', function() {
         // 关闭当前可能显示的悬浮预览
@@ -491,7 +528,8 @@ $(document).ready(function() {
                 selected_paths: searchPaths,
                 pattern: pattern,
                 is_regex: $('#search-regex').is(':checked'),
-                case_sensitive: $('#search-case-sensitive').is(':checked')
+                case_sensitive: $('#search-case-sensitive').is(':checked'),
+                limit: parseInt($('#search-limit').val()) || 0
             }),
             success: function(response) {
                 const taskId = response.task_id;
@@ -499,6 +537,12 @@ $(document).ready(function() {
                 
                 log('info', '搜索任务已启动，task_id: ' + taskId);
                 
+                // 支持流式读取时边搜索边显示结果
+                if (window.fetch && window.ReadableStream && window.TextDecoder && window.AbortController) {
+                    streamSearchResults(taskId);
+                    return;
+                }
+                
                 // 显示加载动画
                 $('#loading-text').text('正在搜索文件...');
                 $('#loading').show();
@@ -673,6 +717,46 @@ $(document).ready(function() {
         });
     });
     
+    // 刷新索引按钮：未选择文件夹时刷新整个BASE_DIR，只重新扫描有变化的目录
+    $('#rescan-index-btn').on('click', function() {
+        // 关闭当前可能显示的悬浮预览
+        hideHoverPreview();
+        
+        $.ajax({
+            url: '/rescan_index',
+            type: 'POST',
+            contentType: 'application/json',
+            data: JSON.stringify({ selected_paths: selectedFiles }),
+            success: function(response) {
+                const taskId = response.task_id;
+                
+                log('info', '刷新索引任务已启动，task_id: ' + taskId);
+                
+                // 显示加载动画
+                $('#loading-text').text('正在刷新索引...');
+                $('#loading').show();
+                
+                // 轮询任务状态
+                pollTaskStatus(taskId, function(task, status) {
+                    // 隐藏加载动画
+                    $('#loading').hide();
+                    log('info', '刷新索引任务状态: ' + status);
+                    if (status === 'completed') {
+                        showRescanIndexResult(task);
+                    } else if (status === 'failed') {
+                        customAlert('刷新索引失败: ' + (task.error || '未知错误'), '错误', 'error');
+                    } else if (status === 'error') {
+                        customAlert('获取任务状态失败', '错误', 'error');
+                    }
+                });
+            },
+            error: function(xhr, status, error) {
+                const message = (xhr.responseJSON && xhr.responseJSON.error) || error;
+                customAlert('启动刷新索引失败: ' + message, '错误', 'error');
+            }
+        });
+    });
+    
     // 图片压缩按钮
     $('#compress-btn').on('click', function() {
         // 关闭当前可能显示的悬浮预览
@@ -740,6 +824,19 @@ $(document).ready(function() {
         
         const maxWorkers = parseInt($('#thread-count').val());
         
+        // 质量模式：固定质量、目标大小或画质下限
+        const qualityMode = $('#quality-mode').val();
+        let targetSizeKB = null;
+        if (qualityMode === 'target_size') {
+            try {
+                targetSizeKB = calculateInputValue($('#target-size-kb').val());
+            } catch (e) {
+                customAlert(e.message, '错误', 'error');
+                return;
+            }
+        }
+        const minPsnr = parseFloat($('#min-psnr').val()) || 40;
+        
         // 隐藏配置模态框
         $('#compress-modal').modal('hide');
         
@@ -764,7 +861,10 @@ $(document).ready(function() {
                 selected_paths: selectedFiles,
                 quality: quality,
                 min_size: minSize,
-                max_workers: maxWorkers
+                max_workers: maxWorkers,
+                quality_mode: qualityMode,
+                target_size_kb: targetSizeKB,
+                min_psnr: minPsnr
             }),
             success: function(response) {
                 // 清空已选择列表
@@ -1464,14 +1564,39 @@ function loadFiles(autoEnter = true, fromHistory = false) {
     // 关闭当前可能显示的悬浮预览
     hideHoverPreview();
     
+    // 分页获取列表：先只请求第一页，滚动到底部时再加载后续页
+    // 已有该目录的列表时带上版本号：目录、排序和过滤条件都没有变化时服务器返回304，使用已加载的所有页
+    // 已加载全部条目的默认视图改为获取完整列表并带上旧版本号，目录有变化时服务器只返回变化的条目
+    const listOptions = getListOptions();
+    const listingKey = [currentPath, autoEnter, listOptions.sort, listOptions.order, listOptions.ext].join('|');
+    const cachedListing = listingCache.get(listingKey);
+    const useDelta = canRequestListingDelta(cachedListing, listOptions);
+    const requestData = Object.assign({
+        path: currentPath,
+        auto_enter: autoEnter
+    }, listOptions);
+    if (useDelta) {
+        requestData.since = cachedListing.listing_version;
+    } else {
+        requestData.page_size = LISTING_PAGE_SIZE;
+    }
+    const cachedVersion = cachedListing && (useDelta ? cachedListing.listing_version : cachedListing.version);
+    // 切换目录后丢弃上一个目录尚未返回的下一页
+    listingState = null;
+    
     $.ajax({
         url: '/get_files',
         type: 'POST',
-        data: { 
-            path: currentPath,
-            auto_enter: autoEnter
-        },
-        success: function(response) {
+        data: requestData,
+        headers: cachedVersion ? { 'If-None-Match': '"' + cachedVersion + '"' } : {},
+        success: function(response, textStatus, xhr) {
+            response = applyListingResponse(listingKey, cachedListing, response, xhr);
+            if (!response) {
+                // 增量无法应用到缓存的列表上，丢弃缓存后重新获取
+                loadFiles(autoEnter, fromHistory);
+                return;
+            }
+            listingState = { key: listingKey, path: response.current_path, entry: response, loading: false };
             log('info', '文件列表加载成功，路径: ' + response.current_path, response);
             
             currentPath = response.current_path;
@@ -1532,33 +1657,8 @@ function loadFiles(autoEnter = true, fromHistory = false) {
             }
             
             // 添加文件和文件夹
-            log('info', '共加载 ' + response.files.length + ' 个文件/文件夹');
-            for (const file of response.files) {
-                log('debug', '添加文件/文件夹: ' + file.name, file);
-                
-                fileListHtml += '<li class="file-list-item" data-path="' + file.path + '" data-type="' + file.type + '">';
-                
-                // 复选框
-                fileListHtml += '<input type="checkbox" class="checkbox" ' + (selectedFiles.includes(file.path) ? 'checked' : '') + '>';
-                
-                // 图标
-                if (file.type === 'dir') {
-                    fileListHtml += '<span class="icon">📁</span>';
-                } else {
-                    fileListHtml += '<span class="icon">🖼️</span>';
-                }
-                
-                // 文件名
-                fileListHtml += '<span class="filename">' + file.name + '</span>';
-                
-                // 文件大小
-                if (file.type === 'file') {
-                    const size = formatFileSize(file.size);
-                    fileListHtml += '<span class="filesize">' + size + '</span>';
-                }
-                
-                fileListHtml += '</li>';
-            }
+            log('info', '共加载 ' + response.files.length + ' / ' + response.total + ' 个文件/文件夹');
+            fileListHtml += renderFileListItems(response.files);
             
             // 更新文件列表
             log('info', '更新文件列表HTML');
@@ -1567,11 +1667,19 @@ function loadFiles(autoEnter = true, fromHistory = false) {
             // 绑定文件列表事件
             bindFileListEvents();
             
+            updateFileCount();
+            
             // 恢复滚动位置
             setTimeout(function() {
                 const savedScroll = scrollPositions[currentPath] || 0;
                 log('debug', '恢复滚动位置: ' + savedScroll + ' for path: ' + currentPath);
                 fileListElement.scrollTop(savedScroll);
+                // 第一页没有填满列表区域时继续加载
+                loadMoreFilesIfNeeded();
+                // 恢复到之前的滚动位置时，先预取可见的文件
+                if (savedScroll > 0) {
+                    schedulePrefetchVisible();
+                }
             }, 0);
         },
         error: function(xhr, status, error) {
@@ -1594,10 +1702,231 @@ function loadFiles(autoEnter = true, fromHistory = false) {
     });
 }
 
+// 读取排序和后缀过滤选项
+function getListOptions() {
+    return {
+        sort: $('#sort-select').val() || 'name',
+        order: $('#sort-order').val() || 'asc',
+        ext: ($('#ext-filter').val() || '').trim()
+    };
+}
+
+// 生成文件列表项HTML
+function renderFileListItems(files) {
+    let html = '';
+    for (const file of files) {
+        html += '<li class="file-list-item" data-path="' + file.path + '" data-type="' + file.type + '">';
+        
+        // 复选框
+        // 条目本身或其所在文件夹已被选中（未加载完的文件夹全选时选中文件夹本身）
+        const checked = selectedFiles.includes(file.path) ||
+            (listingState !== null && selectedFiles.includes(listingState.path) && isInDirectory(file.path, listingState.path));
+        html += '<input type="checkbox" class="checkbox" ' + (checked ? 'checked' : '') + '>';
+        
+        // 图标
+        if (file.type === 'dir') {
+            html += '<span class="icon">📁</span>';
+        } else {
+            html += '<span class="icon">🖼️</span>';
+        }
+        
+        // 文件名
+        html += '<span class="filename">' + file.name + '</span>';
+        
+        // 文件大小
+        if (file.type === 'file') {
+            const size = formatFileSize(file.size);
+            html += '<span class="filesize">' + size + '</span>';
+        }
+        
+        html += '</li>';
+    }
+    return html;
+}
+
+// 全选：把条目加入已选择列表，并勾选已渲染的复选框
+function selectListingItems(files) {
+    const selected = new Set(selectedFiles);
+    let selectedCount = 0;
+    for (const file of files) {
+        if (!selected.has(file.path)) {
+            selected.add(file.path);
+            selectedFiles.push(file.path);
+            selectedCount++;
+        }
+    }
+    $('.file-list-item').each(function() {
+        if (selected.has($(this).data('path'))) {
+            $(this).find('.checkbox').prop('checked', true);
+        }
+    });
+    if (selectedCount === 0) {
+        showToast('当前目录下没有可选中的文件');
+        return;
+    }
+    updateSelectedFilesList();
+    updateButtons();
+}
+
+// 全选未加载完的文件夹：选中文件夹本身，移除已选中的其中条目（避免重复处理）
+function selectCurrentDirectory(state) {
+    const directory = state.path;
+    selectedFiles = selectedFiles.filter(path => !isInDirectory(path, directory));
+    if (!selectedFiles.includes(directory)) {
+        selectedFiles.push(directory);
+    }
+    $('.file-list-item').each(function() {
+        if (isInDirectory($(this).data('path'), directory)) {
+            $(this).find('.checkbox').prop('checked', true);
+        }
+    });
+    updateSelectedFilesList();
+    updateButtons();
+    showToast('已选中整个文件夹（共 ' + state.entry.total + ' 项，其中 ' +
+              (state.entry.total - state.entry.files.length) + ' 项尚未加载显示）');
+}
+
+// 判断路径是否是文件夹中的直接条目
+function isInDirectory(path, directory) {
+    const index = Math.max(path.lastIndexOf('/'), path.lastIndexOf('\\'));
+    return index > 0 && path.substring(0, index) === directory;
+}
+
+// 按游标依次获取分页列表剩余的页（不渲染），全部获取后调用onDone(条目列表)
+function fetchRemainingListing(state, onDone, onError) {
+    const files = [];
+    const options = getListOptions();
+    function fetchPage(cursor) {
+        $.ajax({
+            url: '/get_files',
+            type: 'POST',
+            data: Object.assign({
+                path: state.path,
+                auto_enter: false,
+                page_size: MAX_LISTING_PAGE_SIZE,
+                cursor: cursor
+            }, options),
+            success: function(response) {
+                // 请求期间已切换目录或重新加载
+                if (listingState !== state) {
+                    return;
+                }
+                files.push(...response.files);
+                if (response.next_cursor) {
+                    fetchPage(response.next_cursor);
+                } else {
+                    onDone(files);
+                }
+            },
+            error: function(xhr, status, error) {
+                log('error', '加载剩余文件列表失败', error);
+                onError();
+            }
+        });
+    }
+    fetchPage(state.entry.next_cursor);
+}
+
+// 更新已加载条目数
+function updateFileCount() {
+    if (!listingState) {
+        $('#file-count').text('');
+        return;
+    }
+    const entry = listingState.entry;
+    $('#file-count').text('已加载 ' + entry.files.length + ' / ' + entry.total + ' 项');
+}
+
+// 滚动接近底部时加载下一页
+function loadMoreFilesIfNeeded() {
+    const state = listingState;
+    if (!state || state.loading || !state.entry.next_cursor) {
+        return;
+    }
+    const element = fileListElement[0];
+    if (element.scrollTop + element.clientHeight < element.scrollHeight - LOAD_MORE_THRESHOLD) {
+        return;
+    }
+    
+    state.loading = true;
+    log('debug', '加载下一页文件列表，已加载 ' + state.entry.files.length + ' / ' + state.entry.total);
+    $.ajax({
+        url: '/get_files',
+        type: 'POST',
+        data: Object.assign({
+            path: state.path,
+            auto_enter: false,
+            page_size: LISTING_PAGE_SIZE,
+            cursor: state.entry.next_cursor
+        }, getListOptions()),
+        success: function(response) {
+            state.loading = false;
+            // 请求期间已切换目录或重新加载
+            if (listingState !== state) {
+                return;
+            }
+            // 已加载的页保存在缓存条目中，返回该目录时一并恢复
+            state.entry.files = state.entry.files.concat(response.files);
+            state.entry.next_cursor = response.next_cursor;
+            state.entry.total = response.total;
+            const newItems = $(renderFileListItems(response.files));
+            fileListElement.append(newItems);
+            bindFileListEvents(newItems);
+            updateFileCount();
+            loadMoreFilesIfNeeded();
+        },
+        error: function(xhr, status, error) {
+            state.loading = false;
+            log('error', '加载下一页文件列表失败', error);
+        }
+    });
+}
+
+// 滚动停止后请求预取可见文件的缩略图
+function schedulePrefetchVisible() {
+    clearTimeout(prefetchVisibleTimeout);
+    prefetchVisibleTimeout = setTimeout(prefetchVisibleThumbnails, PREFETCH_VISIBLE_DELAY);
+}
+
+// 把列表中当前可见的文件发给服务器，移到缩略图预取队列的队首
+function prefetchVisibleThumbnails() {
+    const element = fileListElement[0];
+    const view = element.getBoundingClientRect();
+    const items = element.children;
+    const paths = [];
+    for (let i = 0; i < items.length; i++) {
+        const rect = items[i].getBoundingClientRect();
+        if (rect.bottom < view.top) {
+            continue;
+        }
+        if (rect.top > view.bottom) {
+            break;
+        }
+        if (items[i].dataset.type === 'file') {
+            paths.push(items[i].dataset.path);
+        }
+    }
+    if (paths.length === 0) {
+        return;
+    }
+    $.ajax({
+        url: '/prefetch_thumbnails',
+        type: 'POST',
+        contentType: 'application/json',
+        data: JSON.stringify({ path: currentPath, paths: paths }),
+        error: function(xhr, status, error) {
+            log('debug', '请求预取缩略图失败', error);
+        }
+    });
+}
+
 // 绑定文件列表事件
-function bindFileListEvents() {
+function bindFileListEvents(items) {
+    // 未指定时绑定列表中的所有项，追加下一页时只绑定新加入的项
+    items = items || $('.file-list-item');
+    
     // 点击文件列表项
-    $('.file-list-item').on('click', function(e) {
+    items.on('click', function(e) {
         const path = $(this).data('path');
         const type = $(this).data('type');
         const filename = $(this).find('.filename').text();
@@ -1629,7 +1958,7 @@ function bindFileListEvents() {
     });
     
     // 点击复选框
-    $('.file-list-item .checkbox').on('click', function(e) {
+    items.find('.checkbox').on('click', function(e) {
         e.stopPropagation(); // 阻止事件冒泡到父元素
         
         const fileItem = $(this).closest('.file-list-item');
@@ -1655,7 +1984,7 @@ function bindFileListEvents() {
     
     
     // 鼠标进入事件
-    $('.file-list-item').on('mouseenter', function(e) {
+    items.on('mouseenter', function(e) {
         // 如果模态框预览正在加载，不显示悬浮预览
         if (isModalPreviewLoading) {
             return;
@@ -1688,7 +2017,7 @@ function bindFileListEvents() {
     });
     
     // 鼠标离开事件
-    $('.file-list-item').on('mouseleave', function() {
+    items.on('mouseleave', function() {
         // 清除延迟预览
         if (hoverTimeout) {
             clearTimeout(hoverTimeout);
@@ -1700,6 +2029,11 @@ function bindFileListEvents() {
     });
 }
 
+// TIFF预览URL：服务器按预览尺寸缩放指定页并转换为浏览器可以显示的格式
+function tiffPreviewUrl(path, variant, page) {
+    return '/convert_tiff_preview?path=' + encodeURIComponent(path) + '&variant=' + variant + '&page=' + page;
+}
+
 // 显示悬停预览
 function showHoverPreview(path, mouseX, mouseY) {
     // 如果弹窗预览已经打开，不显示悬浮预览
@@ -1728,8 +2062,8 @@ function showHoverPreview(path, mouseX, mouseY) {
     // 获取预览URL
     let previewUrl = '';
     if (ext === 'tiff' || ext === 'tif') {
-        // TIFF格式需要转换
-        previewUrl = '/convert_tiff_preview?path=' + encodeURIComponent(path);
+        // TIFF格式需要转换，服务器按悬停预览尺寸缩放
+        previewUrl = tiffPreviewUrl(path, 'hover', 0);
     } else {
         // 其他图片格式，构建预览URL
         let previewPath = path;
@@ -1743,8 +2077,8 @@ function showHoverPreview(path, mouseX, mouseY) {
                 previewPath = previewPath.substring(1);
             }
         }
-        // 确保预览URL格式正确
-        previewUrl = '/preview/' + encodeURIComponent(previewPath);
+        // 确保预览URL格式正确，悬停预览使用较小的缓存缩略图
+        previewUrl = '/preview/' + encodeURIComponent(previewPath) + '?variant=hover';
     }
     
     // 计算预览框位置
@@ -1932,8 +2266,8 @@ function previewImage(path) {
         success: function(response) {
             // 显示图片预览
             if (ext === 'tiff' || ext === 'tif') {
-                // TIFF格式浏览器可能不支持直接显示，转换为PNG显示
-                $('#preview-image').attr('src', '/convert_tiff_preview?path=' + encodeURIComponent(path));
+                // TIFF格式浏览器可能不支持直接显示，服务器缩放到弹窗尺寸后转换为JPEG/WebP显示
+                $('#preview-image').attr('src', tiffPreviewUrl(path, 'modal', 0));
             } else {
                 // 其他图片格式，直接构建预览URL
                 let previewPath = path;
@@ -1948,7 +2282,7 @@ function previewImage(path) {
                     }
                 }
                 // 确保预览URL格式正确
-                const previewUrl = '/preview/' + encodeURIComponent(previewPath);
+                const previewUrl = '/preview/' + encodeURIComponent(previewPath) + '?variant=modal';
                 log('debug', '图片预览URL:', previewUrl);
                 $('#preview-image').attr('src', previewUrl);
             }
@@ -1963,6 +2297,15 @@ function previewImage(path) {
             infoHtml += '<p><strong>格式:</strong> ' + response.format + '</p>';
             infoHtml += '<p><strong>大小:</strong> ' + formatFileSize(response.size) + '</p>';
             
+            // 多页TIFF：选择要预览的页
+            if ((ext === 'tiff' || ext === 'tif') && response.pages > 1) {
+                infoHtml += '<p><strong>页码:</strong> <select class="form-control form-control-sm d-inline-block w-auto" id="tiff-page-select">';
+                for (let page = 0; page < response.pages; page++) {
+                    infoHtml += '<option value="' + page + '">' + (page + 1) + ' / ' + response.pages + '</option>';
+                }
+                infoHtml += '</select></p>';
+            }
+            
             // 显示EXIF信息（如果有）
             infoHtml += '<div>';
             if (response.exif && Object.keys(response.exif).length > 0) {
@@ -2009,6 +2352,11 @@ function previewImage(path) {
             
             $('#image-info').html(infoHtml);
             
+            // 切换TIFF页码时重新加载预览图
+            $('#tiff-page-select').on('change', function() {
+                $('#preview-image').attr('src', tiffPreviewUrl(path, 'modal', parseInt($(this).val(), 10)));
+            });
+            
             // 绑定EXIF信息显示/隐藏按钮事件（只有当按钮存在时才绑定）
             if (response.exif && Object.keys(response.exif).length > 0) {
                 // 先移除旧的事件监听器，避免重复绑定
@@ -2345,6 +2693,21 @@ function updateProgress() {
                     $('#failed-files-count').text('');
                 }
                 
+                // 处理质量搜索结果
+                const qualityResults = response.quality_results || [];
+                if (qualityResults.length > 0) {
+                    $('#quality-results-section').show();
+                    $('#quality-results-count').text(qualityResults.length);
+                    let qualityHtml = '';
+                    for (const item of qualityResults) {
+                        qualityHtml += `<div class="progress-file-item">${item.file}：质量 ${item.quality}，编码 ${item.attempts} 次</div>`;
+                    }
+                    $('#quality-results').html(qualityHtml);
+                } else {
+                    $('#quality-results-section').hide();
+                    $('#quality-results-count').text('');
+                }
+                
                 // 处理跳过文件列表
                 const skippedFiles = response.skipped_files || [];
                 const skippedCount = skippedFiles.length;
@@ -2418,6 +2781,9 @@ function formatFileSize(bytes) {
 function pollTaskStatus(taskId, callback) {
     currentTaskId = taskId;
     let requestInFlight = false;
+    // 加载提示后追加已处理的条目数
+    const loadingText = $('#loading-text').text();
+    $('#loading-cancel-btn').prop('disabled', false).text('取消').show();
     
     function checkTask() {
         if (currentTaskId !== taskId) {
@@ -2460,7 +2826,15 @@ function pollTaskStatus(taskId, callback) {
                 } else if (response.status === 'failed') {
                     stopTaskPolling();
                     if (callback) callback(response, 'failed');
+                } else if (response.status === 'cancelled') {
+                    // 已取消的任务保留取消前的部分结果，按完成处理
+                    stopTaskPolling();
+                    showToast('任务已取消，显示取消前的结果');
+                    if (callback) callback(response, 'completed');
                 } else if (response.status === 'running') {
+                    if (response.progress) {
+                        $('#loading-text').text(loadingText + '（已处理 ' + response.progress + ' 项）');
+                    }
                     // 继续轮询
                     taskPollInterval = setTimeout(checkTask, 500);
                 }
@@ -2491,46 +2865,168 @@ function stopTaskPolling() {
         taskPollInterval = null;
     }
     currentTaskId = null;
+    $('#loading-cancel-btn').hide();
 }
 
-// 搜索结果展示
-function showSearchResult(task) {
-    const result = task.result;
-    if (!result || !result.files) {
-        customAlert('搜索失败: 未找到结果', '错误', 'error');
-        return;
+// 请求取消任务，任务在处理完当前条目后停止
+function cancelTask(taskId, callback) {
+    $.ajax({
+        url: '/cancel_task/' + taskId,
+        type: 'POST',
+        success: function(response) {
+            log('info', '已请求取消任务: ' + taskId + ', 状态: ' + response.status);
+            if (callback) callback(true);
+        },
+        error: function(xhr, status, error) {
+            log('error', '取消任务失败: ' + error);
+            customAlert('取消任务失败: ' + error, '错误', 'error');
+            if (callback) callback(false);
+        }
+    });
+}
+
+/**
+ * 以NDJSON流式读取任务结果
+ * 连接达到服务端最长时间后带上偏移量自动重新连接
+ * @param {string} taskId 任务ID
+ * @param {Object} handlers { onItems(items), onProgress(data), onReset(), onDone(data), onError(error) }
+ * @returns {AbortController} 用于中止读取
+ */
+function streamTask(taskId, handlers) {
+    const controller = new AbortController();
+    const decoder = new TextDecoder();
+    
+    function connect(offset, generation) {
+        let url = '/stream_task/' + encodeURIComponent(taskId) + '?offset=' + offset;
+        if (generation !== null && generation !== undefined) {
+            url += '&generation=' + generation;
+        }
+        fetch(url, { signal: controller.signal }).then(function(response) {
+            if (!response.ok) {
+                throw new Error('HTTP ' + response.status);
+            }
+            const reader = response.body.getReader();
+            let buffer = '';
+            let finished = false;
+            
+            function handleLine(text) {
+                if (!text) {
+                    return;
+                }
+                const data = JSON.parse(text);
+                if (data.type === 'items') {
+                    offset = data.offset;
+                    if (handlers.onItems) handlers.onItems(data.items);
+                } else if (data.type === 'progress') {
+                    if (handlers.onProgress) handlers.onProgress(data);
+                } else if (data.type === 'reset') {
+                    if (handlers.onReset) handlers.onReset();
+                } else if (data.type === 'reconnect') {
+                    finished = true;
+                    connect(data.offset, data.generation);
+                } else if (data.type === 'done') {
+                    finished = true;
+                    if (handlers.onDone) handlers.onDone(data);
+                }
+            }
+            
+            function read() {
+                return reader.read().then(function(chunk) {
+                    if (chunk.done) {
+                        handleLine(buffer.trim());
+                        if (!finished && handlers.onError) handlers.onError(new Error('连接意外中断'));
+                        return;
+                    }
+                    buffer += decoder.decode(chunk.value, { stream: true });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop();
+                    for (const text of lines) {
+                        handleLine(text.trim());
+                    }
+                    return read();
+                });
+            }
+            return read();
+        }).catch(function(error) {
+            if (error.name === 'AbortError') {
+                return;
+            }
+            log('error', '流式读取任务结果失败: ' + error);
+            if (handlers.onError) handlers.onError(error);
+        });
     }
     
+    connect(0, null);
+    return controller;
+}
+
+// 搜索结果展示：任务结束后读取排序后的结果
+function showSearchResult(task) {
+    const taskId = task.task_id;
+    $.ajax({
+        url: '/get_task_results/' + encodeURIComponent(taskId),
+        type: 'GET',
+        data: { offset: 0, limit: SEARCH_RENDER_LIMIT },
+        success: function(page) {
+            renderSearchResults(page.items, page.total, page.truncated, task.status === 'cancelled');
+        },
+        error: function(xhr, status, error) {
+            customAlert('搜索失败: 未找到结果', '错误', 'error');
+        }
+    });
+}
+
+// 单个搜索结果的HTML
+function searchResultItemHtml(file) {
+    const fileExt = file.ext.toLowerCase() === 'jpeg' ? 'jpg' : file.ext.toLowerCase();
+    const isImage = supportedFormats.includes(fileExt);
+    
+    let html = '<div class="list-group-item list-group-item-action search-result-item" data-path="' + file.path + '" data-is-image="' + isImage + '">';
+    html += '<div class="d-flex justify-content-between align-items-center">';
+    html += '<div class="search-result-item-name">';
+    html += '<strong>' + file.name + '</strong>';
+    html += '<br>';
+    html += '<small class="text-muted search-result-path">' + file.path + '</small>';
+    html += '<br>';
+    html += '<small class="text-muted">大小: ' + formatFileSize(file.size) + ' | 类型: ' + file.ext + '</small>';
+    html += '</div>';
+    html += '<div class="btn-group search-result-actions">';
+    html += '<button class="btn btn-danger btn-sm delete-btn" data-path="' + file.path + '" title="删除">删除</button>';
+    html += '<button class="btn btn-primary btn-sm jump-btn" data-path="' + file.path + '" title="跳转">跳转</button>';
+    html += '</div>';
+    html += '</div>';
+    html += '</div>';
+    return html;
+}
+
+/**
+ * 渲染搜索结果
+ * @param {Array} files 要显示的结果（最多SEARCH_RENDER_LIMIT条）
+ * @param {number} total 匹配文件总数
+ * @param {boolean} truncated 是否因达到结果数量上限而停止搜索
+ * @param {boolean} cancelled 搜索是否被取消
+ */
+function renderSearchResults(files, total, truncated, cancelled) {
     let resultHtml = '<h3>搜索结果</h3>';
     resultHtml += '<div class="mb-3">';
-    resultHtml += '<p><strong>匹配文件数:</strong> <span id="search-result-count">' + result.total + '</span></p>';
+    resultHtml += '<p><strong>匹配文件数:</strong> <span id="search-result-count">' + total + '</span></p>';
+    if (cancelled) {
+        resultHtml += '<p class="text-muted">搜索已取消，以下为取消前找到的文件</p>';
+    }
+    if (truncated) {
+        resultHtml += '<p class="text-muted">已达到结果数量上限，搜索已停止</p>';
+    }
+    if (files.length < total) {
+        resultHtml += '<p class="text-muted">仅显示前 ' + files.length + ' 个结果</p>';
+    }
     resultHtml += '</div>';
     
-    if (result.files.length > 0) {
+    if (files.length > 0) {
         resultHtml += '<div class="pre-scrollable">';
         resultHtml += '<div class="list-group">';
-        
-        for (const file of result.files) {
-            const fileExt = file.ext.toLowerCase() === 'jpeg' ? 'jpg' : file.ext.toLowerCase();
-            const isImage = supportedFormats.includes(fileExt);
-            
-            resultHtml += '<div class="list-group-item list-group-item-action search-result-item" data-path="' + file.path + '" data-is-image="' + isImage + '">';
-            resultHtml += '<div class="d-flex justify-content-between align-items-center">';
-            resultHtml += '<div class="search-result-item-name">';
-            resultHtml += '<strong>' + file.name + '</strong>';
-            resultHtml += '<br>';
-            resultHtml += '<small class="text-muted search-result-path">' + file.path + '</small>';
-            resultHtml += '<br>';
-            resultHtml += '<small class="text-muted">大小: ' + formatFileSize(file.size) + ' | 类型: ' + file.ext + '</small>';
-            resultHtml += '</div>';
-            resultHtml += '<div class="btn-group search-result-actions">';
-            resultHtml += '<button class="btn btn-danger btn-sm delete-btn" data-path="' + file.path + '" title="删除">删除</button>';
-            resultHtml += '<button class="btn btn-primary btn-sm jump-btn" data-path="' + file.path + '" title="跳转">跳转</button>';
-            resultHtml += '</div>';
-            resultHtml += '</div>';
-            resultHtml += '</div>';
+        for (const file of files) {
+            resultHtml += searchResultItemHtml(file);
         }
-        
         resultHtml += '</div>';
         resultHtml += '</div>';
     } else {
@@ -2546,6 +3042,58 @@ function showSearchResult(task) {
     bindSearchResultEvents();
 }
 
+/**
+ * 流式接收搜索结果：找到的文件立即显示，搜索结束后换成按路径排序的结果
+ * @param {string} taskId 搜索任务ID
+ */
+function streamSearchResults(taskId) {
+    if (searchStream) {
+        searchStream.controller.abort();
+    }
+    
+    let resultHtml = '<h3>搜索结果</h3>';
+    resultHtml += '<div class="mb-3 d-flex justify-content-between align-items-center">';
+    resultHtml += '<p class="mb-0"><strong>匹配文件数:</strong> <span id="search-result-count">0</span> <small class="text-muted" id="search-stream-status">正在搜索...</small></p>';
+    resultHtml += '<button type="button" class="btn btn-outline-secondary btn-sm" id="stop-search-btn">停止搜索</button>';
+    resultHtml += '</div>';
+    resultHtml += '<div class="pre-scrollable"><div class="list-group" id="search-result-list"></div></div>';
+    $('#search-results').html(resultHtml);
+    $('#search-modal').modal('show');
+    bindSearchResultEvents();
+    
+    let received = 0;
+    $('#stop-search-btn').on('click', function() {
+        $(this).prop('disabled', true).text('正在停止...');
+        cancelTask(taskId);
+    });
+    
+    const controller = streamTask(taskId, {
+        onItems: function(items) {
+            const visible = items.slice(0, Math.max(0, SEARCH_RENDER_LIMIT - received));
+            if (visible.length > 0) {
+                $('#search-result-list').append(visible.map(searchResultItemHtml).join(''));
+            }
+            received += items.length;
+            $('#search-result-count').text(received);
+        },
+        onDone: function(data) {
+            searchStream = null;
+            log('info', '搜索任务状态: ' + data.status);
+            if (data.status === 'failed') {
+                $('#search-results').empty();
+                customAlert('搜索失败: ' + (data.error || '未知错误'), '错误', 'error');
+            } else {
+                showSearchResult({ task_id: taskId, status: data.status });
+            }
+        },
+        onError: function(error) {
+            searchStream = null;
+            $('#search-stream-status').text('连接中断: ' + error.message);
+        }
+    });
+    searchStream = { taskId: taskId, controller: controller };
+}
+
 // 统计结果展示
 function showCountFormatsResult(task) {
     const result = task.result;
@@ -2747,9 +3295,25 @@ function showCleanEmptyFoldersResult(task) {
     loadFiles();
 }
 
+// 显示刷新索引结果
+function showRescanIndexResult(task) {
+    const result = task.result;
+    if (!result) {
+        customAlert('刷新索引失败', '错误', 'error');
+        return;
+    }
+    
+    customAlert('刷新索引完成，检查 ' + result.dirs_checked + ' 个文件夹，重新扫描 ' + result.dirs_rescanned +
+        ' 个；索引中共有 ' + result.dirs + ' 个文件夹、' + result.files + ' 个文件');
+    loadFiles();
+}
+
 // 绑定搜索结果事件
 function bindSearchResultEvents() {
-    $('.jump-btn').on('click', function() {
+    const $results = $('#search-results');
+    $results.off('.searchResults');
+    
+    $results.on('click.searchResults', '.jump-btn', function() {
         const path = $(this).data('path');
         const lastSepIndex = Math.max(path.lastIndexOf('/'), path.lastIndexOf('\\'));
         const dirPath = path.substring(0, lastSepIndex);
@@ -2759,7 +3323,7 @@ function bindSearchResultEvents() {
         $('#search-modal').modal('hide');
     });
     
-    $('.delete-btn').on('click', function() {
+    $results.on('click.searchResults', '.delete-btn', function() {
         const $btn = $(this);
         const path = $btn.data('path');
         const filename = path.substring(Math.max(path.lastIndexOf('/'), path.lastIndexOf('\\')) + 1);
@@ -2797,7 +3361,7 @@ function bindSearchResultEvents() {
         });
     });
     
-    $('.search-result-item').on('click', function(e) {
+    $results.on('click.searchResults', '.search-result-item', function(e) {
         if ($(e.target).closest('button').length > 0) {
             return;
         }
@@ -2889,6 +3453,57 @@ function loadConfig() {
     });
 }
 
+// 判断是否可以用增量方式获取完整列表：缓存的列表已加载全部条目，且是服务器完整列表的顺序（名称升序、没有过滤）
+function canRequestListingDelta(cachedListing, listOptions) {
+    return Boolean(cachedListing && cachedListing.listing_version && !cachedListing.next_cursor &&
+                   listOptions.sort === 'name' && listOptions.order === 'asc' && !listOptions.ext);
+}
+
+// 合并文件列表响应：304时使用缓存的列表（包括已加载的所有页），增量响应时在缓存的列表上应用变化
+// 增量无法应用（缓存中缺少未变化的条目）时删除缓存并返回null
+function applyListingResponse(listingKey, cachedListing, response, xhr) {
+    if (xhr.status === 304 && cachedListing) {
+        log('debug', '文件列表未变化，使用缓存: ' + listingKey);
+        response = cachedListing;
+    } else if (response.delta && cachedListing) {
+        const entries = new Map(cachedListing.files.map(file => [file.path, file]));
+        for (const path of response.removed) {
+            entries.delete(path);
+        }
+        for (const file of response.changed) {
+            entries.set(file.path, file);
+        }
+        const files = response.order.map(path => entries.get(path));
+        if (files.some(file => file === undefined)) {
+            log('warn', '增量文件列表与缓存不一致，重新获取: ' + listingKey);
+            listingCache.delete(listingKey);
+            return null;
+        }
+        log('debug', '应用增量文件列表，变化 ' + response.changed.length + ' 个，删除 ' + response.removed.length + ' 个');
+        response = { files: files, current_path: response.current_path, version: response.version };
+    }
+    if (response.total === undefined) {
+        // 完整列表（不分页）：整理成已加载全部条目的分页结果
+        response = {
+            files: response.files,
+            offset: 0,
+            total: response.files.length,
+            next_cursor: null,
+            current_path: response.current_path,
+            version: response.version,
+            listing_version: response.version
+        };
+    }
+    
+    // 更新缓存，超过最大数量时删除最早加载的目录
+    listingCache.delete(listingKey);
+    listingCache.set(listingKey, response);
+    if (listingCache.size > MAX_LISTING_CACHE) {
+        listingCache.delete(listingCache.keys().next().value);
+    }
+    return response;
+}
+
 // 检查运行中的任务
 function checkRunningTasks(callback) {
     log('info', '检查运行中的任务');
@@ -2913,6 +3528,7 @@ function checkRunningTasks(callback) {
                 t.type === 'fix_extensions' || 
                 t.type === 'clean_empty_folders' ||
                 t.type === 'delete_files_by_format' ||
+                t.type === 'rescan_index' ||
                 t.type === 'search'
             );
             
@@ -2980,6 +3596,7 @@ function getTaskLoadingText(taskType) {
         'fix_extensions': '正在修复文件后缀...',
         'clean_empty_folders': '正在清理空文件夹...',
         'delete_files_by_format': '正在删除文件...',
+        'rescan_index': '正在刷新索引...',
         'search': '正在搜索文件...'
     };
     return taskTypeTexts[taskType] || '正在处理...';
@@ -3005,6 +3622,9 @@ function handleTaskResult(task) {
             showDeleteFilesResult(task, format);
             break;
         }
+        case 'rescan_index':
+            showRescanIndexResult(task);
+            break;
         case 'search':
             showSearchResult(task);
             break;
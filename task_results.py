@@ -0,0 +1,109 @@
+# 任务结果分块存储
+# 搜索原来把所有匹配项收集到一个列表，任务完成后一次性放进任务结果，结果在任务结束前不可见，
+# 范围很大的模式还会生成体积巨大的JSON。这里把结果按固定大小分块追加：
+# - 任务运行中即可按偏移量读取已有的结果，流式接口在有新结果时立即推送
+# - 可以限制结果数量，达到上限时停止追加并标记为已截断
+# - 任务完成后可以整体重新排序，排序会使正在读取的偏移量失效，读取方通过generation判断
+import threading
+
+# 每块的结果数
+DEFAULT_CHUNK_SIZE = 500
+
+
+class ResultChunks:
+    """
+    分块保存的任务结果，任务线程追加，请求线程读取，通过条件变量通知新结果
+    """
+
+    def __init__(self, limit=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.limit = limit if limit and limit > 0 else None
+        self.chunk_size = chunk_size
+        self._chunks = []
+        self.total = 0
+        self.truncated = False
+        self.closed = False
+        # 每次重新排序加1，读取方的偏移量只在同一generation内有效
+        self.generation = 0
+        self._cond = threading.Condition()
+
+    @property
+    def full(self):
+        """是否已达到结果数量上限"""
+        return self.limit is not None and self.total >= self.limit
+
+    def append(self, item):
+        """
+        追加一条结果
+
+        Returns:
+            bool: 已达到数量上限时返回False（结果被丢弃，调用方应停止产生结果）
+        """
+        with self._cond:
+            if self.full:
+                self.truncated = True
+                return False
+            if not self._chunks or len(self._chunks[-1]) >= self.chunk_size:
+                self._chunks.append([])
+            self._chunks[-1].append(item)
+            self.total += 1
+            self._cond.notify_all()
+            return True
+
+    def read(self, offset, limit=None):
+        """
+        读取从offset开始的结果
+
+        Args:
+            offset (int): 起始位置
+            limit (int, optional): 最多返回的条数，默认返回到末尾
+
+        Returns:
+            list: 结果列表
+        """
+        with self._cond:
+            end = self.total if limit is None else min(self.total, offset + limit)
+            items = []
+            position = offset
+            while position < end:
+                chunk = self._chunks[position // self.chunk_size]
+                start = position % self.chunk_size
+                part = chunk[start:start + end - position]
+                items.extend(part)
+                position += len(part)
+            return items
+
+    def wait(self, offset, timeout):
+        """等待直到有offset之后的结果、结果已关闭或超时"""
+        with self._cond:
+            if self.total <= offset and not self.closed:
+                self._cond.wait(timeout)
+
+    def reorder(self, sort):
+        """
+        重新排序所有结果，只在任务不再追加结果后调用
+
+        Args:
+            sort (callable): 接收结果列表，返回排序后的新列表
+        """
+        items = sort(self.read(0))
+        with self._cond:
+            self._chunks = [items[i:i + self.chunk_size] for i in range(0, len(items), self.chunk_size)]
+            self.total = len(items)
+            self.generation += 1
+            self._cond.notify_all()
+
+    def close(self):
+        """任务结束，不再追加结果"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def summary(self):
+        """结果概要，放在任务结果中代替完整列表"""
+        with self._cond:
+            return {
+                'total': self.total,
+                'truncated': self.truncated,
+                'chunks': len(self._chunks),
+                'limit': self.limit,
+            }
@@ -0,0 +1,504 @@
+# 预览缩略图磁盘缓存
+# 每次悬停预览大图时，/preview都要打开原图、全分辨率LANCZOS缩放到1920x1080再重新编码，下一次悬停又重复一遍。
+# 这里把缩放后的图片保存到cache/thumbnails：
+# - 预设几种尺寸（悬停、网格、弹窗），缓存键由路径、mtime、文件大小和尺寸组成，原图变化后自然不再命中
+# - 缓存总大小受字节预算限制，超出时按最近最少使用淘汰
+# - 多个请求同时需要同一张缩略图时只生成一次，其他请求等待结果
+# - 生成时按目标尺寸解码：JPEG用draft在解码时直接缩小到1/2、1/4或1/8，其他格式先用reduce按整数倍缩小，
+#   最后再用LANCZOS缩放到目标尺寸，避免为一张预览图解码和重采样整幅原图
+# - 悬停和网格尺寸优先使用EXIF中嵌入的缩略图（相机拍摄的JPEG和部分TIFF/HEIC都带有），只读取文件头，
+#   不解码原图；没有嵌入缩略图或其宽高比与原图不符时才解码原图
+# - 缩略图按EXIF的Orientation旋转，与浏览器直接显示原图时的方向一致
+# - 多页图片（TIFF、GIF）可以指定页码；金字塔TIFF直接读取不小于目标尺寸的最小缩小层级，不解码全分辨率页面；
+#   浏览器不能显示的格式（TIFF）即使不超过目标尺寸也转码为JPEG（带透明通道时为WebP）
+import os
+import io
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from PIL import Image, ExifTags
+
+logger = logging.getLogger(__name__)
+
+# 预设尺寸：名称 -> (最大宽度, 最大高度)
+VARIANTS = {
+    'hover': (600, 600),    # 悬停预览（300px预览框，按2倍像素密度）
+    'grid': (256, 256),     # 网格缩略图
+    'modal': (1920, 1080),  # 弹窗预览
+}
+
+DEFAULT_VARIANT = 'modal'
+
+# 优先使用EXIF嵌入缩略图的尺寸
+EMBEDDED_VARIANTS = ('hover', 'grid')
+
+# 嵌入缩略图与原图宽高比的最大相对误差，超过时（如带黑边的160x120缩略图）解码原图
+EMBEDDED_ASPECT_TOLERANCE = 0.05
+
+# 缓存格式版本，生成方式变化时修改，使旧的缩略图不再命中
+CACHE_VERSION = 3
+
+# EXIF Orientation -> 使图片方向正确的变换
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# 默认缓存字节预算
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# 缩略图的JPEG质量
+JPEG_QUALITY = 90
+
+# 快速缩小后至少保留目标尺寸的倍数，剩下的部分由LANCZOS完成，画质与直接LANCZOS缩放几乎相同；
+# 取1.5使6000x4000的照片在弹窗尺寸（1620x1080）下也能按1/2解码
+REDUCING_GAP = 1.5
+
+# reduce支持的模式，其他模式（如16位灰度）直接用LANCZOS缩放
+REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'CMYK', 'I', 'F')
+
+# 缩略图扩展名 -> MIME类型
+MIMETYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+
+# TIFF的NewSubfileType标签：第0位表示缩小层级（金字塔），第2位表示透明蒙版
+NEW_SUBFILE_TYPE = 254
+SUBFILE_REDUCED = 0x1
+SUBFILE_MASK = 0x4
+
+
+class PageOutOfRange(ValueError):
+    """请求的页码超出图片的页数"""
+
+
+def fit_size(size, box):
+    """按比例缩放到box以内的尺寸"""
+    ratio = min(box[0] / size[0], box[1] / size[1])
+    return max(1, int(size[0] * ratio)), max(1, int(size[1] * ratio))
+
+
+def tiff_pages(img):
+    """
+    列出TIFF的页面和每个页面的缩小层级（只读取IFD，不解码图像）
+
+    缩小层级是紧跟在页面之后、NewSubfileType第0位为1的帧；透明蒙版帧跳过
+
+    Args:
+        img (PIL.Image.Image): Image.open返回的TIFF图片
+
+    Returns:
+        list: [(页面帧号, [缩小层级帧号, ...]), ...]
+    """
+    current = img.tell()
+    pages = []
+    try:
+        for index in range(getattr(img, 'n_frames', 1)):
+            img.seek(index)
+            subfile = img.tag_v2.get(NEW_SUBFILE_TYPE, 0)
+            if subfile & SUBFILE_MASK:
+                continue
+            if subfile & SUBFILE_REDUCED and pages:
+                pages[-1][1].append(index)
+            else:
+                pages.append((index, []))
+    finally:
+        img.seek(current)
+    return pages
+
+
+def page_count(img):
+    """图片的页数：TIFF不包括缩小层级和蒙版，其他格式为帧数"""
+    if img.format == 'TIFF':
+        return len(tiff_pages(img))
+    return getattr(img, 'n_frames', 1)
+
+
+def seek_page(img, page, box):
+    """
+    定位到指定页面；TIFF有缩小层级时定位到不小于目标尺寸的最小层级
+
+    Args:
+        img (PIL.Image.Image): Image.open返回的图片
+        page (int): 页码（从0开始）
+        box (tuple): (最大宽度, 最大高度)
+
+    Returns:
+        tuple: 页面（全分辨率）的(宽度, 高度)
+
+    Raises:
+        PageOutOfRange: 页码超出页数
+    """
+    if img.format != 'TIFF':
+        if page >= getattr(img, 'n_frames', 1):
+            raise PageOutOfRange(f"页码 {page} 超出范围")
+        if page:
+            img.seek(page)
+        return img.size
+    pages = tiff_pages(img)
+    if page >= len(pages):
+        raise PageOutOfRange(f"页码 {page} 超出范围，共 {len(pages)} 页")
+    frame, levels = pages[page]
+    img.seek(frame)
+    full_size = img.size
+    target = fit_size(full_size, box)
+    best = frame, full_size[0] * full_size[1]
+    for level in levels:
+        img.seek(level)
+        width, height = img.size
+        if width >= target[0] and height >= target[1] and width * height < best[1]:
+            best = level, width * height
+    if img.tell() != best[0]:
+        img.seek(best[0])
+    if best[0] != frame:
+        logger.debug(f"使用TIFF缩小层级: 帧 {best[0]}, {img.size[0]}x{img.size[1]}（页面 {full_size[0]}x{full_size[1]}）")
+    return full_size
+
+
+def downscale(img, box):
+    """
+    把刚打开（尚未解码）的图片缩放到box以内
+
+    - JPEG用draft按1/2、1/4、1/8解码，解码后的尺寸不小于目标尺寸的REDUCING_GAP倍
+    - 之后仍然比目标大REDUCING_GAP倍以上时用reduce按整数倍缩小（对像素块求平均，比LANCZOS快得多）
+    - 最后用LANCZOS缩放到目标尺寸
+
+    Args:
+        img (PIL.Image.Image): Image.open返回的图片
+        box (tuple): (最大宽度, 最大高度)
+
+    Returns:
+        PIL.Image.Image: 缩放后的图片
+    """
+    size = fit_size(img.size, box)
+    if size[0] >= img.size[0] and size[1] >= img.size[1]:
+        # 已经不超过目标尺寸（如TIFF的缩小层级），不放大
+        size = img.size
+    img.draft(None, (int(size[0] * REDUCING_GAP), int(size[1] * REDUCING_GAP)))
+    if img.mode in ('P', '1'):
+        # 调色板和二值图像不能按块平均，resize也只能用最近邻，先转换为连续色调
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB' if img.mode == 'P' else 'L')
+    elif img.mode.startswith('I;16'):
+        # 16位灰度（扫描的TIFF常见）：转换为32位整数后可以reduce，缩放后再映射到8位
+        img = img.convert('I')
+    # draft之后img.size为按比例解码后的尺寸
+    factor = int(min(img.size[0] / (size[0] * REDUCING_GAP), img.size[1] / (size[1] * REDUCING_GAP)))
+    if factor > 1 and img.mode in REDUCIBLE_MODES:
+        img = img.reduce(factor)
+    # 不需要缩放时复制一份，调用方关闭原图后仍然可以编码
+    img = img.resize(size, Image.LANCZOS) if img.size != size else img.copy()
+    if img.mode == 'I':
+        img = img.point(lambda value: value * (1 / 256)).convert('L')
+    return img
+
+
+def orient(img, orientation):
+    """按EXIF Orientation旋转或翻转图片"""
+    method = ORIENTATION_TRANSPOSE.get(orientation)
+    return img.transpose(method) if method is not None else img
+
+
+def embedded_thumbnail(img, exif):
+    """
+    读取EXIF IFD1中嵌入的JPEG缩略图（只读取文件头中的数据，不解码原图）
+
+    Args:
+        img (PIL.Image.Image): Image.open返回的原图
+        exif (PIL.Image.Exif): img.getexif()的结果
+
+    Returns:
+        tuple|None: (JPEG字节, 缩略图)；没有嵌入缩略图、无法解码或宽高比与原图不符时返回None
+    """
+    try:
+        ifd1 = exif.get_ifd(ExifTags.IFD.IFD1)
+        offset = ifd1.get(ExifTags.Base.JpegIFOffset)
+        length = ifd1.get(ExifTags.Base.JpegIFByteCount)
+        if not offset or not length:
+            return None
+        # IFD中的偏移量相对于EXIF的TIFF头，exif.fp即从TIFF头开始的数据
+        exif.fp.seek(offset)
+        data = exif.fp.read(length)
+        thumb = Image.open(io.BytesIO(data))
+        thumb.load()
+    except Exception as e:
+        logger.debug(f"读取嵌入缩略图失败: {e}")
+        return None
+    # 嵌入缩略图与原图同方向存储，比较未旋转的宽高比
+    expected = img.size[0] / img.size[1]
+    actual = thumb.size[0] / thumb.size[1]
+    if abs(actual - expected) > expected * EMBEDDED_ASPECT_TOLERANCE:
+        return None
+    return data, thumb
+
+
+def encode(img, fmt):
+    """
+    编码缩略图
+
+    Args:
+        img (PIL.Image.Image): 缩放后的图片
+        fmt (str): 原图格式，PNG/GIF编码为PNG，其他格式带透明通道时编码为WebP，否则编码为JPEG
+
+    Returns:
+        tuple: (编码后的字节, 扩展名)
+    """
+    buffer = io.BytesIO()
+    alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+    if fmt in ('PNG', 'GIF'):
+        # 保留原来的无损格式
+        if img.mode not in ('RGBA', 'LA', 'RGB', 'L', 'P'):
+            img = img.convert('RGBA' if alpha else 'RGB')
+        img.save(buffer, format='PNG')
+        return buffer.getvalue(), 'png'
+    if alpha:
+        # 保留透明通道，比PNG小得多
+        img.convert('RGBA').save(buffer, format='WEBP', quality=JPEG_QUALITY)
+        return buffer.getvalue(), 'webp'
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img.save(buffer, format='JPEG', quality=JPEG_QUALITY)
+    return buffer.getvalue(), 'jpg'
+
+
+def render_thumbnail(path, box, use_embedded=False, page=0, transcode=False):
+    """
+    把图片缩放到box以内并编码
+
+    Args:
+        path (str): 图片路径
+        box (tuple): (最大宽度, 最大高度)
+        use_embedded (bool): 是否优先使用EXIF中嵌入的缩略图（只用于第一页）
+        page (int): 页码（从0开始）
+        transcode (bool): 图片不超过box时也重新编码（浏览器不能直接显示的格式）
+
+    Returns:
+        tuple|None: (编码后的字节, 扩展名, 是否来自嵌入缩略图)；图片本身不超过box且不需要转码时返回None
+                    （直接使用原图，由浏览器按EXIF方向显示）
+
+    Raises:
+        PageOutOfRange: 页码超出页数
+    """
+    with Image.open(path) as img:
+        try:
+            exif = img.getexif()
+            orientation = exif.get(ExifTags.Base.Orientation, 1)
+        except Exception:
+            exif = None
+            orientation = 1
+        rotate = orientation in ORIENTATION_TRANSPOSE
+        width, height = seek_page(img, page, box) if page or img.format == 'TIFF' else img.size
+        if width <= box[0] and height <= box[1] and not transcode:
+            return None
+
+        use_embedded = use_embedded and page == 0 and exif is not None
+        embedded = embedded_thumbnail(img, exif) if use_embedded else None
+        if embedded is not None:
+            data, thumb = embedded
+            if not rotate and thumb.size[0] <= box[0] and thumb.size[1] <= box[1]:
+                # 方向正确、尺寸合适时原样使用嵌入的JPEG，不重新编码
+                return data, 'jpg', True
+            if thumb.size[0] > box[0] or thumb.size[1] > box[1]:
+                thumb = thumb.resize(fit_size(thumb.size, box), Image.LANCZOS)
+            return encode(orient(thumb, orientation), 'JPEG') + (True,)
+
+        fmt = (img.format or '').upper()
+        resized = downscale(img, box)
+    return encode(orient(resized, orientation), fmt) + (False,)
+
+
+class ThumbnailCache:
+    """
+    缩略图磁盘缓存，多个线程共享，通过锁串行访问索引
+
+    文件名为缓存键的摘要加扩展名，启动时扫描缓存目录恢复索引（按文件mtime排列最近使用顺序）
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # 文件名 -> 字节数，按最近使用排列
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # 文件名 -> 正在生成该缩略图的事件
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.generated = 0
+        self.passthrough = 0
+        # 直接使用EXIF嵌入缩略图生成的数量
+        self.embedded = 0
+        self.evictions = 0
+        self.errors = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """扫描缓存目录恢复索引，删除上次中断留下的临时文件"""
+        found = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith('.tmp'):
+                        os.remove(entry.path)
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                found.append((st.st_mtime, entry.name, st.st_size))
+        found.sort()
+        with self._lock:
+            for _, name, size in found:
+                self._entries[name] = size
+                self._bytes += size
+            self._evict()
+
+    @staticmethod
+    def cache_key(path, st, variant):
+        """缓存键的摘要：路径 + mtime + 文件大小 + 尺寸名称 + 缓存格式版本"""
+        raw = f"{os.path.normpath(path)}|{st.st_mtime_ns}|{st.st_size}|{variant}|{CACHE_VERSION}"
+        return hashlib.blake2b(raw.encode('utf-8', 'surrogateescape'), digest_size=16).hexdigest()
+
+    def _evict(self):
+        """淘汰最近最少使用的缩略图直到总大小不超过预算，调用时需持有锁"""
+        while self._bytes > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def _lookup(self, digest):
+        """查找已缓存的缩略图，返回(文件路径, MIME类型)，调用时需持有锁"""
+        for ext, mimetype in MIMETYPES.items():
+            name = f"{digest}.{ext}"
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                return os.path.join(self.cache_dir, name), mimetype
+        return None
+
+    def get(self, path, variant=DEFAULT_VARIANT, page=0, transcode=False):
+        """
+        返回图片在指定尺寸下的缩略图
+
+        Args:
+            path (str): 原图路径
+            variant (str): VARIANTS中的尺寸名称
+            page (int): 页码（多页TIFF/GIF，从0开始）
+            transcode (bool): 原图不超过该尺寸时也转码（浏览器不能直接显示的格式）
+
+        Returns:
+            tuple|None: (缩略图文件路径, MIME类型)；原图不超过该尺寸且不需要转码时返回None，调用方直接返回原图
+
+        Raises:
+            OSError: 原图不存在或无法读取
+            PageOutOfRange: 页码超出页数
+            Exception: 解码或编码失败
+        """
+        st = os.stat(path)
+        key = variant
+        if page:
+            key += f"#p{page}"
+        if transcode:
+            key += "#t"
+        digest = self.cache_key(path, st, key)
+        while True:
+            with self._lock:
+                found = self._lookup(digest)
+                if found is not None:
+                    self.hits += 1
+                    return found
+                event = self._inflight.get(digest)
+                if event is None:
+                    # 由当前请求生成，其他请求等待
+                    event = self._inflight[digest] = threading.Event()
+                    self.misses += 1
+                    break
+                self.coalesced += 1
+            event.wait()
+            with self._lock:
+                found = self._lookup(digest)
+                if found is not None:
+                    return found
+                if digest in self._inflight:
+                    continue
+            # 生成方发现不需要缩略图或生成失败，由当前请求自己处理
+            return self._generate(path, variant, digest, page, transcode)
+
+        try:
+            return self._generate(path, variant, digest, page, transcode)
+        finally:
+            with self._lock:
+                self._inflight.pop(digest, None)
+            event.set()
+
+    def _generate(self, path, variant, digest, page=0, transcode=False):
+        """生成并保存缩略图"""
+        box = VARIANTS[variant]
+        start = time.monotonic()
+        try:
+            rendered = render_thumbnail(path, box, variant in EMBEDDED_VARIANTS, page, transcode)
+        except PageOutOfRange:
+            raise
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        if rendered is None:
+            with self._lock:
+                self.passthrough += 1
+            return None
+        data, ext, embedded = rendered
+        name = f"{digest}.{ext}"
+        target = os.path.join(self.cache_dir, name)
+        temp = f"{target}.{threading.get_ident()}.tmp"
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, target)
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = len(data)
+                self._bytes += len(data)
+            self._entries.move_to_end(name)
+            self.generated += 1
+            if embedded:
+                self.embedded += 1
+            self._evict()
+        logger.debug(f"已生成缩略图: {path}, {variant}{f', 第 {page + 1} 页' if page else ''}{'（嵌入缩略图）' if embedded else ''}, {len(data)} 字节, 耗时 {time.monotonic() - start:.3f} 秒")
+        return target, MIMETYPES[ext]
+
+    def clear(self):
+        """删除所有缓存的缩略图"""
+        with self._lock:
+            for name in list(self._entries):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'generated': self.generated,
+                'passthrough': self.passthrough,
+                'embedded': self.embedded,
+                'evictions': self.evictions,
+                'errors': self.errors,
+            }
@@ -0,0 +1,185 @@
+# 缩略图后台预取
+# 打开文件夹后，浏览器要等到鼠标悬停在某个文件上才请求/preview，每次都是一次冷解码。
+# 这里在返回文件列表时把列表中的图片放入预取队列，由后台线程提前生成悬停预览尺寸的缩略图：
+# - 队列有长度上限，按列表顺序排列；前端把当前可见的文件发给服务器，这些文件移到队首
+# - 打开另一个文件夹时清空队列（只预取当前文件夹），已经开始生成的缩略图仍会完成并缓存
+# - 预取线程以最低的线程优先级运行；压缩/转换等批处理任务占用调度器名额时只保留一个预取线程，
+#   让出CPU给批处理任务，同时保证用户悬停前大多数缩略图已经生成
+import os
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# 默认预取线程数
+DEFAULT_WORKERS = 2
+
+# 默认队列长度上限
+DEFAULT_MAX_QUEUE = 500
+
+# 预取线程的nice值（仅Linux，按线程设置）
+PREFETCH_NICE = 19
+
+# 批处理任务运行时，多余的预取线程检查调度器状态的间隔（秒）
+BUSY_POLL_INTERVAL = 0.5
+
+# 可以生成缩略图的格式（Pillow能直接解码的格式；TIFF、AVIF、PDF使用各自的预览方式）
+PREFETCH_FORMATS = ('jpg', 'jpeg', 'png', 'webp', 'bmp', 'gif')
+
+
+def is_prefetchable(path):
+    """判断文件是否可以预取缩略图"""
+    return os.path.splitext(path)[1].lower()[1:] in PREFETCH_FORMATS
+
+
+class ThumbnailPrefetcher:
+    """
+    缩略图预取队列，多个线程共享，通过条件变量串行访问
+
+    队列只属于一个文件夹（最近一次打开的文件夹），切换文件夹时旧的队列被丢弃
+    """
+
+    def __init__(self, cache, variant, scheduler=None, workers=DEFAULT_WORKERS, max_queue=DEFAULT_MAX_QUEUE):
+        self.cache = cache
+        self.variant = variant
+        self.scheduler = scheduler
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue = deque()
+        self._queued = set()
+        self._cond = threading.Condition()
+        self._threads = []
+        # 当前预取的文件夹
+        self.directory = None
+        self.enqueued = 0
+        self.prefetched = 0
+        self.cancelled = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def _ensure_started(self):
+        """第一次入队时启动预取线程，调用时需持有锁"""
+        if self._threads or self.workers <= 0:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(index,), name=f'thumbnail-prefetch-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _switch(self, directory):
+        """切换到另一个文件夹，丢弃旧的队列，调用时需持有锁"""
+        if directory == self.directory:
+            return
+        self.cancelled += len(self._queue)
+        self._queue.clear()
+        self._queued.clear()
+        self.directory = directory
+
+    def enqueue(self, directory, paths, replace=False):
+        """
+        把文件夹中的图片加入预取队列末尾
+
+        Args:
+            directory (str): 文件夹路径，与当前预取的文件夹不同时先清空队列
+            paths (list): 文件路径，按列表顺序
+            replace (bool): 是否清空队列后重新入队（重新打开同一文件夹时使用）
+        """
+        if self.workers <= 0:
+            return
+        directory = os.path.normpath(directory)
+        with self._cond:
+            if replace:
+                # 重新打开时从第一页开始，旧的顺序（如上次滚动到的位置）不再有意义
+                self._switch(None)
+            self._switch(directory)
+            added = 0
+            for path in paths:
+                if path in self._queued or not is_prefetchable(path):
+                    continue
+                if len(self._queue) >= self.max_queue:
+                    self.dropped += 1
+                    continue
+                self._queue.append(path)
+                self._queued.add(path)
+                added += 1
+            self.enqueued += added
+            if added:
+                self._ensure_started()
+                self._cond.notify_all()
+
+    def prioritize(self, directory, paths):
+        """
+        把当前可见的文件移到队首（已在队列中的移动位置，不在队列中的插入，超出上限时丢弃队尾）
+
+        Args:
+            directory (str): 文件夹路径，不是当前预取的文件夹时忽略
+            paths (list): 可见的文件路径，按显示顺序
+        """
+        if self.workers <= 0:
+            return
+        directory = os.path.normpath(directory)
+        with self._cond:
+            if directory != self.directory:
+                return
+            visible = [path for path in dict.fromkeys(paths)
+                       if os.path.dirname(os.path.normpath(path)) == directory and is_prefetchable(path)]
+            if not visible:
+                return
+            moved = set(visible)
+            rest = [path for path in self._queue if path not in moved]
+            self.enqueued += len(moved - self._queued)
+            self._queue = deque(visible + rest)
+            while len(self._queue) > self.max_queue:
+                self._queued.discard(self._queue.pop())
+                self.dropped += 1
+            self._queued = set(self._queue)
+            self._ensure_started()
+            self._cond.notify_all()
+
+    def cancel(self):
+        """清空队列"""
+        with self._cond:
+            self._switch(None)
+
+    def _should_yield(self, index):
+        """批处理任务运行时只保留第一个预取线程"""
+        return index > 0 and self.scheduler is not None and self.scheduler.busy
+
+    def _run(self, index):
+        """预取线程主循环"""
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PREFETCH_NICE)
+        except (AttributeError, OSError) as e:
+            logger.debug(f"无法降低预取线程优先级: {e}")
+        while True:
+            with self._cond:
+                while not self._queue or self._should_yield(index):
+                    self._cond.wait(BUSY_POLL_INTERVAL if self._queue else None)
+                path = self._queue.popleft()
+                self._queued.discard(path)
+            try:
+                self.cache.get(path, self.variant)
+            except Exception as e:
+                with self._cond:
+                    self.errors += 1
+                logger.debug(f"预取缩略图失败: {path}, 错误: {e}")
+                continue
+            with self._cond:
+                self.prefetched += 1
+
+    def stats(self):
+        """返回预取统计信息"""
+        with self._cond:
+            return {
+                'directory': self.directory,
+                'variant': self.variant,
+                'workers': self.workers,
+                'queued': len(self._queue),
+                'max_queue': self.max_queue,
+                'enqueued': self.enqueued,
+                'prefetched': self.prefetched,
+                'cancelled': self.cancelled,
+                'dropped': self.dropped,
+                'errors': self.errors,
+            }
@@ -0,0 +1,367 @@
+# 外部工具链能力注册表
+# 启动时解析一次 ImageMagick / jpegoptim / pngquant / cwebp / poppler / Ghostscript 的路径、版本和能力，
+# 结果缓存到磁盘，以各可执行文件的 mtime 作为缓存键，避免每次处理图片都 fork 一次 `--version`
+import os
+import json
+import shutil
+import platform
+import subprocess
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 缓存文件格式版本，结构变化时递增，使旧缓存失效
+CACHE_VERSION = 1
+
+# 需要探测的可执行文件及其版本参数
+TOOL_VERSION_ARGS = {
+    'magick': ['-version'],
+    'convert': ['-version'],
+    'identify': ['-version'],
+    'mogrify': ['-version'],
+    'jpegoptim': ['--version'],
+    'pngquant': ['--version'],
+    'cwebp': ['-version'],
+    'pdftoppm': ['-v'],
+    'pdfinfo': ['-v'],
+    'gs': ['--version'],
+}
+
+# Windows上的convert.exe是系统磁盘转换工具，不是ImageMagick，只使用magick
+WINDOWS_SKIPPED_TOOLS = {'convert', 'identify', 'mogrify'}
+
+# 应用内格式名 -> ImageMagick格式名
+IMAGEMAGICK_FORMAT_NAMES = {
+    'jpg': 'JPEG',
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+    'webp': 'WEBP',
+    'avif': 'AVIF',
+    'heic': 'HEIC',
+    'bmp': 'BMP',
+    'gif': 'GIF',
+    'tiff': 'TIFF',
+    'tif': 'TIFF',
+    'pdf': 'PDF',
+}
+
+# 专用压缩工具 -> 可处理的格式
+SPECIAL_TOOL_FORMATS = {
+    'jpegoptim': ['jpg', 'jpeg'],
+    'pngquant': ['png'],
+    'cwebp': ['webp'],
+}
+
+
+def _parse_version(tool, output):
+    """
+    从版本命令的输出中提取版本号
+
+    Args:
+        tool (str): 工具名
+        output (str): 版本命令的标准输出和标准错误
+
+    Returns:
+        str: 版本号，无法解析时返回输出的第一行
+    """
+    text = output.strip()
+    if not text:
+        return ''
+    first_line = text.splitlines()[0]
+    parts = first_line.split()
+    try:
+        if tool in ('magick', 'convert', 'identify', 'mogrify'):
+            # Version: ImageMagick 6.9.11-60 Q16 x86_64 ...
+            return parts[2]
+        if tool == 'jpegoptim':
+            # jpegoptim v1.4.7  x86_64-pc-linux-gnu
+            return parts[1]
+        if tool in ('pdftoppm', 'pdfinfo'):
+            # pdftoppm version 22.02.0
+            return parts[2]
+        return parts[0]
+    except IndexError:
+        return first_line
+
+
+def _parse_delegates(output):
+    """
+    解析ImageMagick版本输出中的 Delegates (built-in) 行
+
+    Returns:
+        list: 编译进ImageMagick的委托库列表
+    """
+    for line in output.splitlines():
+        if line.startswith('Delegates'):
+            return line.split(':', 1)[1].split()
+    return []
+
+
+def _parse_format_list(output):
+    """
+    解析 `-list format` 的输出，得到每种格式的读写能力
+
+    输出格式示例：
+          AVIF  HEIC      rw+   AV1 Image File Format (1.12.0)
+          JPEG* JPEG      rw-   Joint Photographic Experts Group JFIF format
+
+    Returns:
+        dict: {格式名: 模式字符串}，如 {'JPEG': 'rw-'}
+    """
+    formats = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+        name = parts[0].rstrip('*')
+        mode = parts[2]
+        # 模式列由 r/w/+/- 组成
+        if not name.isalnum() or len(mode) != 3 or not set(mode) <= set('rw+-'):
+            continue
+        formats[name.upper()] = mode
+    return formats
+
+
+class ToolchainRegistry:
+    """
+    外部工具链能力注册表
+
+    - 解析每个工具的绝对路径和版本
+    - 记录ImageMagick编译进的委托库（HEIC、AVIF、WebP、PDF/Ghostscript）
+    - 记录每种格式可用的编码器
+    - 结果缓存在磁盘上，以可执行文件的路径和mtime作为缓存键
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def _fingerprint(self):
+        """
+        计算当前工具链的指纹：每个工具的路径和mtime，只做PATH查找和stat，不执行任何进程
+        """
+        fingerprint = {}
+        for tool in TOOL_VERSION_ARGS:
+            if platform.system() == 'Windows' and tool in WINDOWS_SKIPPED_TOOLS:
+                continue
+            path = shutil.which(tool)
+            if not path:
+                fingerprint[tool] = None
+                continue
+            try:
+                fingerprint[tool] = [path, os.stat(path).st_mtime_ns]
+            except OSError:
+                fingerprint[tool] = None
+        return fingerprint
+
+    def _load_cache(self, fingerprint):
+        """读取磁盘缓存，指纹一致时返回缓存数据，否则返回None"""
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get('cache_version') != CACHE_VERSION:
+            return None
+        if cached.get('platform') != platform.system():
+            return None
+        if cached.get('fingerprint') != fingerprint:
+            return None
+        return cached
+
+    def _save_cache(self, data):
+        """保存探测结果到磁盘缓存，写临时文件后原子替换"""
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = f"{self.cache_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"保存工具链缓存失败: {e}")
+
+    def _run(self, cmd, timeout=10):
+        """执行探测命令，返回合并后的输出，失败返回None"""
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+            return (result.stdout or '') + (result.stderr or '')
+        except Exception as e:
+            logger.debug(f"探测命令执行失败: {cmd}, 错误: {e}")
+            return None
+
+    def _probe(self, fingerprint):
+        """
+        实际探测工具链，每个工具只执行一次版本命令
+        """
+        binaries = {}
+        # 版本命令的输出，ImageMagick的委托库也从中解析，不再重复执行
+        outputs = {}
+        for tool, args in TOOL_VERSION_ARGS.items():
+            entry = fingerprint.get(tool)
+            if not entry:
+                binaries[tool] = None
+                continue
+            path = entry[0]
+            output = self._run([path] + args)
+            if output is None:
+                binaries[tool] = None
+                continue
+            outputs[tool] = output
+            binaries[tool] = {
+                'path': path,
+                'version': _parse_version(tool, output),
+                'mtime': entry[1],
+            }
+
+        # ImageMagick 7+ 使用magick，ImageMagick 6 使用convert/identify/mogrify
+        imagemagick = {
+            'command': None,
+            'version': None,
+            'delegates': [],
+            'formats': {},
+        }
+        im_command = 'magick' if binaries.get('magick') else 'convert'
+        im_binary = binaries.get(im_command)
+        if im_binary:
+            imagemagick['command'] = im_command
+            imagemagick['version'] = im_binary['version']
+            imagemagick['delegates'] = _parse_delegates(outputs[im_command])
+            format_output = self._run([im_binary['path'], '-list', 'format'], timeout=30) or ''
+            imagemagick['formats'] = _parse_format_list(format_output)
+
+        delegates = self._resolve_delegates(imagemagick, binaries)
+        encoders = self._resolve_encoders(imagemagick, binaries)
+
+        return {
+            'cache_version': CACHE_VERSION,
+            'platform': platform.system(),
+            'fingerprint': fingerprint,
+            'binaries': binaries,
+            'imagemagick': imagemagick,
+            'delegates': delegates,
+            'encoders': encoders,
+        }
+
+    def _resolve_delegates(self, imagemagick, binaries):
+        """根据委托库列表和格式列表判断HEIC/AVIF/WebP/PDF支持情况"""
+        delegate_names = set(imagemagick['delegates'])
+        formats = imagemagick['formats']
+
+        def supports(fmt, delegate):
+            if fmt in formats:
+                return 'r' in formats[fmt]
+            return delegate in delegate_names
+
+        return {
+            'heic': supports('HEIC', 'heic'),
+            'avif': supports('AVIF', 'heic'),
+            'webp': supports('WEBP', 'webp'),
+            # ImageMagick读取PDF依赖Ghostscript，pdf2image依赖poppler
+            'pdf': bool(binaries.get('gs')) and supports('PDF', 'gs'),
+            'ghostscript': bool(binaries.get('gs')),
+            'poppler': bool(binaries.get('pdftoppm')),
+        }
+
+    def _resolve_encoders(self, imagemagick, binaries):
+        """
+        计算每种格式可用的编码器，按优先级排列
+
+        Returns:
+            dict: {格式: [编码器名, ...]}，编码器名为专用工具名或'imagemagick'
+        """
+        encoders = {}
+        formats = imagemagick['formats']
+        for fmt, im_name in IMAGEMAGICK_FORMAT_NAMES.items():
+            fmt_encoders = []
+            for tool, tool_formats in SPECIAL_TOOL_FORMATS.items():
+                if fmt in tool_formats and binaries.get(tool):
+                    fmt_encoders.append(tool)
+            if imagemagick['command']:
+                # 没有格式列表时（探测失败）假定ImageMagick可写
+                if not formats or 'w' in formats.get(im_name, ''):
+                    fmt_encoders.append('imagemagick')
+            encoders[fmt] = fmt_encoders
+        return encoders
+
+    def load(self, force=False):
+        """
+        加载工具链信息：指纹一致时直接使用磁盘缓存，否则重新探测
+
+        Args:
+            force (bool): 是否忽略缓存强制重新探测
+
+        Returns:
+            dict: 工具链信息
+        """
+        with self._lock:
+            fingerprint = self._fingerprint()
+            cached = None if force else self._load_cache(fingerprint)
+            if cached is not None:
+                logger.info("使用缓存的工具链信息")
+                self.data = cached
+            else:
+                logger.info("探测工具链信息")
+                self.data = self._probe(fingerprint)
+                self._save_cache(self.data)
+            return self.data
+
+    def binary(self, tool):
+        """返回工具的绝对路径，不可用时返回None"""
+        info = self.data.get('binaries', {}).get(tool)
+        return info['path'] if info else None
+
+    def available(self, tool):
+        """判断工具是否可用"""
+        return self.binary(tool) is not None
+
+    def version(self, tool):
+        """返回工具版本号，不可用时返回None"""
+        info = self.data.get('binaries', {}).get(tool)
+        return info['version'] if info else None
+
+    @property
+    def imagemagick_available(self):
+        return bool(self.data.get('imagemagick', {}).get('command'))
+
+    def imagemagick_command(self, tool='convert'):
+        """
+        返回调用ImageMagick子命令的命令前缀
+
+        Args:
+            tool (str): 子命令，convert、identify或mogrify
+
+        Returns:
+            list|None: 命令前缀，如 ['/usr/bin/magick', 'identify'] 或 ['/usr/bin/identify']，
+                       ImageMagick不可用或ImageMagick 6缺少该子命令时返回None
+        """
+        command = self.data.get('imagemagick', {}).get('command')
+        if not command:
+            return None
+        if command == 'magick':
+            magick_path = self.binary('magick')
+            if not magick_path:
+                return None
+            return [magick_path] if tool == 'convert' else [magick_path, tool]
+        # ImageMagick 6 每个子命令都是独立的可执行文件
+        path = self.binary(tool)
+        return [path] if path else None
+
+    def encoders_for(self, fmt):
+        """返回格式可用的编码器列表"""
+        return self.data.get('encoders', {}).get(fmt.lower(), [])
+
+    def can_write(self, fmt):
+        """判断ImageMagick是否能写入指定格式"""
+        return 'imagemagick' in self.encoders_for(fmt)
+
+    def to_dict(self):
+        """返回可序列化的工具链信息，供 /get_config 使用"""
+        return {
+            'platform': self.data.get('platform'),
+            'binaries': self.data.get('binaries', {}),
+            'imagemagick': self.data.get('imagemagick', {}),
+            'delegates': self.data.get('delegates', {}),
+            'encoders': self.data.get('encoders', {}),
+        }